@@ -1,5 +1,5 @@
 import os
-from ssm.trainers.n2_trainer import train_all_n2
+from ssm.trainers.n2_trainer import train_all_n2_concurrent
 
 def main():
     
@@ -13,8 +13,8 @@ def main():
         }
     
     N2_PATH = os.environ.get("N2_CONFIG_PATH")
-    train_all_n2(config_path=N2_PATH, ssm=False, override_config=override_dict)
-    train_all_n2(config_path=N2_PATH, ssm=True, override_config=override_dict)
+    dataset = train_all_n2_concurrent(config_path=N2_PATH, ssm=False, override_config=override_dict)
+    train_all_n2_concurrent(config_path=N2_PATH, ssm=True, override_config=override_dict, dataset=dataset)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+from ssm.trainers.distributed_trainer import train_n2_distributed
+
+# Single host:  python train_n2_40_patients_distributed.py
+# Several hosts: torchrun --nnodes=<hosts> --nproc_per_node=<procs> --rdzv_backend=c10d \
+#                --rdzv_endpoint=<host>:29500 train_n2_40_patients_distributed.py
+
+def main():
+
+    patient_count = 40
+    world_size = int(os.environ.get("N2_WORLD_SIZE", 4))
+
+    override_dict = {
+        "training" : {
+            "ablation": f"patient_count/{patient_count}_patients",
+            "n_patients" : patient_count
+            }
+        }
+
+    N2_PATH = os.environ.get("N2_CONFIG_PATH")
+    for ssm in [False, True]:
+        for schema in ["n2n", "n2v", "n2s"]:
+            train_n2_distributed(config_path=N2_PATH, schema=schema, ssm=ssm, override_config=override_dict, world_size=world_size)
+
+if __name__ == "__main__":
+    main()
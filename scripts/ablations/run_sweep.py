@@ -0,0 +1,36 @@
+import os
+import argparse
+from ssm.trainers.sweep import run_sweep
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run the N2 patient-count ablation as a parallel sweep")
+    parser.add_argument("--patients", type=int, nargs="+", default=[2, 10, 40])
+    parser.add_argument("--methods", nargs="+", default=["n2n", "n2v", "n2s"])
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to what the cpu/memory budget allows")
+    parser.add_argument("--threads-per-run", type=int, default=2)
+    parser.add_argument("--memory-per-run-gb", type=float, default=4)
+    parser.add_argument("--results", default="results/patient_count_sweep.csv")
+    parser.add_argument("--retrain", action="store_true", help="Retrain runs that already have a best checkpoint")
+    args = parser.parse_args()
+
+    grid = {
+        "method": args.methods,
+        "ssm": [False, True],
+        "training.n_patients": args.patients,
+    }
+
+    base_override = {
+        "training": {
+            "ablation": "patient_count/{n}_patients",
+        }
+    }
+
+    N2_PATH = os.environ.get("N2_CONFIG_PATH")
+    results = run_sweep(N2_PATH, grid, base_override=base_override, max_workers=args.workers,
+                        threads_per_run=args.threads_per_run, memory_per_run_gb=args.memory_per_run_gb,
+                        skip_completed=not args.retrain, results_path=args.results)
+    print(results.to_string())
+
+if __name__ == "__main__":
+    main()
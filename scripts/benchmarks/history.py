@@ -0,0 +1,250 @@
+"""
+Benchmark history and regression check for run_benchmarks.py results.
+
+Every run is appended to a JSON-lines history keyed by git commit (plus
+whether the work tree had uncommitted changes) and machine fingerprint. A
+new run is compared with a baseline of the same machine and benchmarks that
+slowed down by more than the threshold are flagged. The baseline is a given
+commit, or for a run with uncommitted changes the clean run of its own
+commit, otherwise the latest run of another commit (or of the same commit
+when nothing else is recorded):
+
+    python scripts/benchmarks/run_benchmarks.py --output bench.json
+    python scripts/benchmarks/history.py compare bench.json --record
+    python scripts/benchmarks/history.py list
+
+Each benchmark is reduced to one headline figure: images/s for the data
+loading and preprocessing steps, steps/s for the training epochs and
+latency for everything else, such as model inference.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+DEFAULT_HISTORY_PATH = os.path.join('results', 'benchmark_history.jsonl')
+
+# benchmark name: (metric, parameter holding the items processed per call)
+THROUGHPUT = {
+    'load_patient_data': ('images_per_s', 'n_bscans'),
+    'standard_preprocessing': ('images_per_s', 'n_bscans'),
+    'octa_preprocessing': ('images_per_s', 'n_bscans'),
+    'remove_speckle_noise': ('images_per_s', 'n_images'),
+    'train_epoch': ('steps_per_s', 'n_batches'),
+}
+
+# machine fields that identify the hardware, versions are kept per entry
+FINGERPRINT_FIELDS = ('hostname', 'processor', 'cpu_count', 'torch_threads')
+
+def machine_fingerprint(machine):
+    key = json.dumps({field: machine.get(field) for field in FINGERPRINT_FIELDS}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+def benchmark_key(result):
+    """Stable id of one benchmark, its name and parameters, e.g. ``model_forward[batch_size=1,model=UNet,...]``."""
+    params = ','.join(f"{k}={v}" for k, v in sorted(result.get('params', {}).items()))
+    return f"{result['name']}[{params}]"
+
+def headline_metrics(report):
+    """
+    Headline figure of every successful benchmark of a run_benchmarks report.
+
+    Returns:
+        dict: {benchmark key: {'metric', 'value', 'higher_is_better', 'median_s'}}
+    """
+    metrics = {}
+    for result in report['results']:
+        if 'error' in result or not result.get('median_s'):
+            continue
+        name, seconds = result['name'], result['median_s']
+        if name in THROUGHPUT:
+            metric, items = THROUGHPUT[name]
+            value, higher_is_better = result['params'].get(items, 1) / seconds, True
+        else:
+            metric, value, higher_is_better = 'latency_ms', 1000 * seconds, False
+        metrics[benchmark_key(result)] = {'metric': metric, 'value': value,
+                                          'higher_is_better': higher_is_better, 'median_s': seconds}
+    return metrics
+
+class BenchmarkHistory:
+    """
+    JSON-lines file with one entry per recorded run (commit, timestamp,
+    machine fingerprint, machine, settings, headline metrics).
+    """
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+
+    def entries(self, fingerprint=None):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        if fingerprint is not None:
+            entries = [entry for entry in entries if entry['fingerprint'] == fingerprint]
+        return entries
+
+    def record(self, report):
+        """Appends a run_benchmarks report to the history."""
+        entry = {
+            'commit': report.get('commit'),
+            'dirty': report.get('dirty'),
+            'timestamp': report.get('timestamp'),
+            'fingerprint': machine_fingerprint(report['machine']),
+            'machine': report['machine'],
+            'settings': report.get('settings', {}),
+            'metrics': headline_metrics(report),
+        }
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        print(f"Recorded {len(entry['metrics'])} benchmarks of {describe_commit(entry)} in {self.path}")
+        return entry
+
+    def baseline(self, fingerprint, commit=None, current_commit=None, dirty=False):
+        """
+        Latest entry of this machine for ``commit``. Without a commit, a run
+        with uncommitted changes (``dirty``) is compared with the latest clean
+        entry of ``current_commit``, i.e. the same code without the edits;
+        otherwise with the latest entry of another commit (clean entries
+        first), falling back to the latest entry of ``current_commit`` when
+        no other is recorded.
+        """
+        candidates = self.entries(fingerprint)
+        if commit is not None:
+            candidates = [e for e in candidates if e['commit'] and e['commit'].startswith(commit)]
+            return candidates[-1] if candidates else None
+        if current_commit is None:
+            return candidates[-1] if candidates else None
+
+        same = [e for e in candidates if e['commit'] == current_commit]
+        if dirty:
+            clean = [e for e in same if not e.get('dirty')]
+            if clean:
+                return clean[-1]
+        other = [e for e in candidates if e['commit'] != current_commit]
+        # clean runs describe their commit, prefer them over runs with edits
+        other = [e for e in other if not e.get('dirty')] or other
+        if other:
+            return other[-1]
+        return same[-1] if same else None
+
+    def compare(self, report, baseline_commit=None, threshold=0.1, min_seconds=1e-3):
+        """
+        Compares a report with the machine's baseline.
+
+        Args:
+            baseline_commit (str): Commit (or prefix) to compare against,
+                defaults to the baseline picked by ``baseline``.
+            threshold (float): Slowdown flagged as a regression, 0.1 is 10%
+                more time per item.
+            min_seconds (float): Benchmarks faster than this in both runs
+                are reported but never flagged, they are dominated by noise.
+
+        Returns:
+            dict: baseline entry (None without one), rows with key, metric,
+            baseline, current, slowdown and regression flag, and the
+            benchmarks missing from either run.
+        """
+        fingerprint = machine_fingerprint(report['machine'])
+        baseline = self.baseline(fingerprint, baseline_commit, report.get('commit'), report.get('dirty') or False)
+        current = headline_metrics(report)
+        comparison = {'baseline': baseline, 'threshold': threshold, 'rows': [], 'new': [], 'missing': []}
+        if baseline is None:
+            return comparison
+
+        for key, metric in current.items():
+            reference = baseline['metrics'].get(key)
+            if reference is None:
+                comparison['new'].append(key)
+                continue
+            # time per item, now relative to before
+            slowdown = metric['median_s'] / reference['median_s'] - 1
+            noisy = max(metric['median_s'], reference['median_s']) < min_seconds
+            comparison['rows'].append({
+                'key': key,
+                'metric': metric['metric'],
+                'baseline': reference['value'],
+                'current': metric['value'],
+                'slowdown': slowdown,
+                'regression': slowdown > threshold and not noisy,
+            })
+        comparison['missing'] = [key for key in baseline['metrics'] if key not in current]
+        return comparison
+
+def describe_commit(entry):
+    """Commit of a history entry or report, marked when the work tree had uncommitted changes."""
+    commit = entry.get('commit') or 'unknown commit'
+    return commit + ' (uncommitted changes)' if entry.get('dirty') else commit
+
+def print_comparison(comparison):
+    """Prints a comparison table, regressions first, and returns the number of regressions."""
+    baseline = comparison['baseline']
+    if baseline is None:
+        print("No baseline recorded for this machine yet")
+        return 0
+
+    rows = sorted(comparison['rows'], key=lambda row: -row['slowdown'])
+    print(f"Compared with {describe_commit(baseline)} ({baseline['timestamp']}), "
+          f"threshold {comparison['threshold']:.0%}")
+    print(f"  {'':<2}{'benchmark':<70}{'metric':>14}{'baseline':>12}{'current':>12}{'change':>9}")
+    for row in rows:
+        flag = '!!' if row['regression'] else ''
+        print(f"  {flag:<2}{row['key'][:70]:<70}{row['metric']:>14}{row['baseline']:>12.3f}"
+              f"{row['current']:>12.3f}{row['slowdown']:>+9.1%}")
+    for key in comparison['new']:
+        print(f"  new: {key}")
+    for key in comparison['missing']:
+        print(f"  missing: {key}")
+
+    regressions = sum(row['regression'] for row in rows)
+    print(f"{regressions} regression(s) slower than {comparison['threshold']:.0%}" if regressions else "No regressions")
+    return regressions
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Record run_benchmarks results and flag slowdowns against a stored baseline")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Append a benchmark run to the history")
+    record_parser.add_argument("results", help="JSON written by run_benchmarks.py")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare a benchmark run with the machine's baseline")
+    compare_parser.add_argument("results", help="JSON written by run_benchmarks.py")
+    compare_parser.add_argument("--baseline", default=None,
+                                help="Baseline commit, defaults to the clean run of this commit for a dirty tree, else the latest other commit")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown flagged as a regression (0.1 = 10%%)")
+    compare_parser.add_argument("--min-seconds", type=float, default=1e-3, help="Never flag benchmarks faster than this")
+    compare_parser.add_argument("--record", action="store_true", help="Also append the run to the history")
+    compare_parser.add_argument("--fail", action="store_true", help="Exit with status 1 on regressions")
+
+    subparsers.add_parser("list", help="List the recorded runs")
+    args = parser.parse_args()
+
+    history = BenchmarkHistory(args.history)
+
+    if args.command == "list":
+        for entry in history.entries():
+            commit = (entry['commit'] or 'unknown')[:12] + ('*' if entry.get('dirty') else '')
+            print(f"{entry['timestamp']}  {commit:<13}  {entry['fingerprint']}  "
+                  f"{entry['machine'].get('hostname')}  {len(entry['metrics'])} benchmarks")
+        return
+
+    with open(args.results) as f:
+        report = json.load(f)
+
+    if args.command == "record":
+        history.record(report)
+        return
+
+    regressions = print_comparison(history.compare(report, args.baseline, args.threshold, args.min_seconds))
+    if args.record:
+        history.record(report)
+    if args.fail and regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import json
+import time
+import argparse
+import threading
+from urllib.request import urlopen
+
+import numpy as np
+
+from ssm.inference.server import denoise_remote
+
+def worker(url, model, flow, image, deadline, latencies, errors, lock):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            denoise_remote(url, image, model, flow)
+            ok = True
+        except Exception:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(elapsed)
+
+def run_load(url, model=None, flow=False, concurrency=8, duration=10.0, size=256):
+    """Sends single B-scan requests from ``concurrency`` threads for ``duration`` seconds."""
+    rng = np.random.default_rng(0)
+    image = rng.random((size, size), dtype=np.float32)
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = [threading.Thread(target=worker, args=(url, model, flow, image, deadline, latencies, errors, lock))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    n_requests, n_errors = len(latencies), len(errors)
+    # placeholder so the percentiles are defined when nothing succeeded
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        'concurrency': concurrency,
+        'requests': n_requests,
+        'errors': n_errors,
+        'requests_per_s': n_requests / elapsed,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p90': float(np.percentile(latencies, 90)),
+            'p99': float(np.percentile(latencies, 99)),
+        },
+    }
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark a running inference server (scripts/serve_models.py) with concurrent requests")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--model", default=None, help="Defaults to the first model of the server")
+    parser.add_argument("--flow", action="store_true", help="Ask for flow images too")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--output", default=None, help="Optional JSON report")
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in args.concurrency:
+        result = run_load(args.url, args.model, args.flow, concurrency, args.duration, args.size)
+        results.append(result)
+        print(f"concurrency {concurrency:3d}: {result['requests_per_s']:7.1f} req/s, "
+              f"p50 {result['latency_ms']['p50']:7.1f} ms, p99 {result['latency_ms']['p99']:7.1f} ms, errors {result['errors']}")
+
+    with urlopen(args.url.rstrip('/') + '/stats') as response:
+        server_stats = json.loads(response.read())
+    print(f"server: {server_stats['batches']} batches, mean batch size {server_stats['mean_batch_size']:.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'client': results, 'server': server_stats}, f, indent=4)
+        print(f"Report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
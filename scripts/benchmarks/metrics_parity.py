@@ -0,0 +1,82 @@
+import time
+import argparse
+
+import numpy as np
+import torch
+from scipy import ndimage
+
+from ssm.utils.eval_utils.metrics import evaluate_oct_denoising
+from ssm.utils.eval_utils.metrics_torch import evaluate_oct_denoising_batch
+
+METRICS = ['psnr', 'ssim', 'snr', 'cnr', 'enl', 'epi']
+
+def make_images(n, size, seed=0):
+    """Layered structure with multiplicative speckle, plus a smoothed "denoised" and a second noisy "reference"."""
+    rng = np.random.default_rng(seed)
+    rows = np.linspace(0, 1, size)[:, None]
+    clean = np.stack([0.2 + 0.6 * (np.sin(rows * rng.uniform(6, 20) + rng.uniform(0, 6)) > 0.3) * np.ones((1, size))
+                      for _ in range(n)]).astype(np.float32)
+    original = np.clip(clean * rng.gamma(4.0, 0.25, clean.shape), 0, 1).astype(np.float32)
+    reference = np.clip(clean * rng.gamma(4.0, 0.25, clean.shape), 0, 1).astype(np.float32)
+    denoised = np.stack([ndimage.gaussian_filter(img, 1.5) for img in original]).astype(np.float32)
+    return original, denoised, reference
+
+def compare(expected, actual):
+    """Largest difference (relative above 1) over entries finite in both, and whether inf/NaN agree."""
+    finite = np.isfinite(expected) & np.isfinite(actual)
+    same_special = np.array_equal(np.isnan(expected), np.isnan(actual)) and \
+        np.array_equal(np.isinf(expected) & ~finite, np.isinf(actual) & ~finite)
+    difference = np.abs(expected[finite] - actual[finite]) / np.maximum(1.0, np.abs(expected[finite]))
+    max_diff = float(difference.max()) if finite.any() else 0.0
+    return max_diff, same_special
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check the batched torch metrics against evaluate_oct_denoising and time both")
+    parser.add_argument("--n-images", type=int, default=32)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--min-speedup", type=float, default=1.0, help="Fail unless both torch paths are this much faster than numpy")
+    args = parser.parse_args()
+
+    original, denoised, reference = make_images(args.n_images, args.size)
+
+    start = time.perf_counter()
+    expected = [evaluate_oct_denoising(o, d, r) for o, d, r in zip(original, denoised, reference)]
+    numpy_s = time.perf_counter() - start
+
+    to_batch = lambda x: torch.from_numpy(x[:, np.newaxis]).to(args.device)
+    batch_args = (to_batch(original), to_batch(denoised), to_batch(reference))
+    evaluate_oct_denoising_batch(*batch_args)  # warm up
+    start = time.perf_counter()
+    actual = evaluate_oct_denoising_batch(*batch_args)
+    torch_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    evaluate_oct_denoising_batch(*batch_args, roi='percentile')
+    percentile_s = time.perf_counter() - start
+
+    ok = True
+    for name in METRICS:
+        reference_values = np.array([m.get(name, np.nan) for m in expected], dtype=np.float64)
+        max_diff, same_special = compare(reference_values, actual[name].astype(np.float64))
+        passed = same_special and max_diff <= args.tolerance
+        ok &= passed
+        print(f"{name:>5}: max diff {max_diff:.2e}{'' if same_special else ', inf/NaN mismatch'} {'ok' if passed else 'FAIL'}")
+
+    print(f"\n{args.n_images} images of {args.size}x{args.size} on {args.device}")
+    print(f"numpy reference:       {1000 * numpy_s:8.1f} ms")
+    print(f"torch, roi='auto':     {1000 * torch_s:8.1f} ms ({numpy_s / torch_s:.1f}x)")
+    print(f"torch, roi='percentile': {1000 * percentile_s:6.1f} ms ({numpy_s / percentile_s:.1f}x)")
+
+    for mode, seconds in (('auto', torch_s), ('percentile', percentile_s)):
+        if numpy_s / seconds < args.min_speedup:
+            print(f"FAIL: torch roi='{mode}' is not {args.min_speedup:.1f}x faster than the numpy reference")
+            ok = False
+
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
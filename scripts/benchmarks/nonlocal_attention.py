@@ -0,0 +1,100 @@
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+import torch
+
+from ssm.models.gan.gan import NonLocalBlock, NONLOCAL_MODES
+
+def run_single(mode, resolution, channels, batch_size, backward):
+    """Runs one configuration in this process and returns time and peak memory."""
+    torch.manual_seed(0)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    block = NonLocalBlock(channels, mode=mode).to(device)
+    x = torch.randn(batch_size, channels, resolution, resolution, device=device, requires_grad=backward)
+
+    if device == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+
+    start = time.perf_counter()
+    if backward:
+        block(x).sum().backward()
+    else:
+        with torch.no_grad():
+            block(x)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    if device == 'cuda':
+        peak_mb = torch.cuda.max_memory_allocated() / 1024**2
+    else:
+        # ru_maxrss is in KB on Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return {'mode': mode, 'resolution': resolution, 'seconds': elapsed, 'peak_mb': peak_mb, 'device': device}
+
+def check_parity(channels=16, resolution=32):
+    """Max abs difference of every exact mode against 'full' on the same weights."""
+    torch.manual_seed(0)
+    x = torch.randn(2, channels, resolution, resolution)
+    reference = NonLocalBlock(channels, mode='full').eval()
+    with torch.no_grad():
+        expected = reference(x)
+
+    diffs = {}
+    for mode in NONLOCAL_MODES:
+        block = NonLocalBlock(channels, mode=mode, chunk_size=100).eval()
+        block.load_state_dict(reference.state_dict())
+        with torch.no_grad():
+            diffs[mode] = (block(x) - expected).abs().max().item()
+    return diffs
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Peak memory and time of NonLocalBlock modes against resolution")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--modes", nargs="+", default=list(NONLOCAL_MODES))
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--backward", action="store_true", help="Time forward + backward instead of inference")
+    parser.add_argument("--output", default=None, help="Optional json path for the results")
+    parser.add_argument("--single", nargs=2, metavar=("MODE", "RESOLUTION"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = run_single(args.single[0], int(args.single[1]), args.channels, args.batch_size, args.backward)
+        print(json.dumps(result))
+        return
+
+    print("Parity against 'full' (subsample is approximate):")
+    for mode, diff in check_parity().items():
+        print(f"  {mode:10s} max abs diff {diff:.2e}")
+
+    results = []
+    print(f"\n{'mode':10s} {'res':>5s} {'seconds':>9s} {'peak MB':>9s}")
+    for resolution in args.resolutions:
+        for mode in args.modes:
+            # a fresh process per configuration so peak rss is not shared
+            command = [sys.executable, __file__, "--single", mode, str(resolution),
+                       "--channels", str(args.channels), "--batch-size", str(args.batch_size)]
+            if args.backward:
+                command.append("--backward")
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{mode:10s} {resolution:5d} {'failed':>9s} ({completed.stderr.strip().splitlines()[-1] if completed.stderr else 'killed'})")
+                results.append({'mode': mode, 'resolution': resolution, 'error': completed.stderr[-500:]})
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{mode:10s} {resolution:5d} {result['seconds']:9.3f} {result['peak_mb']:9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
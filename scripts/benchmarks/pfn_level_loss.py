@@ -0,0 +1,57 @@
+import time
+import argparse
+
+import torch
+from torch.nn import L1Loss
+
+from ssm.models.registry import build_model
+from ssm.trainers.pfn_trainer import normalize_to_target, normalize_to_target_levels
+
+def per_level_loss(model, input_img, target_images):
+    """The former Trainer loss: one output and one L1 term per level."""
+    num_levels = target_images.shape[1]
+    targets = [target_images[:, i] for i in range(num_levels)]
+    outputs = model(input_img, num_levels, targets[0].shape)
+    loss = 0
+    for output, target in zip(outputs, targets):
+        loss += L1Loss()(normalize_to_target(output, target), target)
+    return loss / num_levels
+
+def batched_level_loss(model, input_img, target_images):
+    output = model(input_img, 1, target_images.shape[-2:])[0]
+    return L1Loss()(normalize_to_target_levels(output, target_images), target_images)
+
+def time_step(loss_fn, model, input_img, target_images, n_runs):
+    timings = []
+    for _ in range(n_runs):
+        model.zero_grad()
+        start = time.perf_counter()
+        loss_fn(model, input_img, target_images).backward()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check the batched PFN level loss against the per-level loop and time a training step")
+    parser.add_argument("--model", default="ProgUNet", choices=["ProgUNet", "ProgLargeUNet"])
+    parser.add_argument("--levels", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--size", type=int, default=128)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = build_model(args.model).train()
+    input_img = torch.rand(args.batch_size, 1, args.size, args.size)
+    target_images = torch.rand(args.batch_size, args.levels, 1, args.size, args.size)
+
+    reference = per_level_loss(model, input_img, target_images)
+    batched = batched_level_loss(model, input_img, target_images)
+    print(f"per level {reference.item():.6f}  batched {batched.item():.6f}  diff {abs(reference.item() - batched.item()):.2e}")
+
+    per_level_ms = time_step(per_level_loss, model, input_img, target_images, args.runs)
+    batched_ms = time_step(batched_level_loss, model, input_img, target_images, args.runs)
+    print(f"step: per level {per_level_ms:.1f} ms, batched {batched_ms:.1f} ms ({per_level_ms / batched_ms:.2f}x)")
+
+if __name__ == "__main__":
+    main()
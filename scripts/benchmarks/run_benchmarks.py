@@ -0,0 +1,323 @@
+"""
+Times and memory-profiles the pipeline's hot paths on CPU and writes the
+results as JSON, so runs can be compared across commits:
+
+    python scripts/benchmarks/run_benchmarks.py --output benchmark_results.json
+
+Without ``--data-dir`` a small synthetic patient is generated first
+(ssm.utils.data_utils.synthetic), so no patient data is needed.
+"""
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import torch
+
+from ssm.utils.memory import peak_rss_mb
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def get_git_dirty():
+    """Whether tracked files have uncommitted changes, None outside a git checkout."""
+    try:
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return bool(status.strip())
+
+def get_machine_info():
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+    }
+
+def measure(name, fn, repeats=5, warmup=1, **params):
+    """
+    Median/min/mean time of ``fn()`` over ``repeats`` runs, then one extra
+    run under tracemalloc for the peak Python/numpy allocation. Torch CPU
+    tensors are not traced, the process RSS high-water mark is reported
+    for them instead.
+    """
+    result = {'name': name, 'params': params}
+    try:
+        for _ in range(warmup):
+            fn()
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        fn()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result.update({
+            'median_s': float(np.median(timings)),
+            'min_s': float(np.min(timings)),
+            'mean_s': float(np.mean(timings)),
+            'repeats': repeats,
+            'traced_peak_mb': traced_peak / 1024**2,
+            'rss_peak_mb': peak_rss_mb(),
+        })
+        print(f"{name:<40} {params} {1000 * result['median_s']:10.2f} ms  {result['traced_peak_mb']:8.1f} MB")
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        result['error'] = f"{type(e).__name__}: {e}"
+        print(f"{name:<40} {params} failed: {result['error']}")
+    return result
+
+def benchmark_data(patient_dir, repeats):
+    from ssm.utils.data_utils.data_loading import load_patient_data
+    from ssm.utils.data_utils.standard_preprocessing import standard_preprocessing
+    from ssm.utils.data_utils.oct_preprocessing import octa_preprocessing, remove_speckle_noise
+
+    data = load_patient_data(patient_dir)
+    if not data:
+        raise ValueError(f"No B-scans could be loaded from {patient_dir}")
+    preprocessed = standard_preprocessing(data)
+    octa = octa_preprocessing(preprocessed, 2, 0.65)
+    n = len(data)
+
+    return [
+        measure('load_patient_data', lambda: load_patient_data(patient_dir), repeats, n_bscans=n),
+        measure('standard_preprocessing', lambda: standard_preprocessing(data), repeats, n_bscans=n),
+        measure('octa_preprocessing', lambda: octa_preprocessing(preprocessed, 2, 0.65), repeats, n_bscans=n, n_neighbours=2),
+        measure('remove_speckle_noise', lambda: [remove_speckle_noise(img.copy(), min_size=10) for img in octa],
+                repeats, n_images=len(octa)),
+    ]
+
+def benchmark_synthetic_data(n_bscans, repeats):
+    """``benchmark_data`` on one synthetic patient written to a temporary directory."""
+    from ssm.utils.data_utils.synthetic import write_synthetic_dataset, get_patient_dir_name
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = write_synthetic_dataset(tmp, n_patients=1, n_bscans=n_bscans, diabetes_list=(0,))
+        return benchmark_data(os.path.join(root, '0', get_patient_dir_name(0, 1)), repeats)
+
+def benchmark_masking(repeats, batch_size=4, size=256, mask_ratio=0.01):
+    from ssm.utils.data_utils.masking import blind_spot_masking, fast_blind_spot, blind_spot_masking_fast, subset_blind_spot_masking
+
+    torch.manual_seed(0)
+    x = torch.rand(batch_size, 1, size, size)
+    mask = torch.rand(batch_size, 1, size, size) < mask_ratio
+    params = {'batch_size': batch_size, 'size': size, 'mask_ratio': mask_ratio}
+
+    return [
+        measure('blind_spot_masking', lambda: blind_spot_masking(x, mask), max(1, repeats // 2), **params),
+        measure('fast_blind_spot', lambda: fast_blind_spot(x, mask), repeats, **params),
+        measure('blind_spot_masking_fast', lambda: blind_spot_masking_fast(x, mask), repeats, **params),
+        measure('subset_blind_spot_masking', lambda: subset_blind_spot_masking(x, mask_ratio), repeats, **params),
+    ]
+
+def benchmark_patches(repeats, batch_size=4, size=256, patch_size=64):
+    from ssm.schemas.baselines.n2n_patch import extract_patches, reconstruct_from_patches
+
+    x = torch.rand(batch_size, 1, size, size)
+    patches, locations = extract_patches(x, patch_size)
+    params = {'batch_size': batch_size, 'size': size, 'patch_size': patch_size, 'n_patches': len(patches)}
+
+    return [
+        measure('extract_patches', lambda: extract_patches(x, patch_size), repeats, **params),
+        measure('reconstruct_from_patches', lambda: reconstruct_from_patches(patches, locations, x.shape, patch_size), repeats, **params),
+    ]
+
+def benchmark_metrics(repeats, size=256, batch_size=8):
+    from scipy import ndimage
+    from ssm.utils.eval_utils.metrics import evaluate_oct_denoising
+    from ssm.utils.eval_utils.metrics_torch import evaluate_oct_denoising_batch
+
+    rng = np.random.default_rng(0)
+    originals = rng.random((batch_size, size, size), dtype=np.float32)
+    denoised = np.stack([ndimage.gaussian_filter(img, 1.5) for img in originals]).astype(np.float32)
+    references = np.stack([ndimage.gaussian_filter(img, 3) for img in originals]).astype(np.float32)
+
+    return [
+        measure('evaluate_oct_denoising', lambda: evaluate_oct_denoising(originals[0], denoised[0], references[0]), repeats, size=size),
+        measure('evaluate_oct_denoising_batch',
+                lambda: evaluate_oct_denoising_batch(originals[:, None], denoised[:, None], references[:, None]),
+                repeats, size=size, batch_size=batch_size),
+    ]
+
+def benchmark_bm3d(repeats, size=64):
+    from ssm.schemas.baselines.bm3d import BM3D_Step1, BM3D_Step2
+
+    rng = np.random.default_rng(0)
+    noisy = rng.random((size, size)).astype(np.float64)
+
+    # step 2 runs on the basic estimate of the last timed step 1
+    basic = {}
+    def step1():
+        basic['image'] = BM3D_Step1(noisy)
+
+    results = [measure('BM3D_Step1', step1, max(1, repeats // 2), warmup=0, size=size)]
+    if 'error' in results[0]:
+        results.append({'name': 'BM3D_Step2', 'params': {'size': size}, 'error': "BM3D_Step1 failed, no basic estimate"})
+    else:
+        results.append(measure('BM3D_Step2', lambda: BM3D_Step2(basic['image'], noisy), max(1, repeats // 2), warmup=0, size=size))
+    return results
+
+def _model_step(model, output_kind, x, backward):
+    if output_kind == 'list':
+        out = model(x, n_targets=1, target_size=x.shape[-2:])[0]
+    elif output_kind == 'dict':
+        out = sum(v.mean() for v in model(x).values())
+    else:
+        out = model(x)
+
+    if backward:
+        model.zero_grad(set_to_none=True)
+        out.mean().backward()
+
+def benchmark_models(models, batch_sizes, resolutions, repeats):
+    from ssm.models.registry import build_model, get_model_spec
+
+    results = []
+    for model_name in models:
+        output_kind = get_model_spec(model_name)['output']
+        try:
+            model = build_model(model_name)
+        except Exception as e:
+            results.append({'name': 'model', 'params': {'model': model_name}, 'error': f"{type(e).__name__}: {e}"})
+            print(f"{model_name} failed to build: {e}")
+            continue
+        n_params = sum(p.numel() for p in model.parameters())
+
+        for resolution in resolutions:
+            for batch_size in batch_sizes:
+                torch.manual_seed(0)
+                x = torch.rand(batch_size, 1, resolution, resolution)
+                params = {'model': model_name, 'batch_size': batch_size, 'resolution': resolution, 'n_params': n_params}
+
+                model.eval()
+                def forward():
+                    with torch.no_grad():
+                        _model_step(model, output_kind, x, False)
+                results.append(measure('model_forward', forward, repeats, **params))
+
+                model.train()
+                results.append(measure('model_forward_backward', lambda: _model_step(model, output_kind, x, True), repeats, **params))
+    return results
+
+def benchmark_training(model_name, schemas, repeats, batch_size=4, n_batches=4, size=256):
+    """One training pass over ``n_batches`` synthetic batches per schema, with the trainers' own batch loops."""
+    from torch.utils.data import DataLoader, TensorDataset
+    from ssm.models.registry import build_model
+    from ssm.schemas.baselines.n2n import process_batch
+    from ssm.schemas.baselines.n2v import process_batch_n2v
+    from ssm.schemas.baselines.n2s import process_batch_n2s_with_clean_inference
+
+    torch.manual_seed(0)
+    inputs = torch.rand(n_batches * batch_size, 1, size, size)
+    targets = (inputs + 0.05 * torch.randn_like(inputs)).clamp(0, 1)
+    loader = DataLoader(TensorDataset(inputs, targets), batch_size=batch_size, drop_last=True)
+
+    model = build_model(model_name)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    criterion = torch.nn.MSELoss()
+    epochs = {
+        'n2n': lambda: process_batch(loader, model.train(), criterion, optimizer, 0, 1, 'cpu', False, None, 1, None),
+        'n2v': lambda: process_batch_n2v(model, loader, criterion, 0.1, optimizer=optimizer, device='cpu'),
+        'n2s': lambda: process_batch_n2s_with_clean_inference(loader, model.train(), criterion, optimizer, 0, 1, 'cpu', False),
+    }
+
+    return [measure('train_epoch', epochs[schema], repeats, schema=schema, model=model_name,
+                    batch_size=batch_size, n_batches=n_batches, size=size)
+            for schema in schemas]
+
+BENCHMARK_GROUPS = ('data', 'masking', 'patches', 'metrics', 'bm3d', 'models', 'training')
+
+def run_group(group, fn, *args):
+    """Runs one benchmark group; a group that raises is recorded as an ``error`` entry instead of ending the run."""
+    try:
+        return fn(*args)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"{group} benchmarks failed: {error}")
+        return [{'name': group, 'params': {}, 'error': error}]
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Time and memory-profile the pipeline hot paths on CPU and write JSON results")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--groups", nargs="+", choices=BENCHMARK_GROUPS, default=list(BENCHMARK_GROUPS))
+    parser.add_argument("--data-dir", default=None, help="Patient directory of B-scans, a synthetic patient is generated if omitted")
+    parser.add_argument("--bscans", type=int, default=16, help="B-scans of the synthetic patient")
+    parser.add_argument("--models", nargs="+", default=None, help="Registered models, defaults to all")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[128, 256])
+    parser.add_argument("--bm3d-size", type=int, default=64, help="BM3D is pure Python, keep the crop small")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    parser.add_argument("--train-model", default="SmallUNet", help="Model of the training benchmark")
+    parser.add_argument("--schemas", nargs="+", default=["n2n", "n2v", "n2s"], help="Schemas of the training benchmark")
+    parser.add_argument("--quick", action="store_true", help="One batch size and resolution, fewer repeats")
+    parser.add_argument("--history", default=None,
+                        help="Record the run in this benchmark history and compare it with the machine's baseline (see history.py)")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown flagged by --history, as a fraction")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    if args.quick:
+        args.batch_sizes, args.resolutions, args.repeats = [1], [128], 2
+
+    from ssm.models.registry import list_models
+    models = args.models or list_models()
+
+    groups = {
+        'data': (benchmark_data, args.data_dir, args.repeats) if args.data_dir else (benchmark_synthetic_data, args.bscans, args.repeats),
+        'masking': (benchmark_masking, args.repeats),
+        'patches': (benchmark_patches, args.repeats),
+        'metrics': (benchmark_metrics, args.repeats),
+        'bm3d': (benchmark_bm3d, args.repeats, args.bm3d_size),
+        'models': (benchmark_models, models, args.batch_sizes, args.resolutions, args.repeats),
+        'training': (benchmark_training, args.train_model, args.schemas, args.repeats),
+    }
+
+    results = []
+    for group in BENCHMARK_GROUPS:
+        if group in args.groups:
+            results += run_group(group, *groups[group])
+
+    report = {
+        'commit': get_git_commit(),
+        'dirty': get_git_dirty(),
+        'timestamp': datetime.now().isoformat(),
+        'machine': get_machine_info(),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'history', 'threshold')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n{len(results)} benchmarks written to {args.output}")
+
+    if args.history:
+        from history import BenchmarkHistory, print_comparison
+        history = BenchmarkHistory(args.history)
+        print_comparison(history.compare(report, threshold=args.threshold))
+        history.record(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import time
+import argparse
+
+import torch
+
+from ssm.models.registry import build_model
+
+SSM_MODELS = ["SpeckleSeparationUNetAttention", "SpeckleSeparationUNet", "SpeckleSeparationModule", "SimplifiedSpeckleSeparationModel"]
+
+def median_ms(fn, n_warmup=2, n_runs=10):
+    for _ in range(n_warmup):
+        fn()
+    timings = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compare flow-only and full forward passes of the speckle separation models")
+    parser.add_argument("--models", nargs="+", default=SSM_MODELS)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    x = torch.rand(args.batch_size, 1, args.size, args.size)
+
+    for model_name in args.models:
+        model = build_model(model_name).eval()
+        with torch.inference_mode():
+            full = model(x)
+            flow_only = model(x, outputs='flow_component')
+            max_diff = (full['flow_component'] - flow_only['flow_component']).abs().max().item()
+
+            full_ms = median_ms(lambda: model(x), n_runs=args.runs)
+            flow_ms = median_ms(lambda: model(x, outputs='flow_component'), n_runs=args.runs)
+
+        print(f"{model_name}: full {full_ms:.1f} ms, flow only {flow_ms:.1f} ms "
+              f"({100 * (1 - flow_ms / full_ms):.1f}% saved), max diff {max_diff:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+
+import torch
+
+from ssm.inference.export import load_model
+from ssm.inference.streaming import denoise_volume, OUTPUT_FORMATS
+from ssm.models.registry import get_model_spec, list_models
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Denoise a whole OCT volume with bounded memory, writing the denoised and flow volumes incrementally")
+    parser.add_argument("input", help="Patient directory of B-scans or a (multi-page) TIFF stack")
+    parser.add_argument("--model", default="SpeckleSeparationUNetAttention", help=f"Any of {list_models()}")
+    parser.add_argument("--checkpoint", required=True, help="Training checkpoint with model_state_dict")
+    parser.add_argument("--ssm-checkpoint", default=None,
+                        help="SpeckleSeparationUNetAttention checkpoint to also write a flow volume for baseline models")
+    parser.add_argument("--output-dir", default="denoised")
+    parser.add_argument("--name", default=None, help="Output prefix, defaults to the input name")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="tiff")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--read-ahead", type=int, default=2, help="Batches read and preprocessed ahead of the model")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    model = load_model(args.model, args.checkpoint, args.device)
+    flow_model = None
+    if args.ssm_checkpoint:
+        flow_model = load_model("SpeckleSeparationUNetAttention", args.ssm_checkpoint, args.device)
+
+    denoise_volume(
+        model,
+        get_model_spec(args.model)['output'],
+        args.input,
+        args.output_dir,
+        name=args.name,
+        batch_size=args.batch_size,
+        size=args.size,
+        output_format=args.format,
+        device=args.device,
+        read_ahead=args.read_ahead,
+        flow_model=flow_model)
+
+if __name__ == "__main__":
+    main()
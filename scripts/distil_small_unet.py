@@ -0,0 +1,69 @@
+import os
+import json
+import argparse
+
+import torch
+
+from ssm.trainers.distillation_trainer import distill, compare_student_teacher
+from ssm.models.registry import get_model_spec
+from ssm.utils.config import get_config
+from ssm.utils.seed import set_seed
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Distil a trained N2 denoiser into a small student and report quality retained per unit of speedup")
+    parser.add_argument("--config", default=os.environ.get("N2_CONFIG_PATH"))
+    parser.add_argument("--teacher-model", default="LargeUNetAttention")
+    parser.add_argument("--teacher-method", default="n2v")
+    parser.add_argument("--no-teacher-ssm", action="store_true", help="Teacher trained without the SSM constraint")
+    parser.add_argument("--student-model", default="SmallUNet", help="e.g. SmallUNet or SmallUNetAtt")
+    parser.add_argument("--alpha", type=float, default=0.9, help="Weight of the teacher target")
+    parser.add_argument("--eval-start", type=int, default=30, help="First patient of the held out evaluation set")
+    parser.add_argument("--eval-patients", type=int, default=2)
+    parser.add_argument("--eval-images", type=int, default=5, help="Images per patient")
+    parser.add_argument("--output", default=None, help="Report path, defaults to next to the student checkpoints")
+    args = parser.parse_args()
+
+    config = get_config(args.config)
+    n_patients = config['training']['n_patients']
+    n_images = config['training']['n_images_per_patient']
+
+    override_dict = {
+        "training": {
+            "ablation": f"patient_count/{n_patients}_patients/{n_images}_images",
+        },
+        "distillation": {
+            "teacher_model": args.teacher_model,
+            "teacher_method": args.teacher_method,
+            "teacher_ssm": not args.no_teacher_ssm,
+            "student_model": args.student_model,
+            "alpha": args.alpha,
+        }
+    }
+
+    set_seed(42)
+    teacher, student = distill(config_path=args.config, override_config=override_dict)
+
+    from ssm.data.paired_dataset import PairedOCTDataset
+    eval_dataset = PairedOCTDataset(args.eval_start, n_patients=args.eval_patients, n_images_per_patient=args.eval_images)
+    images = torch.stack([eval_dataset[i][0] for i in range(len(eval_dataset))])
+    references = torch.stack([eval_dataset[i][1] for i in range(len(eval_dataset))])
+
+    report = compare_student_teacher(teacher, get_model_spec(args.teacher_model)['output'], student, images, references)
+
+    for metric in report['teacher']:
+        print(f"  {metric:5s} teacher {report['teacher'][metric]:8.4f}  student {report['student'][metric]:8.4f}  retained {report['retained'][metric]:.3f}")
+    print(f"  latency {report['teacher_latency_ms']:.1f} -> {report['student_latency_ms']:.1f} ms ({report['speedup']:.2f}x)")
+    print(f"  params {report['teacher_params']:,} -> {report['student_params']:,}")
+    print(f"  {report['retained_metric']} retained per unit of speedup: {report['retained_per_speedup']:.3f}")
+
+    output = args.output or os.path.join(
+        config['training']['baselines_checkpoint_path'] + override_dict['training']['ablation'],
+        f"distil_{args.teacher_method}_{args.teacher_model}_to_{args.student_model}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Report saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ from utils.metrics import display_metrics, display_grouped_metrics
 
 from evaluation.evaluate_pfn import evaluate_progressssive_fusion_unet
 from evaluation.evaluate_n2_baselines import evaluate_n2, evaluate_n2_with_ssm
+from evaluation.session import EvaluationSession
 
 def plot_images(images, metrics_df=None):
     
@@ -534,6 +535,10 @@ def main(eval_override=None):
             all_patient_metrics[key] = [value]
     else:
         
+        # load every N2 checkpoint once and reuse it for all patients
+        n2_config_path = r"C:\Users\CL-11\OneDrive\Repos\OCTDenoisingFinal\configs\n2_config.yaml"
+        session = EvaluationSession(n2_config_path, eval_override['n2_eval'])
+
         for patient_id, patient_data in tqdm(dataset.items(), desc="Evaluating patients"):
             raw_image = patient_data["raw"].to(device)
             reference = patient_data["avg"].to(device)[0][0]
@@ -544,9 +549,8 @@ def main(eval_override=None):
                 "original": patient_data["raw_np"],
                 "avg": patient_data["avg_np"],
             }
-            n2_config_path = r"C:\Users\CL-11\OneDrive\Repos\OCTDenoisingFinal\configs\n2_config.yaml"
             try:
-                metrics, denoised_images = evaluate_n2(metrics, denoised_images, n2_config_path, eval_override['n2_eval'], raw_image, reference)
+                metrics, denoised_images = evaluate_n2(metrics, denoised_images, n2_config_path, eval_override['n2_eval'], raw_image, reference, session=session)
             except Exception as e:
                 raise e
             
@@ -556,7 +560,7 @@ def main(eval_override=None):
                 metrics["pfn"] = prog_metrics
                 denoised_images["pfn"] = prog_image
             
-            metrics, denoised_images = evaluate_n2_with_ssm(metrics, denoised_images, n2_config_path, eval_override['n2_eval'], raw_image, reference)
+            metrics, denoised_images = evaluate_n2_with_ssm(metrics, denoised_images, n2_config_path, eval_override['n2_eval'], raw_image, reference, session=session)
             
             # Save first patient's denoised images for visualization
             if patient_id == first_patient:
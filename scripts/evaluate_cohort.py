@@ -0,0 +1,45 @@
+import os
+import argparse
+
+import torch
+
+from ssm.evaluation.cohort import evaluate_cohort, summarise_cohort, N2_METHODS
+from ssm.evaluation.result_store import ResultStore, DEFAULT_STORE_PATH
+from ssm.utils.eval_utils.evaluate import load_sdoct_dataset
+from ssm.utils.profiling import StageProfiler
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Evaluate the N2 baselines (with and without SSM) on every patient with batched inference and parallel metrics")
+    parser.add_argument("--dataset", default=r"C:\Datasets\OCTData\boe-13-12-6357-d001\Sparsity_SDOCT_DATASET_2012")
+    parser.add_argument("--config", default=os.getenv("N2_CONFIG_PATH"), help="N2 config, defaults to $N2_CONFIG_PATH")
+    parser.add_argument("--methods", nargs="+", default=list(N2_METHODS))
+    parser.add_argument("--no-ssm", action="store_true", help="Only evaluate the models trained without SSM")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None, help="Metric processes, defaults to the CPU count (0 for none)")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--output", default="sdoct_cohort_results.csv", help="Long-format results CSV")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Result store, only new checkpoint/image pairs are evaluated")
+    parser.add_argument("--no-store", action="store_true", help="Recompute everything and do not store results")
+    parser.add_argument("--profile", action="store_true", help="Print a stage breakdown of the evaluation")
+    parser.add_argument("--trace-dir", default=None, help="Also write a torch.profiler trace of the first batches here")
+    args = parser.parse_args()
+
+    dataset = load_sdoct_dataset(args.dataset)
+    ssm_options = (False,) if args.no_ssm else (False, True)
+
+    store = None if args.no_store else ResultStore(args.store)
+    profiler = StageProfiler(trace_dir=args.trace_dir) if args.profile or args.trace_dir else None
+    results = evaluate_cohort(dataset, args.config, methods=args.methods, ssm_options=ssm_options,
+                              batch_size=args.batch_size, n_workers=args.workers, device=args.device, store=store,
+                              profiler=profiler)
+    if store is not None:
+        store.close()
+    results.to_csv(args.output, index=False)
+    print(f"Results saved to {args.output}")
+
+    summary = summarise_cohort(results)
+    print(summary.pivot_table(index='metric', columns=['method', 'ssm'], values='mean').to_string(float_format="%.4f"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import torch
+
+from ssm.inference.export import export_model, load_model, get_export_module
+from ssm.models.registry import list_models
+from ssm.inference.backends import EagerBackend, load_backend, compare_backends, benchmark_latency
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export denoisers to TorchScript/ONNX, check parity and benchmark against eager PyTorch")
+    parser.add_argument("--models", nargs="+", default=["UNet", "UNet2", "LargeUNet", "LargeUNetAttention", "SpeckleSeparationUNetAttention"],
+                        help=f"Any of {list_models()}")
+    parser.add_argument("--checkpoints", nargs="*", default=None, help="One checkpoint per model, random weights if omitted")
+    parser.add_argument("--output-dir", default="exports")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    checkpoints = args.checkpoints or [None] * len(args.models)
+    rng = np.random.default_rng(0)
+    inputs = rng.random((args.batch_size, 1, args.size, args.size), dtype=np.float32)
+
+    report = {}
+    failed = []
+    for model_name, checkpoint_path in zip(args.models, checkpoints):
+        print(f"\n{model_name}")
+        model = load_model(model_name, checkpoint_path)
+        paths = export_model(model_name, checkpoint_path, args.output_dir, input_shape=(1, 1, args.size, args.size), model=model)
+
+        module, output_names = get_export_module(model, model_name)
+        eager = EagerBackend(module, output_names)
+
+        backends = [eager]
+        for fmt in ('torchscript', 'onnx'):
+            try:
+                kwargs = {'intra_op_threads': args.threads} if fmt == 'onnx' else {}
+                backends.append(load_backend(paths[fmt], **kwargs))
+            except ImportError as e:
+                print(f"Skipping {fmt}: {e}")
+
+        report[model_name] = {'parity': {}, 'latency': []}
+        for backend in backends:
+            if backend is not eager:
+                parity = compare_backends(eager, backend, inputs, atol=args.atol)
+                report[model_name]['parity'][backend.name] = parity
+                print(f"  parity {backend.name}: {parity}")
+                if not parity['match']:
+                    failed.append(f"{model_name}/{backend.name}")
+            latency = benchmark_latency(backend, inputs, n_runs=args.runs)
+            report[model_name]['latency'].append(latency)
+            print(f"  {backend.name:12s} {latency['median_ms']:8.2f} ms  {latency['images_per_s']:8.1f} img/s")
+
+    report_path = os.path.join(args.output_dir, "export_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nReport saved to {report_path}")
+
+    if failed:
+        raise SystemExit(f"Parity check failed for: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,36 @@ import json
 import os
 from datetime import datetime
 
+REPORT_METRICS = {'psnr': 'PSNR', 'ssim': 'SSIM', 'cnr': 'CNR', 'enl': 'ENL', 'snr': 'SNR', 'epi': 'EPI'}
+
+def metrics_from_store(store_path, model_type=None):
+    """Mean of every metric per method (``<method>_ssm`` with the speckle module) from the result store."""
+    import numpy as np
+    from ssm.evaluation.result_store import ResultStore
+
+    with ResultStore(store_path) as store:
+        results = store.to_dataframe()
+
+    if model_type:
+        models = sorted(set(results['model']))
+        results = results[results['model'] == model_type]
+        if results.empty:
+            raise ValueError(f"No results for model {model_type} in {store_path}, stored models: {models}")
+    results = results[np.isfinite(results['value'].astype(float))]
+
+    metrics = {}
+    for (method, ssm, metric), values in results.groupby(['method', 'ssm', 'metric'])['value']:
+        label = f"{method}_ssm" if ssm else method
+        metrics.setdefault(label, {})[REPORT_METRICS.get(metric, metric)] = float(values.mean())
+    return metrics, int(results['patient'].nunique())
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--experiment-name', required=True)
     parser.add_argument('--model-type', required=True)  
     parser.add_argument('--dataset', required=True)
     parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--store', default=None, help="Result store (results/evaluation.sqlite) to read the metrics from")
     args = parser.parse_args()
     
     results = {
@@ -27,6 +51,11 @@ def main():
         }
     }
 
+    if args.store:
+        results["metrics"], n_patients = metrics_from_store(args.store, args.model_type)
+        results["parameters"]["n_patients"] = n_patients
+        results["parameters"]["store"] = os.path.abspath(args.store)
+
     os.makedirs(args.output_dir, exist_ok=True)
     with open(f"{args.output_dir}/results.json", "w") as f:
         json.dump(results, f, indent=2)
@@ -35,4 +64,4 @@ def main():
     # and save them to the output directory
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,29 @@
+import argparse
+
+from ssm.utils.data_utils.synthetic import write_synthetic_dataset, write_synthetic_sdoct
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Write synthetic OCT patients in the DATASET_DIR_PATH (and optionally SDOCT) layout")
+    parser.add_argument("--output-dir", default="synthetic_data")
+    parser.add_argument("--patients", type=int, default=3, help="Patients per diabetes category")
+    parser.add_argument("--bscans", type=int, default=16, help="B-scans per patient")
+    parser.add_argument("--height", type=int, default=496)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--diabetes", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--looks", type=int, default=1, help="1 for Rayleigh speckle, more for gamma (multi-look) speckle")
+    parser.add_argument("--correlation", type=float, default=0.9, help="Static tissue speckle correlation between neighbouring B-scans")
+    parser.add_argument("--sdoct", type=int, default=0, help="Also write this many SDOCT raw/averaged pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = write_synthetic_dataset(args.output_dir, args.patients, args.bscans, args.height, args.width,
+                                   tuple(args.diabetes), args.looks, args.correlation, args.seed)
+    print(f"Set DATASET_DIR_PATH={root}")
+
+    if args.sdoct:
+        sdoct_root = write_synthetic_sdoct(args.output_dir.rstrip("/\\") + "_sdoct", args.sdoct, looks=args.looks, seed=args.seed)
+        print(f"SDOCT pairs for load_sdoct_dataset: {sdoct_root}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import json
+import argparse
+
+import torch
+
+from ssm.trainers.pruning_trainer import prune_and_finetune
+from ssm.utils.config import get_config
+from ssm.utils.seed import set_seed
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Prune a trained UNet to a CPU latency target per 256x256 B-scan and fine-tune it")
+    parser.add_argument("--config", default=os.environ.get("N2_CONFIG_PATH"))
+    parser.add_argument("--model", default="LargeUNet", help="e.g. LargeUNet, LargeUNet2 or LargeUNet3")
+    parser.add_argument("--method", default="n2v")
+    parser.add_argument("--ssm", action="store_true")
+    parser.add_argument("--target-ms", type=float, required=True, help="CPU latency target per B-scan")
+    parser.add_argument("--score", choices=["bn", "activation"], default="bn")
+    parser.add_argument("--epochs", type=int, default=3, help="Fine-tuning epochs")
+    parser.add_argument("--threads", type=int, default=None, help="Torch CPU threads for the latency measurements")
+    parser.add_argument("--eval-start", type=int, default=30, help="First patient of the held out evaluation set")
+    parser.add_argument("--eval-patients", type=int, default=2)
+    parser.add_argument("--eval-images", type=int, default=5, help="Images per patient")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    config = get_config(args.config)
+    n_patients = config['training']['n_patients']
+    n_images = config['training']['n_images_per_patient']
+
+    override_dict = {
+        "training": {
+            "ablation": f"patient_count/{n_patients}_patients/{n_images}_images",
+            "model": args.model,
+        }
+    }
+
+    from ssm.data.paired_dataset import PairedOCTDataset
+    eval_dataset = PairedOCTDataset(args.eval_start, n_patients=args.eval_patients, n_images_per_patient=args.eval_images)
+    images = torch.stack([eval_dataset[i][0] for i in range(len(eval_dataset))])
+    references = torch.stack([eval_dataset[i][1] for i in range(len(eval_dataset))])
+
+    set_seed(42)
+    _, report = prune_and_finetune(
+        config_path=args.config,
+        method=args.method,
+        ssm=args.ssm,
+        target_ms=args.target_ms,
+        score=args.score,
+        fine_tune_epochs=args.epochs,
+        eval_images=images,
+        eval_references=references,
+        override_config=override_dict)
+
+    report_path = os.path.splitext(report['channel_spec'])[0].replace('_channels', '_pruning_report') + '.json'
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
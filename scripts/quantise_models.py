@@ -0,0 +1,60 @@
+import os
+import json
+import argparse
+
+import torch
+
+from ssm.models.registry import get_model_spec
+from ssm.inference.export import load_model
+from ssm.inference.quantise import get_calibration_batches, quantise_model, compare_quantised
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Static int8 post-training quantisation of the denoisers with a quality/latency report")
+    parser.add_argument("--models", nargs="+", default=["LargeUNet", "LargeUNetAttention", "UNet2", "SpeckleSeparationUNetAttention"])
+    parser.add_argument("--checkpoints", nargs="*", default=None, help="One checkpoint per model, random weights if omitted")
+    parser.add_argument("--calibration-start", type=int, default=1)
+    parser.add_argument("--calibration-patients", type=int, default=2)
+    parser.add_argument("--calibration-images", type=int, default=10, help="Images per patient")
+    parser.add_argument("--eval-start", type=int, default=30, help="First patient of the held out evaluation set")
+    parser.add_argument("--eval-patients", type=int, default=2)
+    parser.add_argument("--eval-images", type=int, default=5, help="Images per patient")
+    parser.add_argument("--output-dir", default="exports/int8")
+    args = parser.parse_args()
+
+    calibration_batches = get_calibration_batches(args.calibration_start, args.calibration_patients, args.calibration_images)
+
+    from ssm.data.paired_dataset import PairedOCTDataset
+    eval_dataset = PairedOCTDataset(args.eval_start, n_patients=args.eval_patients, n_images_per_patient=args.eval_images)
+    images = torch.stack([eval_dataset[i][0] for i in range(len(eval_dataset))])
+    references = torch.stack([eval_dataset[i][1] for i in range(len(eval_dataset))])
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoints = args.checkpoints or [None] * len(args.models)
+
+    report = {}
+    for model_name, checkpoint_path in zip(args.models, checkpoints):
+        print(f"\n{model_name}")
+        model = load_model(model_name, checkpoint_path)
+        int8_model, quantised = quantise_model(model, calibration_batches)
+        print(f"  quantised modules: {'whole model' if quantised == [''] else quantised}")
+
+        result = compare_quantised(model, int8_model, images, references, output_kind=get_model_spec(model_name)['output'])
+        result['quantised_modules'] = quantised
+        report[model_name] = result
+
+        torch.save(int8_model.state_dict(), os.path.join(args.output_dir, f"{model_name}_int8_state_dict.pth"))
+
+        for metric, delta in result['delta'].items():
+            print(f"  {metric:5s} fp32 {result['fp32'][metric]:8.4f}  int8 {result['int8'][metric]:8.4f}  delta {delta:+.4f}")
+        print(f"  int8 vs fp32 output PSNR: {result['int8_vs_fp32_psnr']:.2f} dB")
+        print(f"  latency {result['fp32_latency_ms']:.1f} -> {result['int8_latency_ms']:.1f} ms ({result['speedup']:.2f}x)")
+        print(f"  size {result['fp32_size_mb']:.1f} -> {result['int8_size_mb']:.1f} MB ({result['size_reduction']:.2f}x)")
+
+    report_path = os.path.join(args.output_dir, "quantisation_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nReport saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+
+import torch
+
+from ssm.inference.server import serve
+from ssm.models.registry import list_models
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Serve denoisers over local HTTP with dynamic request batching")
+    parser.add_argument("--models", nargs="+", default=["SpeckleSeparationUNetAttention"], help=f"Any of {list_models()}")
+    parser.add_argument("--checkpoints", nargs="*", default=None, help="One checkpoint per model, random weights if omitted")
+    parser.add_argument("--ssm-checkpoint", default=None, help="SSM checkpoint for flow images from baseline models")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="How long the first request of a batch waits for others")
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    checkpoints = args.checkpoints or [None] * len(args.models)
+    if len(checkpoints) != len(args.models):
+        parser.error("Give one checkpoint per model")
+
+    serve(dict(zip(args.models, checkpoints)), args.host, args.port, args.ssm_checkpoint,
+          args.max_batch_size, args.max_wait_ms, args.device, args.size)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,37 @@
-from .evaluation import *
-from .models import *
-from .utils import *
-from .schemas import *
-from .trainers import *
-from .losses import *
\ No newline at end of file
+import importlib
+
+from dotenv import load_dotenv
+
+# DATASET_DIR_PATH and DEVICE come from .env. The eager star imports used to
+# load it through ssm.utils.eval_utils.evaluate, so keep doing it on import.
+load_dotenv()
+
+# Subpackages are imported on first access (PEP 562) instead of eagerly, so
+# e.g. `from ssm.models.registry import build_model` or an inference worker
+# does not import the trainers, schemas and plotting stack.
+_SUBPACKAGES = ('evaluation', 'models', 'utils', 'schemas', 'trainers', 'losses')
+
+# models and utils resolve names without importing anything else, the
+# remaining subpackages are searched in order
+_LAZY_PACKAGES = ('models', 'utils')
+_EAGER_PACKAGES = ('evaluation', 'schemas', 'trainers', 'losses')
+
+def __getattr__(name):
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f".{name}", __name__)
+
+    for package_name in _LAZY_PACKAGES:
+        package = importlib.import_module(f".{package_name}", __name__)
+        if name in package._LAZY_ATTRIBUTES:
+            return getattr(package, name)
+
+    if not name.startswith('_'):
+        for package_name in _EAGER_PACKAGES:
+            package = importlib.import_module(f".{package_name}", __name__)
+            if hasattr(package, name):
+                return getattr(package, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBPACKAGES))
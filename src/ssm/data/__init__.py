@@ -1 +1 @@
-from .paired_dataset import get_paired_loaders
\ No newline at end of file
+from .paired_dataset import get_paired_loaders, get_shared_paired_dataset, get_loaders_from_dataset, SharedPairedDataset
\ No newline at end of file
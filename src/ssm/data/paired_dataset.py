@@ -48,11 +48,36 @@ class PairedOCTDataset(Dataset):
             
         return input_tensor, target_tensor
 
-def get_paired_loaders(start, n_patients=2, n_images_per_patient=50, batch_size=8, 
-                val_split=0.2, shuffle=True, random_seed=42):
+class SharedPairedDataset(Dataset):
+    """
+    Paired dataset backed by two stacked tensors (N, 1, H, W) in shared memory.
+    Child processes that receive it attach to the same buffer instead of
+    re-running the preprocessing.
+    """
+    def __init__(self, input_images, target_images):
+        self.input_images = input_images
+        self.target_images = target_images
+
+    def __len__(self):
+        return self.input_images.shape[0]
+
+    def __getitem__(self, idx):
+        return self.input_images[idx], self.target_images[idx]
+
+def get_shared_paired_dataset(start, n_patients=2, n_images_per_patient=50, diabetes_list=[0,1,2]):
+
+    full_dataset = PairedOCTDataset(start, n_patients=n_patients, n_images_per_patient=n_images_per_patient, diabetes_list=diabetes_list)
+
+    inputs, targets = zip(*(full_dataset[i] for i in range(len(full_dataset))))
+    input_images = torch.stack(inputs).share_memory_()
+    target_images = torch.stack(targets).share_memory_()
+
+    print(f"Shared dataset: {tuple(input_images.shape)}, {2 * input_images.numel() * input_images.element_size() / 1024**2:.1f} MB")
+
+    return SharedPairedDataset(input_images, target_images)
+
+def get_loaders_from_dataset(full_dataset, batch_size=8, val_split=0.2, shuffle=True, random_seed=42):
 
-    full_dataset = PairedOCTDataset(start, n_patients=n_patients, n_images_per_patient=n_images_per_patient)
-    
     dataset_size = len(full_dataset)
     print(f"Dataset size: {dataset_size}")
     val_size = int(val_split * dataset_size)
@@ -94,3 +119,9 @@ def get_paired_loaders(start, n_patients=2, n_images_per_patient=50, batch_size=
     
     return train_loader, val_loader
 
+def get_paired_loaders(start, n_patients=2, n_images_per_patient=50, batch_size=8, 
+                val_split=0.2, shuffle=True, random_seed=42):
+
+    full_dataset = PairedOCTDataset(start, n_patients=n_patients, n_images_per_patient=n_images_per_patient)
+    
+    return get_loaders_from_dataset(full_dataset, batch_size, val_split, shuffle, random_seed)
@@ -2,3 +2,6 @@ from .evaluate_bm3d import *
 from .evaluate_n2_baselines import *
 from .evaluate_pfn import *
 from .evaluate_ssm import *
+from .session import *
+from .cohort import *
+from .result_store import *
@@ -0,0 +1,186 @@
+"""
+Cohort-scale evaluation.
+
+Every patient's image goes through each model in large batches (one model
+after the other, each loaded once through an ``EvaluationSession``), and the
+numpy metrics run in a process pool. Results come back as a long-format
+table with one row per (patient, method, ssm, metric).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+
+from ssm.evaluation.session import EvaluationSession
+from ssm.evaluation.result_store import hash_file, hash_image
+from ssm.inference.streaming import run_denoiser
+from ssm.models.registry import get_model_spec
+from ssm.utils.eval_utils.metrics import evaluate_oct_denoising
+from ssm.utils.profiling import NULL_PROFILER
+
+__all__ = ['stack_cohort', 'denoise_batched', 'compute_cohort_metrics', 'evaluate_cohort', 'summarise_cohort']
+
+N2_METHODS = ('n2n', 'n2s', 'n2v')
+
+def stack_cohort(dataset):
+    """
+    Stacks a ``load_sdoct_dataset`` dict into arrays.
+
+    Returns:
+        tuple: (patient ids, raw images (N, H, W), averaged references (N, H, W))
+    """
+    patient_ids = list(dataset)
+    originals = np.stack([np.asarray(dataset[p]['raw_np'], dtype=np.float32) for p in patient_ids])
+    references = np.stack([np.asarray(dataset[p]['avg_np'], dtype=np.float32) for p in patient_ids])
+    return patient_ids, originals, references
+
+def denoise_batched(model, output_kind, images, batch_size=16, device='cpu', profiler=NULL_PROFILER):
+    """Runs a model over (N, H, W) images in batches and returns the (N, H, W) outputs."""
+    model = model.to(device).eval()
+    outputs = []
+    with torch.inference_mode():
+        for start in range(0, len(images), batch_size):
+            with profiler.stage('data'):
+                x = torch.from_numpy(images[start:start + batch_size, np.newaxis]).to(device)
+            with profiler.stage('forward'):
+                denoised, _ = run_denoiser(model, output_kind, x)
+                outputs.append(denoised[:, 0].float().cpu().numpy())
+            profiler.step()
+    return np.concatenate(outputs)
+
+def _image_metrics(args):
+    original, denoised, reference = args
+    return {name: float(value) for name, value in evaluate_oct_denoising(original, denoised, reference).items()}
+
+def compute_cohort_metrics(originals, denoised, references, pool=None, chunksize=4):
+    """
+    ``evaluate_oct_denoising`` for every image.
+
+    Args:
+        pool (concurrent.futures.Executor): Optional process pool. The work
+            is submitted straight away and the returned iterator yields the
+            results in input order, so the caller can keep the GPU busy in
+            the meantime. Without a pool the metrics run in this process.
+
+    Returns:
+        iterable: One metrics dict per image.
+    """
+    jobs = zip(originals, denoised, references)
+    if pool is None:
+        return [_image_metrics(job) for job in jobs]
+    return pool.map(_image_metrics, jobs, chunksize=chunksize)
+
+def _to_rows(patient_ids, method, ssm, metrics):
+    return [{'patient': patient, 'method': method, 'ssm': ssm, 'metric': name, 'value': value}
+            for patient, patient_metrics in zip(patient_ids, metrics)
+            for name, value in patient_metrics.items()]
+
+def evaluate_cohort(dataset, config_path, override_config=None, methods=N2_METHODS, ssm_options=(False, True),
+                    batch_size=16, n_workers=None, device=None, session=None, store=None, profiler=None):
+    """
+    Evaluates the N2 baselines, with and without the speckle module, on a
+    whole cohort.
+
+    Models run one at a time over all patients in batches of
+    ``batch_size``; the CPU-bound metrics of each model are farmed out to a
+    process pool and overlap with the next model's forward passes. Methods
+    whose checkpoint cannot be loaded, or whose metrics fail, are skipped
+    with a message, like ``evaluate_n2``.
+
+    Args:
+        dataset (dict): Patients from ``load_sdoct_dataset``.
+        config_path (str): N2 config file.
+        methods (tuple): N2 methods to evaluate.
+        ssm_options (tuple): Evaluate without (False) and/or with (True)
+            the speckle module.
+        batch_size (int): Images per forward pass.
+        n_workers (int): Metric worker processes (0 for none).
+        session (EvaluationSession): Optional session whose loaded models
+            are reused.
+        store (ResultStore): Optional result store. Only (checkpoint, image)
+            pairs without stored metrics are denoised and scored, a model
+            whose results are all stored is not even loaded.
+        profiler (StageProfiler): Optional profiler, the stage breakdown of
+            the whole cohort is printed as a single epoch.
+
+    Returns:
+        pd.DataFrame: Long-format table with columns patient, method, ssm,
+        metric, value.
+    """
+    session = session or EvaluationSession(config_path, override_config, device)
+    profiler = profiler or NULL_PROFILER
+    profiler.start()
+    model_name = session.config['training']['model']
+    output_kind = get_model_spec(model_name)['output']
+    patient_ids, originals, references = stack_cohort(dataset)
+
+    if store is not None:
+        # the reference is part of the input, PSNR/SSIM depend on it
+        image_hashes = [hash_image(np.stack([o, r])) for o, r in zip(originals, references)]
+
+    pool = ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) if n_workers != 0 else None
+    pending = []
+    try:
+        for ssm in ssm_options:
+            for method in methods:
+                label = f"{method}{'_ssm' if ssm else ''}"
+                todo = np.arange(len(patient_ids))
+                checkpoint_hash = None
+                try:
+                    if store is not None:
+                        with profiler.stage('result_store'):
+                            checkpoint_hash = hash_file(session.get_checkpoint_path(method, ssm))
+                            missing = set(store.missing(checkpoint_hash, image_hashes))
+                        todo = np.array([i for i, h in enumerate(image_hashes) if h in missing], dtype=np.int64)
+                        print(f"{label}: {len(patient_ids) - len(todo)} of {len(patient_ids)} patients already stored")
+
+                    metrics = []
+                    if len(todo):
+                        with profiler.stage('load_model'):
+                            model, _ = session.get_model(method, ssm)
+                        denoised = denoise_batched(model, output_kind, originals[todo], batch_size, session.device, profiler)
+                        # metrics of this model run in the pool while the next model denoises
+                        metrics = compute_cohort_metrics(originals[todo], denoised, references[todo], pool)
+                        print(f"Denoised {len(todo)} patients with {label}")
+                except Exception as e:
+                    print(f"Error evaluating {label}: {e}")
+                    continue
+
+                pending.append((method, ssm, checkpoint_hash, todo, metrics))
+
+        rows = []
+        for method, ssm, checkpoint_hash, todo, metrics in pending:
+            label = f"{method}{'_ssm' if ssm else ''}"
+            # a failed metric job re-raises here, when its results are consumed
+            try:
+                if store is None:
+                    # waits for the pool
+                    with profiler.stage('metrics'):
+                        rows.extend(_to_rows(patient_ids, method, ssm, metrics))
+                    continue
+
+                with profiler.stage('metrics'):
+                    metrics = list(metrics)
+                with profiler.stage('result_store'):
+                    if metrics:
+                        store.put_many(checkpoint_hash, [image_hashes[i] for i in todo], metrics,
+                                       [patient_ids[i] for i in todo], method=method, model=model_name, ssm=ssm,
+                                       checkpoint_path=session.get_checkpoint_path(method, ssm))
+                    stored = store.get(checkpoint_hash, image_hashes)
+                rows.extend(_to_rows(patient_ids, method, ssm, [stored.get(h, {}) for h in image_hashes]))
+            except Exception as e:
+                print(f"Error computing metrics for {label}: {e}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        profiler.epoch_end('cohort')
+        profiler.stop()
+
+    return pd.DataFrame(rows, columns=['patient', 'method', 'ssm', 'metric', 'value'])
+
+def summarise_cohort(results):
+    """Mean, std and count of every metric per (method, ssm), ignoring NaN and inf."""
+    finite = results[np.isfinite(results['value'])]
+    return finite.groupby(['method', 'ssm', 'metric'])['value'].agg(['mean', 'std', 'count']).reset_index()
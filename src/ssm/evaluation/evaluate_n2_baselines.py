@@ -4,7 +4,17 @@ from ssm.data import get_paired_loaders
 
 import torch
 
-def evaluate_n2(metrics, denoised_images, config_path, eval_override, image=None, reference=None, device = "cuda" if torch.cuda.is_available() else "cpu"):
+def _run_baseline(image, reference, method, config_path, eval_override, session=None, ssm=False):
+    # a session keeps the models loaded between calls, otherwise the checkpoint is loaded every time
+    if session is not None:
+        if ssm:
+            return session.evaluate_ssm_constraint(image, reference, method)
+        return session.evaluate_baseline(image, reference, method)
+    if ssm:
+        return evaluate_ssm_constraint(image, reference, method, config_path, eval_override)
+    return evaluate_baseline(image, reference, method, config_path, eval_override)
+
+def evaluate_n2(metrics, denoised_images, config_path, eval_override, image=None, reference=None, device = "cuda" if torch.cuda.is_available() else "cpu", session=None):
 
     if image is None:
 
@@ -14,7 +24,7 @@ def evaluate_n2(metrics, denoised_images, config_path, eval_override, image=None
     images = []
     try:
         print("Evaluating n2n")
-        n2n_metrics, n2n_denoised = evaluate_baseline(image, reference, "n2n", config_path, eval_override)
+        n2n_metrics, n2n_denoised = _run_baseline(image, reference, "n2n", config_path, eval_override, session)
         if n2n_metrics is None:
             raise ValueError("Metrics for n2n are None")
         else:
@@ -26,7 +36,7 @@ def evaluate_n2(metrics, denoised_images, config_path, eval_override, image=None
         print(f"Error evaluating n2n: {e}")
 
     try:
-        n2s_metrics, n2s_denoised = evaluate_baseline(image, reference, "n2s", config_path, eval_override)
+        n2s_metrics, n2s_denoised = _run_baseline(image, reference, "n2s", config_path, eval_override, session)
         if n2s_metrics is None:
             raise ValueError("Metrics for n2s are None")
         else:
@@ -38,7 +48,7 @@ def evaluate_n2(metrics, denoised_images, config_path, eval_override, image=None
         print(f"Error evaluating n2s: {e}")
 
     try:
-        n2v_metrics, n2v_denoised = evaluate_baseline(image, reference, "n2v", config_path, eval_override)
+        n2v_metrics, n2v_denoised = _run_baseline(image, reference, "n2v", config_path, eval_override, session)
         if n2v_metrics is None:
             raise ValueError("Metrics for n2v are None")
         else:
@@ -51,7 +61,7 @@ def evaluate_n2(metrics, denoised_images, config_path, eval_override, image=None
 
     return metrics, denoised_images
 
-def evaluate_n2_with_ssm(metrics, denoised_images, config_path, eval_override, image=None, reference=None, device = "cuda" if torch.cuda.is_available() else "cpu"):
+def evaluate_n2_with_ssm(metrics, denoised_images, config_path, eval_override, image=None, reference=None, device = "cuda" if torch.cuda.is_available() else "cpu", session=None):
 
     if image is None:
 
@@ -60,7 +70,7 @@ def evaluate_n2_with_ssm(metrics, denoised_images, config_path, eval_override, i
 
     images = []
     try:
-        n2n_metrics, n2n_denoised = evaluate_ssm_constraint(image, reference, "n2n", config_path, eval_override)
+        n2n_metrics, n2n_denoised = _run_baseline(image, reference, "n2n", config_path, eval_override, session, ssm=True)
         if n2n_metrics is None:
             raise ValueError("Metrics for n2s are None")
         else:
@@ -72,7 +82,7 @@ def evaluate_n2_with_ssm(metrics, denoised_images, config_path, eval_override, i
         print(f"Error evaluating n2n with SSM: {e}")
     
     try:
-        n2s_metrics, n2s_denoised = evaluate_ssm_constraint(image, reference, "n2s", config_path, eval_override)
+        n2s_metrics, n2s_denoised = _run_baseline(image, reference, "n2s", config_path, eval_override, session, ssm=True)
         if n2s_metrics is None:
             raise ValueError("Metrics for n2s are None")
         else:
@@ -84,7 +94,7 @@ def evaluate_n2_with_ssm(metrics, denoised_images, config_path, eval_override, i
         print(f"Error evaluating n2s with SSM: {e}")
     
     try:
-        n2v_metrics, n2v_denoised = evaluate_ssm_constraint(image, reference, "n2v", config_path, eval_override)
+        n2v_metrics, n2v_denoised = _run_baseline(image, reference, "n2v", config_path, eval_override, session, ssm=True)
         if n2v_metrics is None:
             raise ValueError("Metrics for n2v are None")
         else:
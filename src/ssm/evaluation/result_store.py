@@ -0,0 +1,146 @@
+"""
+Persistent store of evaluation results.
+
+Metric values are keyed by (checkpoint content hash, input image hash,
+metrics version), so re-running an evaluation only computes combinations
+that are new or whose checkpoint changed. Bump ``METRICS_VERSION`` whenever
+``evaluate_oct_denoising`` changes to invalidate stored values.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['METRICS_VERSION', 'hash_file', 'hash_image', 'ResultStore']
+
+# 2: ROI statistics accumulated with bincount (float32/float64 differences)
+METRICS_VERSION = 2
+
+DEFAULT_STORE_PATH = os.path.join('results', 'evaluation.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    checkpoint_hash TEXT NOT NULL,
+    image_hash TEXT NOT NULL,
+    metrics_version INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    patient TEXT,
+    method TEXT,
+    model TEXT,
+    ssm INTEGER,
+    checkpoint_path TEXT,
+    created_at REAL,
+    PRIMARY KEY (checkpoint_hash, image_hash, metrics_version, metric)
+)
+"""
+
+_file_hashes = {}
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content, memoised per (path, size, mtime) for the process."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+def hash_image(image):
+    """SHA-256 of an image's float32 pixels and shape."""
+    image = np.ascontiguousarray(image, dtype=np.float32)
+    digest = hashlib.sha256(str(image.shape).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+class ResultStore:
+    """
+    SQLite table of metric values (default ``results/evaluation.sqlite``).
+
+    Besides the key, every row keeps the labels it was computed for
+    (patient, method, model, ssm, checkpoint path), which is what reports
+    group by.
+    """
+    def __init__(self, path=DEFAULT_STORE_PATH, metrics_version=METRICS_VERSION):
+        self.path = path
+        self.metrics_version = metrics_version
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    def get(self, checkpoint_hash, image_hashes):
+        """Stored metrics for one checkpoint, as {image hash: {metric: value}} for the hashes found."""
+        image_hashes = list(image_hashes)
+        results = {}
+        # stay below SQLite's limit on query parameters
+        for start in range(0, len(image_hashes), 500):
+            chunk = image_hashes[start:start + 500]
+            rows = self._connection.execute(
+                f"SELECT image_hash, metric, value FROM results WHERE checkpoint_hash = ? AND metrics_version = ? "
+                f"AND image_hash IN ({','.join('?' * len(chunk))})",
+                [checkpoint_hash, self.metrics_version, *chunk])
+            for image_hash, metric, value in rows:
+                results.setdefault(image_hash, {})[metric] = np.nan if value is None else value
+        return results
+
+    def missing(self, checkpoint_hash, image_hashes):
+        """Image hashes without stored results for this checkpoint."""
+        found = self.get(checkpoint_hash, image_hashes)
+        return [h for h in image_hashes if h not in found]
+
+    def put(self, checkpoint_hash, image_hash, metrics, patient=None, **labels):
+        """Stores one image's metrics dict (replacing earlier values for the same key)."""
+        self.put_many(checkpoint_hash, [image_hash], [metrics], [patient], **labels)
+
+    def put_many(self, checkpoint_hash, image_hashes, metrics, patients=None, method=None, model=None, ssm=None, checkpoint_path=None):
+        """Stores the metrics dicts of several images of one checkpoint in a single transaction."""
+        now = time.time()
+        patients = patients or [None] * len(image_hashes)
+        # sqlite stores NaN as NULL, inf is kept
+        rows = [(checkpoint_hash, image_hash, self.metrics_version, metric,
+                 None if np.isnan(value) else float(value), patient, method, model,
+                 None if ssm is None else int(ssm), checkpoint_path, now)
+                for image_hash, image_metrics, patient in zip(image_hashes, metrics, patients)
+                for metric, value in image_metrics.items()]
+        with self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def to_dataframe(self, latest=True, all_versions=False):
+        """
+        Stored results as a long-format table (patient, method, ssm, metric,
+        value, model, checkpoint_path, ...).
+
+        Args:
+            latest (bool): Keep only the most recent checkpoint's value per
+                (patient, method, model, ssm, metric), so retrained models
+                replace their earlier results.
+            all_versions (bool): Include values of older metrics versions.
+        """
+        query = "SELECT * FROM results"
+        params = []
+        if not all_versions:
+            query += " WHERE metrics_version = ?"
+            params.append(self.metrics_version)
+        df = pd.read_sql_query(query, self._connection, params=params)
+        df['ssm'] = df['ssm'].astype('boolean')
+        if latest:
+            df = df.sort_values('created_at').drop_duplicates(
+                ['patient', 'method', 'model', 'ssm', 'metric'], keep='last').sort_index()
+        return df.reset_index(drop=True)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,93 @@
+import copy
+
+import torch
+
+from ssm.utils.config import get_config
+from ssm.utils.eval_utils.evaluate import evaluate
+from ssm.models.registry import build_model
+from ssm.schemas.components.evaluate_baselines import get_checkpoint_path
+
+# keeps the star import in ssm.evaluation from shadowing evaluate_ssm.evaluate
+__all__ = ['EvaluationSession']
+
+class EvaluationSession:
+    """
+    Parses the evaluation config once and keeps every loaded model in memory,
+    so evaluating many patients loads each checkpoint a single time.
+
+    Models are cached per (method, model, ssm, checkpoint variant). The
+    ``evaluate_baseline`` / ``evaluate_ssm_constraint`` methods return the
+    same (metrics, denoised) as the functions of the same name in
+    ``ssm.schemas.components.evaluate_baselines``.
+
+    Args:
+        config_path (str): N2 config file.
+        override_config (dict): Optional config overrides.
+        device (str): Device for the models, defaults to ``training.device``.
+    """
+    def __init__(self, config_path, override_config=None, device=None):
+        self.config = get_config(config_path, override_config)
+        self.device = device or self.config['training']['device']
+        self.verbose = self.config['training']['verbose']
+        self._models = {}
+
+    def get_config(self, method, ssm=False):
+        """Copy of the session config set up for one method, with or without the speckle module."""
+        config = copy.deepcopy(self.config)
+        config['training']['method'] = method
+        config['training']['device'] = self.device
+        if ssm:
+            config['speckle_module']['use'] = True
+        return config
+
+    def get_checkpoint_path(self, method, ssm=False, last=False, best=False):
+        return get_checkpoint_path(self.get_config(method, ssm), last, best)
+
+    def get_model(self, method, ssm=False, last=False, best=False):
+        """
+        Returns (model, checkpoint info) for a method, loading the checkpoint
+        only on first use. The info holds the checkpoint entries other than
+        the state dicts (epoch, best_val_loss, ...).
+        """
+        config = self.get_config(method, ssm)
+        model_name = config['training']['model']
+        checkpoint_path = self.get_checkpoint_path(method, ssm, last, best)
+
+        key = (method, model_name, config['speckle_module']['use'], checkpoint_path)
+        if key not in self._models:
+            print(f"Loading {method} {model_name}{' with SSM' if ssm else ''} from {checkpoint_path}")
+            checkpoint = torch.load(checkpoint_path, map_location=self.device)
+            model = build_model(model_name).to(self.device)
+            model.load_state_dict(checkpoint['model_state_dict'])
+            model.eval()
+
+            info = {k: v for k, v in checkpoint.items() if not k.endswith('state_dict')}
+            if self.verbose:
+                print(f"Epoch: {info.get('epoch')}, Loss: {info.get('best_val_loss')}")
+            self._models[key] = (model, info)
+
+        return self._models[key]
+
+    def _evaluate(self, image, reference, method, ssm, last, best):
+        model, info = self.get_model(method, ssm, last, best)
+        metrics, denoised = evaluate(image, reference, model, method)
+
+        metrics['epochs'] = info['epoch']
+        metrics['loss'] = info['best_val_loss']
+        metrics['model'] = str(model)
+        return metrics, denoised
+
+    def evaluate_baseline(self, image, reference, method, last=False, best=False):
+        return self._evaluate(image, reference, method, False, last, best)
+
+    def evaluate_ssm_constraint(self, image, reference, method, last=False, best=False):
+        return self._evaluate(image, reference, method, True, last, best)
+
+    def loaded_models(self):
+        return list(self._models)
+
+    def clear(self):
+        """Drops all cached models (and frees their GPU memory)."""
+        self._models.clear()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
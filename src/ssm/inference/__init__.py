@@ -0,0 +1,54 @@
+import importlib
+
+# Attributes are imported on first access (PEP 562), like ssm.models, so that
+# `import ssm.inference.backends` on a deployment node only needs numpy and
+# the runtime of the chosen backend, not torch, cv2 and the model registry
+# that export and streaming import.
+_LAZY_ATTRIBUTES = {
+    'InferenceBackend': '.backends',
+    'EagerBackend': '.backends',
+    'TorchScriptBackend': '.backends',
+    'OnnxRuntimeBackend': '.backends',
+    'load_backend': '.backends',
+    'compare_backends': '.backends',
+    'benchmark_latency': '.backends',
+    'SSM_OUTPUT_NAMES': '.export',
+    'DictOutputWrapper': '.export',
+    'FirstTargetWrapper': '.export',
+    'load_model': '.export',
+    'get_export_module': '.export',
+    'export_torchscript': '.export',
+    'export_onnx': '.export',
+    'export_model': '.export',
+    'IMAGE_EXTENSIONS': '.streaming',
+    'OUTPUT_FORMATS': '.streaming',
+    'list_bscan_files': '.streaming',
+    'count_bscans': '.streaming',
+    'iter_bscans': '.streaming',
+    'preprocess_bscan': '.streaming',
+    'iter_batches': '.streaming',
+    'ReadAhead': '.streaming',
+    'TiffVolumeWriter': '.streaming',
+    'NpyVolumeWriter': '.streaming',
+    'open_volume_writer': '.streaming',
+    'run_denoiser': '.streaming',
+    'denoise_volume': '.streaming',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    try:
+        return importlib.import_module(f".{name}", __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f"{__name__}.{name}":
+            raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -0,0 +1,140 @@
+"""
+Inference backends for exported denoisers.
+
+This module only needs numpy plus torch (eager / TorchScript) or onnxruntime
+(ONNX) and does not import any other part of ssm, so deployment nodes can
+run denoising without the training stack.
+"""
+import os
+import json
+import time
+
+import numpy as np
+
+class InferenceBackend:
+    """
+    Runs a denoiser on a float32 batch of shape (B, 1, H, W).
+
+    ``__call__`` returns an array for single-output models and a dict
+    (output name -> array) for the speckle separation models, mirroring the
+    dict they return in PyTorch.
+    """
+    name = 'base'
+
+    def __init__(self, output_names=None):
+        self.output_names = list(output_names) if output_names else ['output']
+
+    def run(self, x):
+        raise NotImplementedError
+
+    def _format(self, outputs):
+        if len(self.output_names) == 1:
+            return outputs[0]
+        return dict(zip(self.output_names, outputs))
+
+    def __call__(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        return self._format(self.run(x))
+
+class EagerBackend(InferenceBackend):
+    name = 'eager'
+
+    def __init__(self, model, output_names=None, device='cpu'):
+        import torch
+        super(EagerBackend, self).__init__(output_names)
+        self._torch = torch
+        self.device = device
+        self.model = model.to(device).eval()
+
+    def run(self, x):
+        torch = self._torch
+        with torch.inference_mode():
+            outputs = self.model(torch.from_numpy(x).to(self.device))
+        if isinstance(outputs, dict):
+            outputs = [outputs[name] for name in self.output_names]
+        elif isinstance(outputs, (list, tuple)):
+            outputs = list(outputs)
+        else:
+            outputs = [outputs]
+        return [o.detach().cpu().numpy() for o in outputs]
+
+class TorchScriptBackend(EagerBackend):
+    name = 'torchscript'
+
+    def __init__(self, path, output_names=None, device='cpu'):
+        import torch
+        extra_files = {'output_names.json': ''}
+        model = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        if output_names is None and extra_files['output_names.json']:
+            output_names = json.loads(extra_files['output_names.json'])
+        super(TorchScriptBackend, self).__init__(model, output_names, device)
+
+class OnnxRuntimeBackend(InferenceBackend):
+    name = 'onnxruntime'
+
+    def __init__(self, path, intra_op_threads=None, providers=('CPUExecutionProvider',)):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        self.session = ort.InferenceSession(path, sess_options=options, providers=list(providers))
+        self.input_name = self.session.get_inputs()[0].name
+        super(OnnxRuntimeBackend, self).__init__([o.name for o in self.session.get_outputs()])
+
+    def run(self, x):
+        return self.session.run(self.output_names, {self.input_name: x})
+
+def load_backend(path, backend=None, **kwargs):
+    """
+    Opens an exported model. The backend is picked from the extension unless
+    given: ``.onnx`` -> onnxruntime, ``.ts``/``.pt`` -> torchscript.
+    """
+    if backend is None:
+        backend = 'onnxruntime' if os.path.splitext(path)[1] == '.onnx' else 'torchscript'
+
+    if backend == 'onnxruntime':
+        return OnnxRuntimeBackend(path, **kwargs)
+    elif backend == 'torchscript':
+        return TorchScriptBackend(path, **kwargs)
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+def compare_backends(reference, backend, inputs, atol=1e-4, rtol=1e-3):
+    """
+    Runs both backends on ``inputs`` and returns the max absolute difference
+    per output plus whether every output is within tolerance.
+    """
+    expected = reference(inputs)
+    actual = backend(inputs)
+    if not isinstance(expected, dict):
+        expected, actual = {'output': expected}, {'output': actual}
+
+    result = {'match': True}
+    for name in expected:
+        result[name] = float(np.max(np.abs(expected[name] - actual[name])))
+        if not np.allclose(expected[name], actual[name], atol=atol, rtol=rtol):
+            result['match'] = False
+    return result
+
+def benchmark_latency(backend, inputs, n_warmup=3, n_runs=20):
+    """Returns median / p90 latency in ms and throughput in images/s."""
+    for _ in range(n_warmup):
+        backend(inputs)
+
+    timings = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        backend(inputs)
+        timings.append(time.perf_counter() - start)
+
+    timings = np.array(timings) * 1000
+    median = float(np.median(timings))
+    return {
+        'backend': backend.name,
+        'median_ms': median,
+        'p90_ms': float(np.percentile(timings, 90)),
+        'images_per_s': inputs.shape[0] / (median / 1000),
+    }
@@ -0,0 +1,133 @@
+import os
+import json
+
+import torch
+import torch.nn as nn
+
+from ssm.models.registry import build_model, get_model_spec
+
+SSM_OUTPUT_NAMES = ['flow_component', 'noise_component']
+
+class DictOutputWrapper(nn.Module):
+    """Returns the dict outputs of the speckle separation models as a tuple
+    in ``output_names`` order, which is what tracing and ONNX need. Heads
+    that are not in ``output_names`` are not part of the exported graph."""
+    def __init__(self, model, output_names=SSM_OUTPUT_NAMES):
+        super(DictOutputWrapper, self).__init__()
+        self.model = model
+        self.output_names = list(output_names)
+
+    def forward(self, x):
+        outputs = self.model(x, outputs=self.output_names)
+        return tuple(outputs[name] for name in self.output_names)
+
+class FirstTargetWrapper(nn.Module):
+    """Exports the progressive fusion models for a single target at the input size."""
+    def __init__(self, model):
+        super(FirstTargetWrapper, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x, n_targets=1, target_size=x.shape[-2:])[0]
+
+def load_model(model_name, checkpoint_path=None, device='cpu'):
+    """Builds ``model_name`` and loads ``model_state_dict`` from a training checkpoint if given."""
+
+    model = build_model(model_name)
+    if checkpoint_path:
+        checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+        model.load_state_dict(checkpoint['model_state_dict'])
+    return model.to(device).eval()
+
+def get_export_module(model, model_name):
+    """
+    Wraps ``model`` so it takes one image batch and returns a tensor or a tuple
+    of tensors. Returns the wrapped module and its output names.
+    """
+    output_kind = get_model_spec(model_name)['output']
+
+    if output_kind == 'dict':
+        return DictOutputWrapper(model).eval(), list(SSM_OUTPUT_NAMES)
+    elif output_kind == 'list':
+        return FirstTargetWrapper(model).eval(), ['output']
+    else:
+        return model.eval(), ['output']
+
+def export_torchscript(model, path, example_input, output_names=('output',)):
+    """Traces ``model`` and saves it with the output names as an extra file."""
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_input, check_trace=False)
+    traced = torch.jit.freeze(traced.eval())
+
+    extra_files = {'output_names.json': json.dumps(list(output_names))}
+    torch.jit.save(traced, path, _extra_files=extra_files)
+    return path
+
+def export_onnx(model, path, example_input, output_names=('output',), opset_version=17, dynamic_batch=True):
+
+    dynamic_axes = None
+    if dynamic_batch:
+        dynamic_axes = {'input': {0: 'batch'}}
+        dynamic_axes.update({name: {0: 'batch'} for name in output_names})
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            example_input,
+            path,
+            input_names=['input'],
+            output_names=list(output_names),
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+            do_constant_folding=True,
+        )
+    return path
+
+def export_model(model_name, checkpoint_path=None, output_dir='exports', formats=('torchscript', 'onnx'),
+                 input_shape=(1, 1, 256, 256), model=None):
+    """
+    Exports a trained model for deployment.
+
+    Args:
+        model_name (str): Name in the model registry.
+        checkpoint_path (str): Training checkpoint with ``model_state_dict``.
+            Without it the model is exported with random weights.
+        output_dir (str): Directory for ``<model_name>.ts`` / ``<model_name>.onnx``.
+        formats (tuple): Any of "torchscript", "onnx".
+        input_shape (tuple): Example input shape used for tracing. Height and
+            width are fixed by the trace, the batch size is not.
+        model (nn.Module): Already loaded model to export instead of loading
+            ``checkpoint_path``.
+
+    Returns:
+        dict: format -> exported path, plus "metadata" -> json path.
+    """
+    if model is None:
+        model = load_model(model_name, checkpoint_path)
+    module, output_names = get_export_module(model.cpu().eval(), model_name)
+    example_input = torch.rand(*input_shape)
+
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, model_name)
+
+    paths = {}
+    if 'torchscript' in formats:
+        paths['torchscript'] = export_torchscript(module, base_path + '.ts', example_input, output_names)
+    if 'onnx' in formats:
+        paths['onnx'] = export_onnx(module, base_path + '.onnx', example_input, output_names)
+
+    metadata = {
+        'model_name': model_name,
+        'checkpoint_path': checkpoint_path,
+        'input_shape': list(input_shape),
+        'output_names': output_names,
+    }
+    paths['metadata'] = base_path + '.json'
+    with open(paths['metadata'], 'w') as f:
+        json.dump(metadata, f, indent=4)
+
+    for fmt, path in paths.items():
+        print(f"Exported {model_name} ({fmt}) to {path}")
+
+    return paths
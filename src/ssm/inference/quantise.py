@@ -0,0 +1,190 @@
+import io
+import copy
+import time
+
+import numpy as np
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+def _set_quantized_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError(f"No quantized engine available, supported: {engines}")
+
+def get_calibration_batches(start=1, n_patients=2, n_images_per_patient=10, batch_size=8, max_batches=None):
+    """
+    Draws calibration inputs from the paired OCT dataset as (B, 1, H, W) batches.
+    Only the noisy inputs are used.
+    """
+    from ssm.data.paired_dataset import PairedOCTDataset
+
+    dataset = PairedOCTDataset(start, n_patients=n_patients, n_images_per_patient=n_images_per_patient)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False)
+
+    batches = []
+    for i, (input_imgs, _) in enumerate(loader):
+        if max_batches is not None and i >= max_batches:
+            break
+        batches.append(input_imgs)
+    return batches
+
+def _calibrate(model, calibration_batches):
+    with torch.no_grad():
+        for batch in calibration_batches:
+            model(batch)
+
+def _quantise_fx(model, calibration_batches):
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    example_inputs = (calibration_batches[0],)
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs)
+    _calibrate(prepared, calibration_batches)
+    return convert_fx(prepared)
+
+def _quantise_submodules(model, calibration_batches, min_params=1000):
+    """
+    Fallback for models that cannot be traced as a whole: every child is
+    quantised on its own where possible, with (de)quantisation at its
+    boundaries. Inputs for each child are recorded with forward hooks.
+    """
+    quantised = []
+
+    def visit(module, prefix):
+        for name, child in module.named_children():
+            full_name = f"{prefix}{name}"
+            n_params = sum(p.numel() for p in child.parameters())
+            if n_params < min_params:
+                continue
+
+            inputs = []
+            handle = child.register_forward_hook(lambda m, args, out: inputs.append(args))
+            _calibrate(model, calibration_batches)
+            handle.remove()
+
+            if not inputs or any(len(args) != 1 or not torch.is_tensor(args[0]) for args in inputs):
+                visit(child, full_name + '.')
+                continue
+
+            try:
+                qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+                prepared = prepare_fx(child, qconfig_mapping, inputs[0])
+                _calibrate(prepared, [args[0] for args in inputs])
+                setattr(module, name, convert_fx(prepared))
+                quantised.append(full_name)
+            except Exception:
+                visit(child, full_name + '.')
+
+    visit(model, '')
+    return quantised
+
+def quantise_model(model, calibration_batches):
+    """
+    Static post-training int8 quantisation with FX graph mode.
+
+    The whole model is traced if possible. Otherwise traceable submodules are
+    quantised individually and the rest stays in fp32.
+
+    Args:
+        model (nn.Module): fp32 model, left untouched.
+        calibration_batches (list): Input batches for observer calibration.
+
+    Returns:
+        tuple: (quantised model, list of quantised module names, "" meaning the
+        whole model)
+    """
+    _set_quantized_engine()
+    model = copy.deepcopy(model).cpu().eval()
+
+    try:
+        return _quantise_fx(model, calibration_batches), ['']
+    except Exception as e:
+        print(f"Whole model is not traceable ({type(e).__name__}: {e}), quantising submodules")
+
+    quantised = _quantise_submodules(model, calibration_batches)
+    if not quantised:
+        raise RuntimeError("No submodule could be quantised")
+    return model, quantised
+
+def model_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes / 1024**2
+
+def measure_latency(model, batch, n_warmup=2, n_runs=10):
+    with torch.inference_mode():
+        for _ in range(n_warmup):
+            model(batch)
+        timings = []
+        for _ in range(n_runs):
+            start = time.perf_counter()
+            model(batch)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+def compare_quantised(fp32_model, int8_model, images, references=None, latency_batch=None, output_kind='tensor'):
+    """
+    Reports quality deltas (int8 - fp32) using ``evaluate_oct_denoising``
+    together with latency and size.
+
+    Args:
+        images (torch.Tensor): (N, 1, H, W) noisy evaluation images.
+        references (torch.Tensor): Optional (N, 1, H, W) references for
+            PSNR/SSIM, e.g. the paired frame or an averaged scan.
+        latency_batch (torch.Tensor): Batch to time, defaults to ``images[:8]``.
+        output_kind (str): Output kind from the model registry. The metrics
+            are computed on the denoised image, ``x - noise_component`` for
+            the speckle separation models.
+
+    Returns:
+        dict: fp32 and int8 metric means, their deltas, the PSNR of the int8
+        output against the fp32 output, latencies (ms) and sizes (MB).
+    """
+    from ssm.utils.eval_utils.metrics import evaluate_oct_denoising, calculate_psnr
+    from ssm.inference.streaming import run_denoiser
+
+    fp32_model = fp32_model.cpu().eval()
+    int8_model = int8_model.eval()
+
+    fp32_metrics, int8_metrics, fidelity = [], [], []
+    with torch.inference_mode():
+        for i in range(images.shape[0]):
+            image = images[i:i + 1]
+            original = image[0, 0].numpy()
+            reference = references[i, 0].numpy() if references is not None else None
+
+            fp32_out = run_denoiser(fp32_model, output_kind, image)[0][0, 0].numpy()
+            int8_out = run_denoiser(int8_model, output_kind, image)[0][0, 0].numpy()
+
+            fp32_metrics.append(evaluate_oct_denoising(original, fp32_out, reference))
+            int8_metrics.append(evaluate_oct_denoising(original, int8_out, reference))
+            fidelity.append(calculate_psnr(int8_out, fp32_out))
+
+    def mean_metrics(metrics):
+        keys = metrics[0].keys()
+        return {k: float(np.nanmean([m.get(k, np.nan) for m in metrics])) for k in keys}
+
+    fp32_mean = mean_metrics(fp32_metrics)
+    int8_mean = mean_metrics(int8_metrics)
+
+    if latency_batch is None:
+        latency_batch = images[:8]
+    fp32_latency = measure_latency(fp32_model, latency_batch)
+    int8_latency = measure_latency(int8_model, latency_batch)
+    fp32_size = model_size_mb(fp32_model)
+    int8_size = model_size_mb(int8_model)
+
+    return {
+        'fp32': fp32_mean,
+        'int8': int8_mean,
+        'delta': {k: int8_mean[k] - fp32_mean[k] for k in fp32_mean},
+        'int8_vs_fp32_psnr': float(np.mean(fidelity)),
+        'fp32_latency_ms': fp32_latency,
+        'int8_latency_ms': int8_latency,
+        'speedup': fp32_latency / int8_latency,
+        'fp32_size_mb': fp32_size,
+        'int8_size_mb': int8_size,
+        'size_reduction': fp32_size / int8_size,
+    }
@@ -0,0 +1,277 @@
+"""
+Local HTTP inference server with dynamic batching.
+
+Requests carry a single B-scan as .npy bytes and are answered with an .npz
+holding ``denoised`` and, if asked for, ``flow``. Concurrent requests for the
+same model are coalesced into one batch within ``max_wait_ms``.
+
+Endpoints:
+    POST /denoise?model=<name>&flow=1   body: .npy of an (H, W) float image
+    GET  /stats                         throughput and latency counters
+    GET  /health                        loaded models
+"""
+import io
+import json
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from urllib.request import Request, urlopen
+
+import numpy as np
+import torch
+
+from ssm.inference.export import load_model
+from ssm.inference.streaming import preprocess_bscan, run_denoiser
+from ssm.models.registry import get_model_spec
+
+class ServerStats:
+    """Thread-safe request, batch and latency counters."""
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.start_time = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_images = 0
+
+    def record_batch(self, batch_size):
+        with self._lock:
+            self.batches += 1
+            self.batched_images += batch_size
+
+    def record_request(self, latency_s, ok=True):
+        """Failed requests only count as errors, their latency is not recorded."""
+        with self._lock:
+            if not ok:
+                self.errors += 1
+                return
+            self.requests += 1
+            self._latencies.append(latency_s * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            uptime = time.time() - self.start_time
+            return {
+                'uptime_s': uptime,
+                'requests': self.requests,
+                'errors': self.errors,
+                'batches': self.batches,
+                'mean_batch_size': self.batched_images / self.batches if self.batches else 0.0,
+                'requests_per_s': self.requests / uptime if uptime > 0 else 0.0,
+                'latency_ms': {
+                    'p50': float(np.percentile(latencies, 50)),
+                    'p90': float(np.percentile(latencies, 90)),
+                    'p99': float(np.percentile(latencies, 99)),
+                    'max': float(latencies.max()),
+                },
+            }
+
+class DynamicBatcher:
+    """
+    Collects single B-scan requests for one model and runs them as one batch
+    once ``max_batch_size`` requests are queued or the oldest request has
+    waited ``max_wait_ms``.
+    """
+    def __init__(self, model, output_kind, max_batch_size=8, max_wait_ms=10, device='cpu', flow_model=None, stats=None):
+        self.model = model.to(device).eval()
+        self.output_kind = output_kind
+        self.flow_model = flow_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.device = device
+        self.stats = stats
+        self._queue = queue.Queue()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, flow=False):
+        """Queues a preprocessed (H, W) image, the future resolves to a dict of arrays."""
+        future = Future()
+        self._queue.put((image, flow, future))
+        return future
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                break
+
+            images, flows, futures = zip(*batch)
+            try:
+                x = torch.from_numpy(np.stack(images)[:, np.newaxis]).to(self.device)
+                flow_model = self.flow_model if any(flows) else None
+                with torch.inference_mode():
+                    denoised, flow = run_denoiser(self.model, self.output_kind, x, flow_model)
+                denoised = denoised.cpu().numpy()
+                flow = flow.cpu().numpy() if flow is not None else None
+
+                for i, (want_flow, future) in enumerate(zip(flows, futures)):
+                    result = {'denoised': denoised[i, 0]}
+                    if want_flow and flow is not None:
+                        result['flow'] = flow[i, 0]
+                    future.set_result(result)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+
+            if self.stats is not None:
+                self.stats.record_batch(len(batch))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+class InferenceServer(ThreadingHTTPServer):
+    """
+    Keeps every requested model loaded and warmed up behind its own batcher.
+
+    Args:
+        models (dict): Registry model name -> checkpoint path (or None).
+        ssm_checkpoint (str): Optional SpeckleSeparationUNetAttention
+            checkpoint used for ``flow=1`` on baseline models.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, models, ssm_checkpoint=None, max_batch_size=8, max_wait_ms=10, device='cpu', size=256):
+        super(InferenceServer, self).__init__(address, InferenceRequestHandler)
+        self.size = size
+        self.stats = ServerStats()
+
+        flow_model = None
+        if ssm_checkpoint:
+            flow_model = load_model('SpeckleSeparationUNetAttention', ssm_checkpoint, device)
+
+        self.batchers = {}
+        for model_name, checkpoint_path in models.items():
+            output_kind = get_model_spec(model_name)['output']
+            model = load_model(model_name, checkpoint_path, device)
+            batcher = DynamicBatcher(model, output_kind, max_batch_size, max_wait_ms, device,
+                                     flow_model if output_kind != 'dict' else None, self.stats)
+            # warm up so the first request does not pay for allocation
+            batcher.submit(np.zeros((size, size), dtype=np.float32), flow=True).result()
+            self.batchers[model_name] = batcher
+            print(f"Loaded {model_name} ({output_kind})")
+
+    def server_close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+        super(InferenceServer, self).server_close()
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode())
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self._send_json(200, self.server.stats.snapshot())
+        elif path == '/health':
+            self._send_json(200, {'models': sorted(self.server.batchers)})
+        else:
+            self._send_json(404, {'error': f"Unknown path {path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != '/denoise':
+            self._send_json(404, {'error': f"Unknown path {url.path}"})
+            return
+
+        params = parse_qs(url.query)
+        model_name = params.get('model', [next(iter(self.server.batchers))])[0]
+        want_flow = params.get('flow', ['0'])[0] in ('1', 'true')
+
+        batcher = self.server.batchers.get(model_name)
+        if batcher is None:
+            self._send_json(404, {'error': f"Model {model_name} is not loaded"})
+            return
+
+        # malformed payloads are the client's fault (400), anything the model
+        # or the batcher raises is the server's (500)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            image = np.load(io.BytesIO(self.rfile.read(length)), allow_pickle=False).astype(np.float32)
+            if image.ndim != 2:
+                raise ValueError(f"Expected one (H, W) B-scan, got shape {image.shape}")
+            x = preprocess_bscan(image, self.server.size)
+        except Exception as e:
+            self.server.stats.record_request(time.perf_counter() - start, ok=False)
+            self._send_json(400, {'error': str(e)})
+            return
+
+        try:
+            result = batcher.submit(x, want_flow).result()
+        except Exception as e:
+            self.server.stats.record_request(time.perf_counter() - start, ok=False)
+            self._send_json(500, {'error': str(e)})
+            return
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **result)
+        self._send(200, buffer.getvalue(), 'application/octet-stream')
+        self.server.stats.record_request(time.perf_counter() - start)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(models, host='127.0.0.1', port=8765, ssm_checkpoint=None, max_batch_size=8, max_wait_ms=10, device='cpu', size=256):
+    """Starts the server and blocks until interrupted."""
+    server = InferenceServer((host, port), models, ssm_checkpoint, max_batch_size, max_wait_ms, device, size)
+    print(f"Serving {sorted(models)} on http://{host}:{port} (batch <= {max_batch_size}, window {max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def denoise_remote(url, image, model=None, flow=False, timeout=60):
+    """Client helper: sends one B-scan to a running server and returns the decoded arrays."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(image, dtype=np.float32))
+
+    query = []
+    if model:
+        query.append(f"model={model}")
+    if flow:
+        query.append("flow=1")
+    request = Request(url.rstrip('/') + '/denoise' + ('?' + '&'.join(query) if query else ''),
+                      data=buffer.getvalue(), headers={'Content-Type': 'application/octet-stream'})
+    with urlopen(request, timeout=timeout) as response:
+        with np.load(io.BytesIO(response.read())) as result:
+            return {key: result[key] for key in result.files}
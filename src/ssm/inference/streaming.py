@@ -0,0 +1,259 @@
+"""
+Streaming whole-volume denoising.
+
+B-scans are read lazily from a patient directory or a (multi-page) TIFF
+stack by a read-ahead thread, batched through the model and written to the
+output volumes as soon as each batch is done. At most ``read_ahead`` batches
+are held in memory, independent of the volume size.
+"""
+import os
+import glob
+import time
+import queue
+import threading
+
+import cv2
+import numpy as np
+import torch
+
+from ssm.utils.data_utils.helper import extract_number
+
+IMAGE_EXTENSIONS = ('*.tiff', '*.tif', '*.png', '*.jpg')
+OUTPUT_FORMATS = ('tiff', 'npy')
+
+def list_bscan_files(path):
+    """Image files of a patient directory, ordered by the number in brackets like ``load_patient_data``."""
+    files = []
+    for ext in IMAGE_EXTENSIONS:
+        files.extend(glob.glob(os.path.join(path, ext)))
+    return sorted(files, key=lambda f: (extract_number(os.path.basename(f)), os.path.basename(f)))
+
+def _is_tiff(path):
+    return os.path.splitext(path)[1].lower() in ('.tif', '.tiff')
+
+def count_bscans(path):
+    """Number of B-scans in a directory or TIFF stack, without decoding the images."""
+    import tifffile
+
+    files = list_bscan_files(path) if os.path.isdir(path) else [path]
+    count = 0
+    for file in files:
+        if _is_tiff(file):
+            with tifffile.TiffFile(file) as tif:
+                count += len(tif.pages)
+        else:
+            count += 1
+    return count
+
+def _to_float(img):
+    img = np.asarray(img)
+    if img.ndim == 3:
+        # first channel of RGB(A) / multi-channel images
+        img = img[..., 0] if img.shape[-1] <= 4 else img[0]
+    img = img.astype(np.float32)
+    if img.max() > 1.0:
+        img = img / 255.0
+    return img
+
+def iter_bscans(path):
+    """Yields the B-scans of a patient directory or TIFF stack one at a time as float32 (H, W) arrays."""
+    import tifffile
+    from skimage import io
+
+    files = list_bscan_files(path) if os.path.isdir(path) else [path]
+    if not files:
+        raise FileNotFoundError(f"No B-scans found in {path}")
+
+    for file in files:
+        if _is_tiff(file):
+            with tifffile.TiffFile(file) as tif:
+                for page in tif.pages:
+                    yield _to_float(page.asarray())
+        else:
+            yield _to_float(io.imread(file))
+
+def preprocess_bscan(img, size=256):
+    """Resize and min-max normalise a B-scan like ``standard_preprocessing``."""
+    resized = cv2.resize(img, (size, size), interpolation=cv2.INTER_LINEAR)
+    min_val, max_val = resized.min(), resized.max()
+    if max_val > min_val:
+        return (resized - min_val) / (max_val - min_val)
+    return np.zeros_like(resized)
+
+def iter_batches(path, batch_size=8, size=256):
+    """Yields (B, 1, size, size) float32 batches of preprocessed B-scans."""
+    batch = []
+    for img in iter_bscans(path):
+        batch.append(preprocess_bscan(img, size))
+        if len(batch) == batch_size:
+            yield np.stack(batch)[:, np.newaxis]
+            batch = []
+    if batch:
+        yield np.stack(batch)[:, np.newaxis]
+
+class ReadAhead:
+    """
+    Runs an iterator in a background thread and hands its items over through
+    a queue of at most ``max_items``, so reading and preprocessing overlap
+    with inference without buffering the whole input.
+    """
+    _done = object()
+
+    def __init__(self, iterator, max_items=2):
+        self._queue = queue.Queue(maxsize=max_items)
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(iterator,), daemon=True)
+        self._thread.start()
+
+    def _run(self, iterator):
+        try:
+            for item in iterator:
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop.is_set():
+                    return
+        except Exception as e:
+            self._error = e
+        finally:
+            self._queue.put(self._done)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._done:
+                break
+            yield item
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self._stop.set()
+        # unblock the reader if it is waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+class TiffVolumeWriter:
+    """Appends (B, 1, H, W) batches as pages of a multi-page (Big)TIFF."""
+    def __init__(self, path):
+        import tifffile
+        self.path = path
+        self._writer = tifffile.TiffWriter(path, bigtiff=True)
+        self.n_written = 0
+
+    def write(self, batch):
+        for img in batch[:, 0]:
+            self._writer.write(np.ascontiguousarray(img, dtype=np.float32), contiguous=True)
+        self.n_written += batch.shape[0]
+
+    def close(self):
+        self._writer.close()
+
+class NpyVolumeWriter:
+    """Writes batches into a preallocated .npy memmap of shape (N, H, W)."""
+    def __init__(self, path, n_bscans, size):
+        self.path = path
+        self._volume = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n_bscans, size, size))
+        self.n_written = 0
+
+    def write(self, batch):
+        n = batch.shape[0]
+        self._volume[self.n_written:self.n_written + n] = batch[:, 0]
+        self.n_written += n
+
+    def close(self):
+        self._volume.flush()
+        del self._volume
+
+def open_volume_writer(path, output_format, n_bscans=None, size=256):
+    if output_format == 'tiff':
+        return TiffVolumeWriter(path)
+    elif output_format == 'npy':
+        return NpyVolumeWriter(path, n_bscans, size)
+    raise ValueError(f"Unknown output format: {output_format}, expected one of {OUTPUT_FORMATS}")
+
+def run_denoiser(model, output_kind, x, flow_model=None):
+    """Returns (denoised, flow) for a batch, flow is None if the model has no flow output."""
+    if output_kind == 'dict':
+        outputs = model(x)
+        return x - outputs['noise_component'], outputs['flow_component']
+
+    if output_kind == 'list':
+        denoised = model(x, n_targets=1, target_size=x.shape[-2:])[0]
+    else:
+        denoised = model(x)
+
+    flow = None
+    if flow_model is not None:
+        flow = flow_model(denoised, outputs='flow_component')['flow_component']
+    return denoised, flow
+
+def denoise_volume(model, output_kind, input_path, output_dir, name=None, batch_size=8, size=256,
+                   output_format='tiff', device='cpu', read_ahead=2, flow_model=None):
+    """
+    Denoises every B-scan of ``input_path`` and writes the results incrementally.
+
+    Args:
+        model (nn.Module): Baseline or speckle separation model.
+        output_kind (str): Output kind from the model registry.
+        input_path (str): Patient directory or TIFF stack.
+        output_dir (str): Directory for ``<name>_denoised`` and ``<name>_flow``.
+        name (str): Output prefix, defaults to the input name.
+        output_format (str): "tiff" (multi-page BigTIFF) or "npy" (memmap).
+        read_ahead (int): Batches prepared ahead of the model.
+        flow_model (nn.Module): Optional speckle separation model that
+            produces the flow volume for baseline models.
+
+    Returns:
+        dict: Output paths, number of B-scans, seconds and B-scans/s.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}, expected one of {OUTPUT_FORMATS}")
+
+    model = model.to(device).eval()
+    if flow_model is not None:
+        flow_model = flow_model.to(device).eval()
+
+    name = name or os.path.splitext(os.path.basename(os.path.normpath(input_path)))[0]
+    os.makedirs(output_dir, exist_ok=True)
+    extension = '.tif' if output_format == 'tiff' else '.npy'
+    n_bscans = count_bscans(input_path) if output_format == 'npy' else None
+
+    has_flow = output_kind == 'dict' or flow_model is not None
+    paths = {'denoised': os.path.join(output_dir, f"{name}_denoised{extension}")}
+    if has_flow:
+        paths['flow'] = os.path.join(output_dir, f"{name}_flow{extension}")
+    writers = {key: open_volume_writer(path, output_format, n_bscans, size) for key, path in paths.items()}
+
+    reader = ReadAhead(iter_batches(input_path, batch_size, size), max_items=read_ahead)
+    start_time = time.time()
+    n_done = 0
+    try:
+        with torch.inference_mode():
+            for batch in reader:
+                x = torch.from_numpy(batch).to(device)
+                denoised, flow = run_denoiser(model, output_kind, x, flow_model)
+                writers['denoised'].write(denoised.cpu().numpy())
+                if has_flow:
+                    writers['flow'].write(flow.cpu().numpy())
+                n_done += batch.shape[0]
+                print(f"Denoised {n_done} B-scans", end='\r')
+    finally:
+        reader.close()
+        for writer in writers.values():
+            writer.close()
+
+    elapsed = time.time() - start_time
+    print(f"Denoised {n_done} B-scans in {elapsed:.1f}s ({n_done / max(elapsed, 1e-9):.1f} B-scans/s)")
+    for key, path in paths.items():
+        print(f"  {key}: {path}")
+
+    return {**paths, 'n_bscans': n_done, 'seconds': elapsed, 'bscans_per_s': n_done / max(elapsed, 1e-9)}
@@ -1,15 +1,65 @@
-from .unet.unet import *
+import importlib
 
-from .unet.large_unet_good import *
-from .unet.large_unet import *
-from .unet.prog_custom import *
-from .unet.prog import *
-from .unet.prog_unet import *
-from .unet.unet_2 import *
-from .unet.unet_superres import *
+# Attributes are imported on first access (PEP 562) so that importing one
+# model or helper does not pull in every module of the package. The map
+# mirrors what the former star imports exported.
+_LAZY_ATTRIBUTES = {
+    'UNet': '.unet.unet',
+    'DoubleConv': '.components.components',
+    'Down': '.components.components',
+    'Up': '.components.components',
+    'OutConv': '.components.components',
+    # prog_custom's import of the old class was the last star import to bind it
+    'LargeUNet': '.unet.large_unet_old',
+    'ChannelAttention': '.components.components',
+    'LargeUNetAttention': '.unet.large_unet',
+    'load_unet': '.unet.unet_superres',
+    'LargeUNet2': '.unet.large_unet',
+    'LargeUNet3': '.unet.large_unet',
+    'ProgLargeUNet': '.unet.prog_custom',
+    'load_prog_unet': '.unet.prog_unet',
+    'ProgressiveFusionDynamicUNet': '.unet.prog',
+    'create_progressive_fusion_dynamic_unet': '.unet.prog',
+    'ProgUNet': '.unet.prog_unet',
+    'ResidualBlock': '.unet.unet_superres',
+    'UNet2': '.unet.unet_superres',
+    'SpeckleSeparationModule': '.ssm.ssm',
+    'SpeckleSeparationUNet': '.ssm.ssm',
+    'SpatialAttention': '.ssm.ssm_attention',
+    'SpeckleSeparationUNetAttention': '.ssm.ssm_attention',
+    'get_ssm_model_attention': '.ssm.ssm_attention',
+    'get_ssm_model': '.ssm.ssm_attention',
+    'SimplifiedSpeckleSeparationModel': '.ssm.ssm_attention_simple',
+    'get_ssm_model_simple': '.ssm.ssm_attention_simple',
+    'MODEL_REGISTRY': '.registry',
+    'register_model': '.registry',
+    'list_models': '.registry',
+    'get_model_class': '.registry',
+    'build_model': '.registry',
+    'get_checkpoint_prefix': '.registry',
+    'get_checkpoint_file': '.registry',
+    'find_prunable_blocks': '.pruning',
+    'get_channel_spec': '.pruning',
+    'prune_model': '.pruning',
+    'apply_channel_spec': '.pruning',
+    'load_pruned_model': '.pruning',
+    'search_pruning_ratio': '.pruning',
+}
 
-from .ssm.ssm import *
-from .ssm.ssm_attention import *
-from .ssm.ssm_attention_simple import *
+__all__ = list(_LAZY_ATTRIBUTES)
 
-from .components.components import *
\ No newline at end of file
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    try:
+        return importlib.import_module(f".{name}", __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f"{__name__}.{name}":
+            raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
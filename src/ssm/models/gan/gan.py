@@ -2,13 +2,38 @@ import numpy as np
 import torch.nn as nn
 import torch.nn.functional as F
 import torch
+import torch.utils.checkpoint as checkpoint
+
+NONLOCAL_MODES = ('full', 'sdpa', 'chunked', 'subsample')
 
 class NonLocalBlock(nn.Module):
-    def __init__(self, in_channels, inter_channels=None):
+    """
+    Embedded Gaussian non-local block.
+
+    Args:
+        in_channels: Number of input channels
+        inter_channels: Channels of the query/key/value embeddings (default: in_channels // 2)
+        mode: How the [HW, HW] affinity is computed
+            'full'      - materialises the whole affinity matrix (original behaviour)
+            'sdpa'      - F.scaled_dot_product_attention, same result without the
+                          full matrix when a fused kernel is available
+            'chunked'   - processes ``chunk_size`` queries at a time, same result,
+                          recomputed in backward so training memory is bounded too
+            'subsample' - max-pools phi/g by ``sub_sample`` before attending, as in
+                          the non-local paper. Approximate, the output differs from 'full'
+        chunk_size: Queries per chunk for 'chunked'
+        sub_sample: Pooling factor for 'subsample'
+    """
+    def __init__(self, in_channels, inter_channels=None, mode='full', chunk_size=4096, sub_sample=2):
         super(NonLocalBlock, self).__init__()
         
+        if mode not in NONLOCAL_MODES:
+            raise ValueError(f"Unknown non-local mode: {mode}, expected one of {NONLOCAL_MODES}")
+
         self.in_channels = in_channels
         self.inter_channels = inter_channels
+        self.mode = mode
+        self.chunk_size = chunk_size
         
         if self.inter_channels is None:
             self.inter_channels = in_channels // 2
@@ -20,30 +45,52 @@ class NonLocalBlock(nn.Module):
         self.theta = nn.Conv2d(in_channels, self.inter_channels, kernel_size=1, stride=1, padding=0)
         self.phi = nn.Conv2d(in_channels, self.inter_channels, kernel_size=1, stride=1, padding=0)
         
+        # Key/value pooling, only used by the 'subsample' mode
+        self.pool = nn.MaxPool2d(kernel_size=sub_sample) if mode == 'subsample' else nn.Identity()
+
         # Output transformation
         self.W = nn.Conv2d(self.inter_channels, in_channels, kernel_size=1, stride=1, padding=0)
         self.bn = nn.BatchNorm2d(in_channels)
-        
+
+    @staticmethod
+    def _attend(theta_x, phi_x, g_x):
+        f = torch.matmul(theta_x, phi_x)  # [B, N, M]
+        f_div_C = F.softmax(f, dim=-1)
+        return torch.matmul(f_div_C, g_x)  # [B, N, C//2]
+
+    def _attend_chunked(self, theta_x, phi_x, g_x):
+        chunks = []
+        for start in range(0, theta_x.size(1), self.chunk_size):
+            theta_chunk = theta_x[:, start:start + self.chunk_size]
+            if torch.is_grad_enabled():
+                chunks.append(checkpoint.checkpoint(self._attend, theta_chunk, phi_x, g_x, use_reentrant=False))
+            else:
+                chunks.append(self._attend(theta_chunk, phi_x, g_x))
+        return torch.cat(chunks, dim=1)
+
     def forward(self, x):
         batch_size = x.size(0)
         
-        # g(x): [B, C, H, W] -> [B, C//2, H, W]
-        g_x = self.g(x).view(batch_size, self.inter_channels, -1)  # [B, C//2, H*W]
-        g_x = g_x.permute(0, 2, 1)  # [B, H*W, C//2]
+        # g(x): [B, C, H, W] -> [B, C//2, M] with M = H*W (or pooled for 'subsample')
+        g_x = self.pool(self.g(x)).view(batch_size, self.inter_channels, -1)
+        g_x = g_x.permute(0, 2, 1)  # [B, M, C//2]
         
         # theta(x): [B, C, H, W] -> [B, C//2, H, W]
         theta_x = self.theta(x).view(batch_size, self.inter_channels, -1)  # [B, C//2, H*W]
         theta_x = theta_x.permute(0, 2, 1)  # [B, H*W, C//2]
         
-        # phi(x): [B, C, H, W] -> [B, C//2, H, W]
-        phi_x = self.phi(x).view(batch_size, self.inter_channels, -1)  # [B, C//2, H*W]
-        
-        # Calculate attention map
-        f = torch.matmul(theta_x, phi_x)  # [B, H*W, H*W]
-        f_div_C = F.softmax(f, dim=-1)
+        # phi(x): [B, C, H, W] -> [B, C//2, M]
+        phi_x = self.pool(self.phi(x)).view(batch_size, self.inter_channels, -1)
         
         # Weighted sum using the attention map
-        y = torch.matmul(f_div_C, g_x)  # [B, H*W, C//2]
+        if self.mode == 'sdpa':
+            # no 1/sqrt(d) scaling in the original block
+            y = F.scaled_dot_product_attention(theta_x, phi_x.transpose(1, 2), g_x, scale=1.0)
+        elif self.mode == 'chunked':
+            y = self._attend_chunked(theta_x, phi_x, g_x)
+        else:
+            y = self._attend(theta_x, phi_x, g_x)  # [B, H*W, C//2]
+
         y = y.permute(0, 2, 1).contiguous()  # [B, C//2, H*W]
         y = y.view(batch_size, self.inter_channels, *x.size()[2:])  # [B, C//2, H, W]
         
@@ -56,8 +103,12 @@ class NonLocalBlock(nn.Module):
 
 # Generator Network (with Nonlocal blocks)
 class Generator(nn.Module):
-    def __init__(self, in_channels=1, out_channels=1, features=64):
+    def __init__(self, in_channels=1, out_channels=1, features=64, nonlocal_mode='full'):
         super(Generator, self).__init__()
+
+        # one mode for both blocks or a (nonlocal1, nonlocal2) pair
+        if isinstance(nonlocal_mode, str):
+            nonlocal_mode = (nonlocal_mode, nonlocal_mode)
         
         # Encoder
         self.enc1 = nn.Sequential(
@@ -84,8 +135,8 @@ class Generator(nn.Module):
         )  # [B, 512, H/16, W/16]
         
         # NonLocal blocks
-        self.nonlocal1 = NonLocalBlock(features * 8)
-        self.nonlocal2 = NonLocalBlock(features * 4)
+        self.nonlocal1 = NonLocalBlock(features * 8, mode=nonlocal_mode[0])
+        self.nonlocal2 = NonLocalBlock(features * 4, mode=nonlocal_mode[1])
         
         # Decoder
         self.dec1 = nn.Sequential(
@@ -0,0 +1,198 @@
+import copy
+import json
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Structured pruning of the UNet family. Only the inner (mid) channels of a
+# DoubleConv are removed: conv1 loses output channels, bn1 the matching
+# entries and conv2 the matching input channels. The block's input and output
+# widths stay the same, so skip connections and concatenations are untouched
+# and any model built from DoubleConv blocks can be pruned.
+
+def find_prunable_blocks(model):
+    """Returns (name, block) for every DoubleConv-style block of ``model``."""
+    blocks = []
+    for name, module in model.named_modules():
+        layers = getattr(module, 'double_conv', None)
+        if (isinstance(layers, nn.Sequential) and len(layers) >= 4
+                and isinstance(layers[0], nn.Conv2d)
+                and isinstance(layers[1], nn.BatchNorm2d)
+                and isinstance(layers[3], nn.Conv2d)):
+            blocks.append((name, module))
+    return blocks
+
+def get_channel_spec(model):
+    """Mid channel width of every prunable block, e.g. ``{'inc': 32, 'up1.conv': 512}``."""
+    return {name: block.double_conv[0].out_channels for name, block in find_prunable_blocks(model)}
+
+def bn_scores(model):
+    """Ranks the mid channels of each block by the absolute BatchNorm scale."""
+    return {name: block.double_conv[1].weight.detach().abs().cpu() for name, block in find_prunable_blocks(model)}
+
+def activation_scores(model, batches, device='cpu'):
+    """
+    Ranks the mid channels of each block by their mean post-ReLU activation
+    over ``batches`` of (B, 1, H, W) inputs, e.g. from the paired dataset.
+    """
+    sums = {}
+    handles = []
+
+    def hook(name):
+        def record(module, inputs, output):
+            sums[name] = sums.get(name, 0) + output.detach().clamp(min=0).mean(dim=(0, 2, 3)).cpu()
+        return record
+
+    for name, block in find_prunable_blocks(model):
+        handles.append(block.double_conv[1].register_forward_hook(hook(name)))
+
+    model.eval()
+    with torch.no_grad():
+        for batch in batches:
+            model(batch.to(device))
+
+    for handle in handles:
+        handle.remove()
+
+    return {name: total / len(batches) for name, total in sums.items()}
+
+def _keep_count(n_channels, ratio, min_channels=8, multiple=8):
+    keep = int(round(n_channels * (1 - ratio) / multiple)) * multiple
+    return int(min(n_channels, max(min_channels, keep)))
+
+def prune_double_conv(block, keep_idx):
+    """Keeps only the mid channels ``keep_idx`` of a DoubleConv block, in place."""
+    layers = block.double_conv
+    conv1, bn1, conv2 = layers[0], layers[1], layers[3]
+    keep_idx = torch.as_tensor(keep_idx, dtype=torch.long, device=conv1.weight.device)
+    n_keep = len(keep_idx)
+
+    new_conv1 = nn.Conv2d(conv1.in_channels, n_keep, conv1.kernel_size, conv1.stride, conv1.padding,
+                          conv1.dilation, conv1.groups, conv1.bias is not None).to(conv1.weight.device)
+    new_conv1.weight.data = conv1.weight.data[keep_idx].clone()
+    if conv1.bias is not None:
+        new_conv1.bias.data = conv1.bias.data[keep_idx].clone()
+
+    new_bn1 = nn.BatchNorm2d(n_keep, bn1.eps, bn1.momentum, bn1.affine, bn1.track_running_stats).to(conv1.weight.device)
+    if bn1.affine:
+        new_bn1.weight.data = bn1.weight.data[keep_idx].clone()
+        new_bn1.bias.data = bn1.bias.data[keep_idx].clone()
+    if bn1.track_running_stats:
+        new_bn1.running_mean = bn1.running_mean[keep_idx].clone()
+        new_bn1.running_var = bn1.running_var[keep_idx].clone()
+        new_bn1.num_batches_tracked = bn1.num_batches_tracked.clone()
+
+    new_conv2 = nn.Conv2d(n_keep, conv2.out_channels, conv2.kernel_size, conv2.stride, conv2.padding,
+                          conv2.dilation, conv2.groups, conv2.bias is not None).to(conv2.weight.device)
+    new_conv2.weight.data = conv2.weight.data[:, keep_idx].clone()
+    if conv2.bias is not None:
+        new_conv2.bias.data = conv2.bias.data.clone()
+
+    layers[0], layers[1], layers[3] = new_conv1, new_bn1, new_conv2
+    return block
+
+def prune_model(model, ratio, scores=None, min_channels=8):
+    """
+    Returns a pruned copy of ``model`` with ``ratio`` of the mid channels of
+    every block removed (widths are rounded to multiples of 8).
+
+    Args:
+        model (nn.Module): Model to prune, left untouched.
+        ratio (float): Fraction of channels to remove, in [0, 1).
+        scores (dict): Block name -> channel scores, defaults to ``bn_scores``.
+        min_channels (int): Smallest width a block is pruned to.
+
+    Returns:
+        tuple: (pruned model, channel spec)
+    """
+    if not 0 <= ratio < 1:
+        raise ValueError(f"Pruning ratio must be in [0, 1), got {ratio}")
+
+    pruned = copy.deepcopy(model)
+    if scores is None:
+        scores = bn_scores(pruned)
+
+    for name, block in find_prunable_blocks(pruned):
+        n_channels = block.double_conv[0].out_channels
+        n_keep = _keep_count(n_channels, ratio, min_channels)
+        if n_keep >= n_channels:
+            continue
+        keep_idx = torch.sort(torch.topk(scores[name], n_keep).indices).values
+        prune_double_conv(block, keep_idx)
+
+    return pruned, get_channel_spec(pruned)
+
+def apply_channel_spec(model, spec):
+    """Shrinks ``model`` in place to the widths of a saved channel spec so a pruned state dict can be loaded."""
+
+    blocks = dict(find_prunable_blocks(model))
+    missing = set(spec) - set(blocks)
+    if missing:
+        raise ValueError(f"Channel spec does not match the model, unknown blocks: {sorted(missing)}")
+
+    for name, n_channels in spec.items():
+        if blocks[name].double_conv[0].out_channels != n_channels:
+            prune_double_conv(blocks[name], torch.arange(n_channels))
+    return model
+
+def save_channel_spec(spec, path):
+    with open(path, 'w') as f:
+        json.dump(spec, f, indent=4)
+
+def load_pruned_model(model_name, checkpoint_path, spec_path, device='cpu'):
+    """Builds a registered model, applies the channel spec and loads the pruned checkpoint."""
+    from ssm.models.registry import build_model
+
+    with open(spec_path) as f:
+        spec = json.load(f)
+
+    model = apply_channel_spec(build_model(model_name), spec)
+    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    return model.to(device).eval()
+
+def measure_cpu_latency(model, input_shape=(1, 1, 256, 256), n_warmup=2, n_runs=10):
+    """Median CPU latency in ms for one forward pass at ``input_shape``."""
+    model = model.cpu().eval()
+    x = torch.rand(*input_shape)
+    with torch.inference_mode():
+        for _ in range(n_warmup):
+            model(x)
+        timings = []
+        for _ in range(n_runs):
+            start = time.perf_counter()
+            model(x)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+def search_pruning_ratio(model, target_ms, scores=None, ratios=(0.25, 0.375, 0.5, 0.625, 0.75, 0.875),
+                         input_shape=(1, 1, 256, 256)):
+    """
+    Prunes with increasing ratios until the CPU latency per B-scan is at or
+    below ``target_ms``.
+
+    Returns:
+        tuple: (pruned model, channel spec, ratio, latency in ms, list of
+        (ratio, latency) tried). The most pruned model is returned if no
+        ratio meets the target.
+    """
+    if scores is None:
+        scores = bn_scores(model)
+
+    baseline = measure_cpu_latency(model, input_shape)
+    print(f"Unpruned latency: {baseline:.1f} ms (target {target_ms:.1f} ms)")
+    tried = [(0.0, baseline)]
+    if baseline <= target_ms:
+        return copy.deepcopy(model), get_channel_spec(model), 0.0, baseline, tried
+
+    for ratio in ratios:
+        pruned, spec = prune_model(model, ratio, scores)
+        latency = measure_cpu_latency(pruned, input_shape)
+        tried.append((ratio, latency))
+        print(f"  ratio {ratio:.3f}: {latency:.1f} ms")
+        if latency <= target_ms:
+            break
+
+    return pruned, spec, ratio, latency, tried
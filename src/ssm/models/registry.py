@@ -0,0 +1,67 @@
+import importlib
+
+# name: module, class, constructor kwargs and output kind
+# output kind is "tensor", "dict" (speckle separation models) or "list" (progressive fusion models)
+# modules are only imported when the model is built
+MODEL_REGISTRY = {
+    'UNet': {'module': 'ssm.models.unet.unet', 'class': 'UNet', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'UNet2': {'module': 'ssm.models.unet.unet_2', 'class': 'UNet2', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'LargeUNet': {'module': 'ssm.models.unet.large_unet_good', 'class': 'LargeUNet', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'LargeUNetAttention': {'module': 'ssm.models.unet.large_unet', 'class': 'LargeUNetAttention', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'LargeUNet2': {'module': 'ssm.models.unet.large_unet', 'class': 'LargeUNet2', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'LargeUNetNoAttention': {'module': 'ssm.models.unet.large_unet', 'class': 'LargeUNet2', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'LargeUNet3': {'module': 'ssm.models.unet.large_unet', 'class': 'LargeUNet3', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'SmallUNet': {'module': 'ssm.models.unet.small_unet', 'class': 'SmallUNet', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'SmallUNetAtt': {'module': 'ssm.models.unet.small_unet_att', 'class': 'SmallUNetAtt', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'LargeUNetAtt': {'module': 'ssm.models.unet.large_unet_attention', 'class': 'LargeUNetAtt', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'tensor'},
+    'ProgUNet': {'module': 'ssm.models.unet.prog_unet', 'class': 'ProgUNet', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'list'},
+    'ProgLargeUNet': {'module': 'ssm.models.unet.prog_custom', 'class': 'ProgLargeUNet', 'kwargs': {'in_channels': 1, 'out_channels': 1}, 'output': 'list'},
+    'SpeckleSeparationModule': {'module': 'ssm.models.ssm.ssm', 'class': 'SpeckleSeparationModule', 'kwargs': {'input_channels': 1, 'feature_dim': 32}, 'output': 'dict'},
+    'SpeckleSeparationUNet': {'module': 'ssm.models.ssm.ssm', 'class': 'SpeckleSeparationUNet', 'kwargs': {'input_channels': 1, 'feature_dim': 32}, 'output': 'dict'},
+    'SpeckleSeparationUNetAttention': {'module': 'ssm.models.ssm.ssm_attention', 'class': 'SpeckleSeparationUNetAttention', 'kwargs': {'input_channels': 1, 'feature_dim': 32}, 'output': 'dict'},
+    'SimplifiedSpeckleSeparationModel': {'module': 'ssm.models.ssm.ssm_attention_simple', 'class': 'SimplifiedSpeckleSeparationModel', 'kwargs': {'input_channels': 1, 'feature_dim': 32}, 'output': 'dict'},
+}
+
+CHECKPOINT_VARIANTS = ('best', 'last', 'best_metrics')
+
+def register_model(name, module, class_name, kwargs=None, output='tensor'):
+    MODEL_REGISTRY[name] = {'module': module, 'class': class_name, 'kwargs': kwargs or {}, 'output': output}
+
+def list_models():
+    return sorted(MODEL_REGISTRY)
+
+def get_model_spec(name):
+
+    if name not in MODEL_REGISTRY:
+        raise ValueError(f"Model {name} not supported, expected one of {list_models()}")
+
+    return MODEL_REGISTRY[name]
+
+def get_model_class(name):
+    spec = get_model_spec(name)
+    return getattr(importlib.import_module(spec['module']), spec['class'])
+
+def build_model(name, **kwargs):
+    """Builds a registered model with its default constructor arguments, overridden by ``kwargs``."""
+    spec = get_model_spec(name)
+    return get_model_class(name)(**{**spec['kwargs'], **kwargs})
+
+def get_checkpoint_prefix(baselines_checkpoint_path, ablation, method, model_name, ssm=False):
+    """
+    Checkpoint prefix used by the N2 trainers, e.g.
+    ``<baselines><ablation>/n2v_LargeUNet_ssm``.
+    """
+    prefix = baselines_checkpoint_path + ablation + rf"/{method}_{model_name}"
+    if ssm:
+        prefix = prefix + "_ssm"
+    return prefix
+
+def get_checkpoint_file(prefix, variant='best', patched=False):
+    """
+    Appends the checkpoint suffix to a prefix, e.g. ``_best_checkpoint.pth``
+    or ``_patched_best_metrics_checkpoint.pth`` for the patch trainers.
+    """
+    if variant not in CHECKPOINT_VARIANTS:
+        raise ValueError(f"Unknown checkpoint variant: {variant}, expected one of {CHECKPOINT_VARIANTS}")
+
+    return prefix + ("_patched" if patched else "") + f"_{variant}_checkpoint.pth"
@@ -0,0 +1,35 @@
+SSM_OUTPUTS = ('flow_component', 'noise_component')
+
+def select_outputs(outputs=None):
+    """
+    Normalises the ``outputs`` argument of the speckle separation models.
+
+    Args:
+        outputs (str | list | None): Head name, list of head names, or None
+            for all heads.
+
+    Returns:
+        tuple: Head names to evaluate.
+    """
+    if outputs is None:
+        return SSM_OUTPUTS
+    if isinstance(outputs, str):
+        outputs = (outputs,)
+
+    unknown = [name for name in outputs if name not in SSM_OUTPUTS]
+    if unknown:
+        raise ValueError(f"Unknown outputs: {unknown}, expected any of {SSM_OUTPUTS}")
+    return tuple(outputs)
+
+def compute_heads(x, branches, outputs=None):
+    """Runs only the requested output heads on the shared features ``x``.
+
+    Args:
+        x (torch.Tensor): Decoder features.
+        branches (dict): Head name -> module.
+        outputs: See ``select_outputs``.
+
+    Returns:
+        dict: Head name -> output, for the requested heads only.
+    """
+    return {name: branches[name](x) for name in select_outputs(outputs)}
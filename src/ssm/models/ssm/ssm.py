@@ -6,6 +6,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 from torch.utils.data import DataLoader, TensorDataset
+
+from ssm.models.ssm.heads import compute_heads
 import os 
 import sys
 sys.path.append(r"C:\Users\CL-11\OneDrive\Repos\OCTDenoisingFinal\src")
@@ -54,15 +56,16 @@ class SpeckleSeparationModule(nn.Module):
             nn.Conv2d(feature_dim, input_channels, kernel_size=1)
         )
     
-    def forward(self, x):
+    def forward(self, x, outputs=None):
         """
         Forward pass of the Speckle Separation Module
         
         Args:
             x: Input OCT image tensor of shape [B, C, H, W]
+            outputs: Heads to evaluate, e.g. 'flow_component'. All heads if None.
             
         Returns:
-            Dictionary containing:
+            Dictionary containing the requested heads of:
                 - 'flow_component': Flow-related speckle component
                 - 'noise_component': Noise-related speckle component
         """
@@ -70,13 +73,7 @@ class SpeckleSeparationModule(nn.Module):
         features = self.feature_extraction(x)
         
         # Separate into flow and noise components
-        flow_component = self.flow_branch(features)
-        noise_component = self.noise_branch(features)
-        
-        return {
-            'flow_component': flow_component,
-            'noise_component': noise_component
-        }
+        return compute_heads(features, {'flow_component': self.flow_branch, 'noise_component': self.noise_branch}, outputs)
     
 ######################
     
@@ -190,15 +187,16 @@ class SpeckleSeparationUNet(nn.Module):
             nn.ReLU(inplace=True)
         )
     
-    def forward(self, x):
+    def forward(self, x, outputs=None):
         """
         Forward pass of the Speckle Separation U-Net
         
         Args:
             x: Input OCT image tensor of shape [B, C, H, W]
+            outputs: Heads to evaluate, e.g. 'flow_component'. All heads if None.
             
         Returns:
-            Dictionary containing:
+            Dictionary containing the requested heads of:
                 - 'flow_component': Flow-related speckle component
                 - 'noise_component': Noise-related speckle component
         """
@@ -229,10 +227,4 @@ class SpeckleSeparationUNet(nn.Module):
         x = self.dilation_block(x)
         
         # Generate flow and noise components
-        flow_component = self.flow_branch(x)
-        noise_component = self.noise_branch(x)
-        
-        return {
-            'flow_component': flow_component,
-            'noise_component': noise_component
-        }
\ No newline at end of file
+        return compute_heads(x, {'flow_component': self.flow_branch, 'noise_component': self.noise_branch}, outputs)
\ No newline at end of file
@@ -1,5 +1,7 @@
 import torch
 import torch.nn as nn
+
+from ssm.models.ssm.heads import compute_heads
 import sys
 sys.path.append(r"C:\Users\CL-11\OneDrive\Repos\OCTDenoisingFinal\src")
 class ChannelAttention(nn.Module):
@@ -199,7 +201,16 @@ class SpeckleSeparationUNetAttention(nn.Module):
     def __repr__(self):
         return f"SpeckleSeparationUNetAttention(input_channels={self.input_channels}, feature_dim={self.feature_dim}, depth={self.depth}, block_depth={self.block_depth})"
 
-    def forward(self, x):
+    def forward(self, x, outputs=None):
+        """
+        Args:
+            x: Input OCT image tensor of shape [B, C, H, W]
+            outputs: Heads to evaluate, e.g. 'flow_component' for flow-only
+                callers. All heads if None.
+
+        Returns:
+            Dictionary with the requested 'flow_component' / 'noise_component'.
+        """
 
         encoder_features = []
         
@@ -227,15 +238,8 @@ class SpeckleSeparationUNetAttention(nn.Module):
         x = self.dilation_block(x)
         x = self.final_attention(x) 
         
-        flow_component = self.flow_branch(x)
         #flow_component = torch.where(flow_component > 0.01, flow_component, torch.zeros_like(flow_component)) # binary
-        noise_component = self.noise_branch(x)
-
-        
-        return {
-            'flow_component': flow_component,
-            'noise_component': noise_component
-        }
+        return compute_heads(x, {'flow_component': self.flow_branch, 'noise_component': self.noise_branch}, outputs)
     
 def get_ssm_model_attention(checkpoint_path):
 
@@ -2,6 +2,8 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from ssm.models.ssm.heads import compute_heads
+
 class SimplifiedSpeckleSeparationModel(nn.Module):
     def __init__(self, input_channels=1, feature_dim=32, depth=4):
         super(SimplifiedSpeckleSeparationModel, self).__init__()
@@ -60,7 +62,8 @@ class SimplifiedSpeckleSeparationModel(nn.Module):
             nn.ReLU(inplace=True)
         )
         
-    def forward(self, x):
+    def forward(self, x, outputs=None):
+        # outputs selects the heads to evaluate, all of them if None
         # Store encoder outputs for skip connections
         encoder_outputs = []
         
@@ -92,13 +95,7 @@ class SimplifiedSpeckleSeparationModel(nn.Module):
             x = self.decoder_blocks[i](x)
         
         # Generate output components
-        flow_component = self.output_flow(x)
-        noise_component = self.output_noise(x)
-        
-        return {
-            'flow_component': flow_component,
-            'noise_component': noise_component
-        }
+        return compute_heads(x, {'flow_component': self.output_flow, 'noise_component': self.output_noise}, outputs)
     
 def get_ssm_model_simple(checkpoint_path):
 
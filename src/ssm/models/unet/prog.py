@@ -100,13 +100,11 @@ class ProgressiveFusionDynamicUNet(nn.Module):
         x = self.up2(x, x2)
         x = self.up3(x, x1)
 
-        # Dynamically generate outputs for each target
-        outputs = [
-            (1 - self.residual_weight) * F.interpolate(self.outc(x), size=target_size[-2:], mode='bilinear', align_corners=False)
+        # Every target gets the same prediction, so the head runs once and
+        # the result is shared by all targets
+        output = (1 - self.residual_weight) * F.interpolate(self.outc(x), size=target_size[-2:], mode='bilinear', align_corners=False) \
             + self.residual_weight * input_image
-            for _ in range(n_targets)
-        ]
-        return outputs
+        return [output] * n_targets
 
 
 def create_progressive_fusion_dynamic_unet(base_features: int = 32, use_fusion: bool = True) -> ProgressiveFusionDynamicUNet:
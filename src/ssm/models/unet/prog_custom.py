@@ -39,13 +39,10 @@ class ProgLargeUNet(LargeUNet):
         
         x = self.outc(x)
         
-        # Apply residual connection and handle multiple outputs like ProgUNet
-        outputs = [
-            (1 - self.residual_weight) * x + self.residual_weight * input_image
-            for _ in range(n_targets)
-        ]
+        # Apply residual connection once, all targets share the output like ProgUNet
+        output = (1 - self.residual_weight) * x + self.residual_weight * input_image
         
-        return outputs
+        return [output] * n_targets
 
 def load_prog_unet(config):
     checkpoint_path = config['training']['checkpoint_path']
@@ -85,11 +85,9 @@ class ProgUNet(nn.Module):
         #final_output = self.final(dec_final)
         #final_upscaled = F.interpolate(final_output, size=x.shape[2:], mode='bilinear', align_corners=False)
         
-        outputs = [
-            (1 - self.residual_weight) * dec4 + self.residual_weight * input_image
-            for _ in range(n_targets)
-        ]
-        return outputs
+        # computed once and shared by all targets
+        output = (1 - self.residual_weight) * dec4 + self.residual_weight * input_image
+        return [output] * n_targets
     
     def __str__(self):
         return "ProgUNet"
@@ -20,6 +20,41 @@ from scipy.fftpack import dct, idct
 import numpy as np
 
 
+# ==================================================================================================
+#                                           Parameters
+# ==================================================================================================
+
+# OCT settings (see ssm.evaluation.evaluate_bm3d), read by both steps as module globals
+
+sigma = 5                   # noise standard deviation
+
+lamb2d = 1.2                # 2D hard-threshold factor for the step 1 distance
+
+lamb3d = 1.8                # 3D hard-threshold factor
+
+Step1_ThreDist = 4000       # threshold distance for a block to join the group
+
+Step1_MaxMatch = 20         # max matched blocks
+
+Step1_BlockSize = 8
+
+Step1_spdup_factor = 3      # pixel jump between reference blocks
+
+Step1_WindowSize = 32       # search window size
+
+Step2_ThreDist = 1200
+
+Step2_MaxMatch = 40
+
+Step2_BlockSize = 8
+
+Step2_spdup_factor = 3
+
+Step2_WindowSize = 32
+
+Kaiser_Window_beta = 2.0
+
+
 # ==================================================================================================
 #                                           Preprocessing
 # ==================================================================================================
@@ -1,6 +1,10 @@
 
 import time
 import torch
+from ssm.utils.checkpoint import CheckpointWriter
+from ssm.utils.budget import TrainingBudget, images_per_epoch
+from ssm.utils.profiling import NULL_PROFILER
+from ssm.utils import evaluate_oct_denoising
 from ssm.utils.eval_utils.visualise import plot_images
     
 def normalize_image_torch(t_img: torch.Tensor) -> torch.Tensor:
@@ -76,32 +80,39 @@ def threshold_flow_component(t_img: torch.Tensor, threshold: float = 0.01, botto
     # Apply both masks
     return binary_mask * bottom_mask
 
-def process_batch(data_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha, scheduler):
+def process_batch(data_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha, scheduler, profiler=NULL_PROFILER):
     mode = 'train' if model.training else 'val'
     
     epoch_loss = 0
     
-    for batch_idx, (input_imgs, target_imgs) in enumerate(data_loader):
-        input_imgs = input_imgs.to(device)
-        target_imgs = target_imgs.to(device)
+    for batch_idx, (input_imgs, target_imgs) in enumerate(profiler.iterate(data_loader)):
+        with profiler.stage('data'):
+            input_imgs = input_imgs.to(device)
+            target_imgs = target_imgs.to(device)
         
         if speckle_module is not None:
-            flow_inputs = speckle_module(input_imgs)
-            flow_inputs = flow_inputs['flow_component'].detach()
-            flow_inputs = normalize_image_torch(flow_inputs)
+            with profiler.stage('speckle_module'):
+                flow_inputs = speckle_module(input_imgs, outputs='flow_component')
+                flow_inputs = flow_inputs['flow_component'].detach()
+                flow_inputs = normalize_image_torch(flow_inputs)
             #flow_inputs = threshold_flow_component(flow_inputs, threshold=0.05)
-            outputs = model(input_imgs)
-            flow_outputs = speckle_module(outputs)
-            flow_outputs = flow_outputs['flow_component'].detach()
-            flow_outputs = normalize_image_torch(flow_outputs)
+            with profiler.stage('forward'):
+                outputs = model(input_imgs)
+            with profiler.stage('speckle_module'):
+                flow_outputs = speckle_module(outputs, outputs='flow_component')
+                flow_outputs = flow_outputs['flow_component'].detach()
+                flow_outputs = normalize_image_torch(flow_outputs)
             #flow_outputs = threshold_flow_component(flow_outputs, threshold=0.05)
-            flow_loss = torch.mean(torch.abs(flow_outputs - flow_inputs))
-            
-            loss = criterion(outputs, target_imgs) + flow_loss * alpha
+            with profiler.stage('loss'):
+                flow_loss = torch.mean(torch.abs(flow_outputs - flow_inputs))
+                
+                loss = criterion(outputs, target_imgs) + flow_loss * alpha
         else:
             try:
-                outputs = model(input_imgs)
-                loss = criterion(outputs, target_imgs)
+                with profiler.stage('forward'):
+                    outputs = model(input_imgs)
+                with profiler.stage('loss'):
+                    loss = criterion(outputs, target_imgs)
             except Exception as e:
                 print(f"Error in model output: {e}")
 
@@ -109,10 +120,12 @@ def process_batch(data_loader, model, criterion, optimizer, epoch, epochs, devic
             #loss += physics_loss * 0.01
         
         if mode == 'train':
-            optimizer.zero_grad()
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-            optimizer.step()
+            with profiler.stage('backward'):
+                optimizer.zero_grad()
+                loss.backward()
+            with profiler.stage('optimizer'):
+                torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+                optimizer.step()
         else:
             scheduler.step(loss)
         
@@ -147,57 +160,120 @@ def process_batch(data_loader, model, criterion, optimizer, epoch, epochs, devic
                     'Total Loss': loss.item()
                 }
                 
-            plot_images(images, titles, losses)
+            with profiler.stage('plot'):
+                plot_images(images, titles, losses)
 
     return epoch_loss / len(data_loader)
 
 def train_n2n(model, train_loader, val_loader, optimizer, criterion, starting_epoch, epochs, 
               batch_size, lr, best_val_loss, checkpoint_path = None,device='cuda', visualise=False, 
-              speckle_module=None, alpha=1, save=False, scheduler=None):
+              speckle_module=None, alpha=1, save=False, scheduler=None, best_metrics_score=None, train_config=None,
+              budget=None, quality_logger=None, profiler=None):
 
     last_checkpoint_path = checkpoint_path + f'_last_checkpoint.pth'
     best_checkpoint_path = checkpoint_path + f'_best_checkpoint.pth'
+    best_metrics_checkpoint_path = checkpoint_path + '_best_metrics_checkpoint.pth'
+    if best_metrics_score is None:
+        best_metrics_score = float('-inf')
 
     print(f"Saving checkpoints to {best_checkpoint_path}")
 
     start_time = time.time()
-    for epoch in range(starting_epoch, starting_epoch+epochs):
-        model.train()
-        visualise = False
-        train_loss = process_batch(train_loader, model, criterion, optimizer, epoch, starting_epoch+epochs, device, visualise, speckle_module, alpha, scheduler)
+    checkpoint_writer = CheckpointWriter()
+    try:
+        if budget is None:
+            budget = TrainingBudget()
+        budget.start()
+        if profiler is None:
+            profiler = NULL_PROFILER
+        profiler.start()
+        # fixed validation image the per-epoch metrics are computed on
+        val_sample = next(iter(val_loader))[0][:1].to(device)
+        for epoch in range(starting_epoch, starting_epoch+epochs):
+            model.train()
+            visualise = False
+            train_loss = process_batch(train_loader, model, criterion, optimizer, epoch, starting_epoch+epochs, device, visualise, speckle_module, alpha, scheduler, profiler)
 
-        model.eval()
-        visualise = True
-        with torch.no_grad():
-            val_loss = process_batch(val_loader, model, criterion, optimizer, epoch, starting_epoch+epochs, device, visualise, speckle_module, alpha, scheduler)
+            model.eval()
+            visualise = True
+            with torch.no_grad():
+                val_loss = process_batch(val_loader, model, criterion, optimizer, epoch, starting_epoch+epochs, device, visualise, speckle_module, alpha, scheduler, profiler)
+                with profiler.stage('metrics'):
+                    val_output = model(val_sample)
+                    val_metrics = evaluate_oct_denoising(val_sample[0][0].cpu().numpy(), val_output[0][0].cpu().numpy())
+                    val_metrics_score = (
+                        val_metrics.get('snr', 0) * 0.3 + 
+                        val_metrics.get('cnr', 0) * 0.3 + 
+                        val_metrics.get('enl', 0) * 0.2 + 
+                        val_metrics.get('epi', 0) * 0.2
+                    )
 
-        print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
+            print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
         
-        if val_loss < best_val_loss and save:
-            best_val_loss = val_loss
-            print(f"Saving best model with val loss: {val_loss:.6f}")
-            print(f"Best checkpoint path: {best_checkpoint_path}")
-            print(f"Epoch: {epoch}, Best val loss: {best_val_loss:.6f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss
-            }, best_checkpoint_path)
-    
-        if save:
-            print(f"Saving last model with val loss: {val_loss:.6f}")
-            torch.save({
+            if val_loss < best_val_loss and save:
+                best_val_loss = val_loss
+                print(f"Saving best model with val loss: {val_loss:.6f}")
+                print(f"Best checkpoint path: {best_checkpoint_path}")
+                print(f"Epoch: {epoch}, Best val loss: {best_val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
                         'epoch': epoch,
+                        'memory': profiler.memory_summary(),
                         'model_state_dict': model.state_dict(),
                         'optimizer_state_dict': optimizer.state_dict(),
                         'train_loss': train_loss,
                         'val_loss': val_loss,
-                        'best_val_loss': best_val_loss
-                }, last_checkpoint_path)
+                        'metrics': val_metrics,
+                        'metrics_score': val_metrics_score,
+                        'best_val_loss': best_val_loss,
+                        'train_config': train_config
+                    }, best_checkpoint_path)
+
+            if val_metrics_score > best_metrics_score and save:
+                best_metrics_score = val_metrics_score
+                print(f"Saving best metrics model with score: {val_metrics_score:.4f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                        'epoch': epoch,
+                        'memory': profiler.memory_summary(),
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'metrics': val_metrics,
+                        'metrics_score': val_metrics_score,
+                        'best_val_loss': best_val_loss,
+                        'train_config': train_config
+                    }, best_metrics_checkpoint_path)
+    
+            if save:
+                print(f"Saving last model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                                'epoch': epoch,
+                                'memory': profiler.memory_summary(),
+                                'model_state_dict': model.state_dict(),
+                                'optimizer_state_dict': optimizer.state_dict(),
+                                'train_loss': train_loss,
+                                'val_loss': val_loss,
+                                'metrics': val_metrics,
+                                'metrics_score': val_metrics_score,
+                                'best_val_loss': best_val_loss,
+                                'train_config': train_config
+                        }, last_checkpoint_path)
+
+            memory = profiler.memory_summary()
+            profiler.epoch_end(epoch)
+            stop_reason = budget.step(val_loss, images_per_epoch(train_loader))
+            if quality_logger is not None:
+                quality_logger.log(epoch, budget.elapsed, budget.images_seen, val_loss, train_loss, {**val_metrics, **memory})
+            if stop_reason is not None:
+                print(f"Stopping early after epoch {epoch+1}: {stop_reason}")
+                break
     
+        profiler.stop()
+    finally:
+        checkpoint_writer.close()
     elapsed_time = time.time() - start_time
     print(f"Training completed in {elapsed_time / 60:.2f} minutes")
     
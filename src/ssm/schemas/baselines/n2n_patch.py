@@ -1,6 +1,9 @@
 
 import time
 import torch
+from ssm.utils.checkpoint import CheckpointWriter
+from ssm.utils.budget import TrainingBudget, images_per_epoch
+from ssm.utils.profiling import NULL_PROFILER
 from ssm.utils.eval_utils.visualise import plot_images
 
 from ssm.utils import evaluate_oct_denoising
@@ -333,7 +336,7 @@ def reconstruct_from_patches(patches, locations, image_shape, patch_size=64):
 
 def process_batch(
         data_loader, model, criterion, optimizer, epoch, 
-        epochs, device, visualise, speckle_module, alpha, scheduler, sample):
+        epochs, device, visualise, speckle_module, alpha, scheduler, sample, profiler=NULL_PROFILER):
     mode = 'train' if model.training else 'val'
     
     epoch_loss = 0
@@ -342,13 +345,15 @@ def process_batch(
 
     metrics = None
     
-    for batch_idx, (input_imgs, target_imgs) in enumerate(data_loader):
-        input_imgs = input_imgs.to(device)
-        target_imgs = target_imgs.to(device)
+    for batch_idx, (input_imgs, target_imgs) in enumerate(profiler.iterate(data_loader)):
+        with profiler.stage('data'):
+            input_imgs = input_imgs.to(device)
+            target_imgs = target_imgs.to(device)
         
         # Extract patches
-        input_patches, patch_locations = extract_patches(input_imgs, patch_size, stride)
-        target_patches, _ = extract_patches(target_imgs, patch_size, stride)
+        with profiler.stage('patches'):
+            input_patches, patch_locations = extract_patches(input_imgs, patch_size, stride)
+            target_patches, _ = extract_patches(target_imgs, patch_size, stride)
         
         # Process patches in sub-batches to avoid memory issues
         sub_batch_size = 16  # Adjust based on your GPU memory
@@ -361,84 +366,94 @@ def process_batch(
 
                 
             if speckle_module is not None:
-                flow_inputs = speckle_module(input_sub_batch)
-                flow_inputs = flow_inputs['flow_component'].detach()
-                flow_inputs = normalize_image_torch(flow_inputs)
+                with profiler.stage('speckle_module'):
+                    flow_inputs = speckle_module(input_sub_batch, outputs='flow_component')
+                    flow_inputs = flow_inputs['flow_component'].detach()
+                    flow_inputs = normalize_image_torch(flow_inputs)
                 
-                outputs = model(input_sub_batch)
-                #all_output_patches.extend(outputs)
-                #all_output_patches.extend(outputs.detach().clone())
-                for j in range(outputs.size(0)):
-                    all_output_patches.append(outputs[j].detach().clone())
+                with profiler.stage('forward'):
+                    outputs = model(input_sub_batch)
+                    #all_output_patches.extend(outputs)
+                    #all_output_patches.extend(outputs.detach().clone())
+                    for j in range(outputs.size(0)):
+                        all_output_patches.append(outputs[j].detach().clone())
                 
-                flow_outputs = speckle_module(outputs)
-                flow_outputs = flow_outputs['flow_component'].detach()
-                flow_outputs = normalize_image_torch(flow_outputs)
+                with profiler.stage('speckle_module'):
+                    flow_outputs = speckle_module(outputs, outputs='flow_component')
+                    flow_outputs = flow_outputs['flow_component'].detach()
+                    flow_outputs = normalize_image_torch(flow_outputs)
                 
-                flow_loss = torch.mean(torch.abs(flow_outputs - flow_inputs))
-                patch_loss = criterion(outputs, target_sub_batch) + flow_loss * alpha
+                with profiler.stage('loss'):
+                    flow_loss = torch.mean(torch.abs(flow_outputs - flow_inputs))
+                    patch_loss = criterion(outputs, target_sub_batch) + flow_loss * alpha
             else:
-                outputs = model(input_sub_batch)
-                #all_output_patches.extend(outputs)
-                #all_output_patches.extend(outputs.detach().clone())
-                for j in range(outputs.size(0)):
-                    all_output_patches.append(outputs[j].detach().clone())
-                patch_loss = criterion(outputs, target_sub_batch)
+                with profiler.stage('forward'):
+                    outputs = model(input_sub_batch)
+                    #all_output_patches.extend(outputs)
+                    #all_output_patches.extend(outputs.detach().clone())
+                    for j in range(outputs.size(0)):
+                        all_output_patches.append(outputs[j].detach().clone())
+                with profiler.stage('loss'):
+                    patch_loss = criterion(outputs, target_sub_batch)
             
             total_loss += patch_loss.item() * len(input_sub_batch)
             
             if mode == 'train':
-                optimizer.zero_grad()
-                patch_loss.backward()
-                torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-                optimizer.step()
+                with profiler.stage('backward'):
+                    optimizer.zero_grad()
+                    patch_loss.backward()
+                with profiler.stage('optimizer'):
+                    torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+                    optimizer.step()
         
         # Reconstruct full images from patches for visualization
         if visualise and batch_idx % 10 == 0:
-            sample_input = sample
-            print(f"Sample input shape: {sample_input.shape}")
-            sample_output = model(sample_input).cpu().numpy()
-            output_patches = torch.stack(all_output_patches)
-            reconstructed_outputs = reconstruct_from_patches(
-                output_patches, patch_locations, input_imgs.shape, patch_size
-            )
+            with profiler.stage('plot'):
+                sample_input = sample
+                print(f"Sample input shape: {sample_input.shape}")
+                sample_output = model(sample_input).cpu().numpy()
+                output_patches = torch.stack(all_output_patches)
+                reconstructed_outputs = reconstruct_from_patches(
+                    output_patches, patch_locations, input_imgs.shape, patch_size
+                )
             
-            if speckle_module is not None:
-                flow_inputs_full = speckle_module(input_imgs)['flow_component'].detach()
-                flow_outputs_full = speckle_module(reconstructed_outputs)['flow_component'].detach()
+                if speckle_module is not None:
+                    flow_inputs_full = speckle_module(input_imgs, outputs='flow_component')['flow_component'].detach()
+                    flow_outputs_full = speckle_module(reconstructed_outputs, outputs='flow_component')['flow_component'].detach()
                 
-                titles = ['Input Image', 'Flow Input', 'Flow Output', 'Target Image', 'Output Image', 'Sample Input', 'Sample Output']
-                images = [
-                    input_imgs[0][0].cpu().numpy(), 
-                    flow_inputs_full[0][0].cpu().numpy(),
-                    flow_outputs_full[0][0].cpu().numpy(),
-                    target_imgs[0][0].cpu().numpy(), 
-                    reconstructed_outputs[0][0].cpu().numpy(),
-                    sample_input.cpu().numpy()[0][0],
-                    sample_output[0][0]
-                ]
-                losses = {
-                    'Flow Loss': flow_loss.item(),
-                    'Total Loss': total_loss / len(input_patches)
-                }
-            else:
-                titles = ['Input Image', 'Target Image', 'Output Image', 'Sample Input', 'Sample Output']
-                images = [
-                    input_imgs[0][0].cpu().numpy(), 
-                    target_imgs[0][0].cpu().numpy(), 
-                    reconstructed_outputs[0][0].cpu().numpy(),
-                    sample_input.cpu().numpy()[0][0],
-                    sample_output[0][0]
-                ]
-                losses = {
-                    'Total Loss': total_loss / len(input_patches)
-                }
+                    titles = ['Input Image', 'Flow Input', 'Flow Output', 'Target Image', 'Output Image', 'Sample Input', 'Sample Output']
+                    images = [
+                        input_imgs[0][0].cpu().numpy(), 
+                        flow_inputs_full[0][0].cpu().numpy(),
+                        flow_outputs_full[0][0].cpu().numpy(),
+                        target_imgs[0][0].cpu().numpy(), 
+                        reconstructed_outputs[0][0].cpu().numpy(),
+                        sample_input.cpu().numpy()[0][0],
+                        sample_output[0][0]
+                    ]
+                    losses = {
+                        'Flow Loss': flow_loss.item(),
+                        'Total Loss': total_loss / len(input_patches)
+                    }
+                else:
+                    titles = ['Input Image', 'Target Image', 'Output Image', 'Sample Input', 'Sample Output']
+                    images = [
+                        input_imgs[0][0].cpu().numpy(), 
+                        target_imgs[0][0].cpu().numpy(), 
+                        reconstructed_outputs[0][0].cpu().numpy(),
+                        sample_input.cpu().numpy()[0][0],
+                        sample_output[0][0]
+                    ]
+                    losses = {
+                        'Total Loss': total_loss / len(input_patches)
+                    }
                 
-            plot_images(images, titles, losses)
+                plot_images(images, titles, losses)
 
-            metrics = evaluate_oct_denoising(
-                input_imgs[0][0].cpu().numpy(), 
-                reconstructed_outputs[0][0].cpu().numpy())
+            with profiler.stage('metrics'):
+                metrics = evaluate_oct_denoising(
+                    input_imgs[0][0].cpu().numpy(), 
+                    reconstructed_outputs[0][0].cpu().numpy())
             
         loss_value = total_loss / len(input_patches)
         epoch_loss += loss_value
@@ -455,7 +470,7 @@ def process_batch(
 def train_n2n_patch(model, train_loader, val_loader, optimizer, criterion, starting_epoch, epochs, 
               batch_size, lr, best_val_loss, checkpoint_path = None,device='cuda', visualise=False, 
               speckle_module=None, alpha=1, save=False, scheduler=None, best_metrics_score=None, train_config=None,
-              sample=None):
+              sample=None, budget=None, quality_logger=None, profiler=None):
 
     last_checkpoint_path = checkpoint_path + f'_patched_last_checkpoint.pth'
     best_checkpoint_path = checkpoint_path + f'_patched_best_checkpoint.pth'
@@ -464,65 +479,45 @@ def train_n2n_patch(model, train_loader, val_loader, optimizer, criterion, start
     print(f"Saving checkpoints to {best_checkpoint_path}")
 
     start_time = time.time()
-    for epoch in range(starting_epoch, starting_epoch+epochs):
-        model.train()
-        visualise = False
-        train_loss = process_batch(
-            train_loader, model, criterion, optimizer, epoch, 
-            starting_epoch+epochs, device, visualise, speckle_module, alpha, 
-            scheduler, sample)
+    checkpoint_writer = CheckpointWriter()
+    try:
+        if budget is None:
+            budget = TrainingBudget()
+        budget.start()
+        if profiler is None:
+            profiler = NULL_PROFILER
+        profiler.start()
+        for epoch in range(starting_epoch, starting_epoch+epochs):
+            model.train()
+            visualise = False
+            train_loss = process_batch(
+                train_loader, model, criterion, optimizer, epoch, 
+                starting_epoch+epochs, device, visualise, speckle_module, alpha, 
+                scheduler, sample, profiler)
 
-        model.eval()
-        visualise = True
-        with torch.no_grad():
-            val_loss, val_metrics = process_batch(val_loader, model, criterion, optimizer, epoch, starting_epoch+epochs, device, visualise, speckle_module, alpha, scheduler, sample)
+            model.eval()
+            visualise = True
+            with torch.no_grad():
+                val_loss, val_metrics = process_batch(val_loader, model, criterion, optimizer, epoch, starting_epoch+epochs, device, visualise, speckle_module, alpha, scheduler, sample, profiler)
             
-            val_metrics_score = (
-                val_metrics.get('snr', 0) * 0.3 + 
-                val_metrics.get('cnr', 0) * 0.3 + 
-                val_metrics.get('enl', 0) * 0.2 + 
-                val_metrics.get('epi', 0) * 0.2
-            )
-
-        print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
-        
-        if val_loss < best_val_loss and save:
-            best_val_loss = val_loss
-            print(f"Saving best model with val loss: {val_loss:.6f}")
-            print(f"Best checkpoint path: {best_checkpoint_path}")
-            print(f"Epoch: {epoch}, Best val loss: {best_val_loss:.6f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss,
-                'train_config': train_config,
-                'metrics': val_metrics,
-                'metrics_score': val_metrics_score,
-                'train_config': train_config
-            }, best_checkpoint_path)
+                val_metrics_score = (
+                    val_metrics.get('snr', 0) * 0.3 + 
+                    val_metrics.get('cnr', 0) * 0.3 + 
+                    val_metrics.get('enl', 0) * 0.2 + 
+                    val_metrics.get('epi', 0) * 0.2
+                )
 
-        if val_metrics_score > best_metrics_score  and save:
-            best_metrics_score = val_metrics_score
-            print(f"Saving best metrics model with score: {val_metrics_score:.4f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss,
-                'metrics': val_metrics,
-                'metrics_score': val_metrics_score,
-                'train_config': train_config
-            }, best_metrics_checkpoint_path)
-    
-        if save:
-            print(f"Saving last model with val loss: {val_loss:.6f}")
-            torch.save({
+            print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
+        
+            if val_loss < best_val_loss and save:
+                best_val_loss = val_loss
+                print(f"Saving best model with val loss: {val_loss:.6f}")
+                print(f"Best checkpoint path: {best_checkpoint_path}")
+                print(f"Epoch: {epoch}, Best val loss: {best_val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
                         'epoch': epoch,
+                        'memory': profiler.memory_summary(),
                         'model_state_dict': model.state_dict(),
                         'optimizer_state_dict': optimizer.state_dict(),
                         'train_loss': train_loss,
@@ -532,8 +527,54 @@ def train_n2n_patch(model, train_loader, val_loader, optimizer, criterion, start
                         'metrics': val_metrics,
                         'metrics_score': val_metrics_score,
                         'train_config': train_config
-                }, last_checkpoint_path)
+                    }, best_checkpoint_path)
+
+            if val_metrics_score > best_metrics_score  and save:
+                best_metrics_score = val_metrics_score
+                print(f"Saving best metrics model with score: {val_metrics_score:.4f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                        'epoch': epoch,
+                        'memory': profiler.memory_summary(),
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'best_val_loss': best_val_loss,
+                        'metrics': val_metrics,
+                        'metrics_score': val_metrics_score,
+                        'train_config': train_config
+                    }, best_metrics_checkpoint_path)
+    
+            if save:
+                print(f"Saving last model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                                'epoch': epoch,
+                                'memory': profiler.memory_summary(),
+                                'model_state_dict': model.state_dict(),
+                                'optimizer_state_dict': optimizer.state_dict(),
+                                'train_loss': train_loss,
+                                'val_loss': val_loss,
+                                'best_val_loss': best_val_loss,
+                                'train_config': train_config,
+                                'metrics': val_metrics,
+                                'metrics_score': val_metrics_score,
+                                'train_config': train_config
+                        }, last_checkpoint_path)
+
+            memory = profiler.memory_summary()
+            profiler.epoch_end(epoch)
+            stop_reason = budget.step(val_loss, images_per_epoch(train_loader))
+            if quality_logger is not None:
+                quality_logger.log(epoch, budget.elapsed, budget.images_seen, val_loss, train_loss, {**val_metrics, **memory})
+            if stop_reason is not None:
+                print(f"Stopping early after epoch {epoch+1}: {stop_reason}")
+                break
     
+        profiler.stop()
+    finally:
+        checkpoint_writer.close()
     elapsed_time = time.time() - start_time
     print(f"Training completed in {elapsed_time / 60:.2f} minutes")
     
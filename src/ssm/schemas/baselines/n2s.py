@@ -1,6 +1,10 @@
 import torch.optim as optim
 import time
 import torch
+from ssm.utils.checkpoint import CheckpointWriter
+from ssm.utils.budget import TrainingBudget, images_per_epoch
+from ssm.utils.profiling import NULL_PROFILER
+from ssm.utils import evaluate_oct_denoising
 from ssm.utils.eval_utils.visualise import plot_images
 from tqdm import tqdm
 from tqdm.notebook import tqdm as tqdm_notebook
@@ -110,11 +114,11 @@ def _process_batch_n2s(data_loader, model, criterion, optimizer, epoch, epochs,
         full_output = model(input_imgs)
         
         if speckle_module is not None and outputs is not None:
-            flow_inputs = speckle_module(input_imgs)
+            flow_inputs = speckle_module(input_imgs, outputs='flow_component')
             flow_inputs = flow_inputs['flow_component'].detach()
             flow_inputs = normalize_image_torch(flow_inputs)
             
-            flow_outputs = speckle_module(full_output)
+            flow_outputs = speckle_module(full_output, outputs='flow_component')
             flow_outputs = flow_outputs['flow_component'].detach()
             flow_outputs = normalize_image_torch(flow_outputs)
             
@@ -202,11 +206,11 @@ def process_batch_n2s(data_loader, model, criterion, optimizer, epoch, epochs, d
 
             # SSM loss if enabled
             if speckle_module is not None:
-                flow_inputs = speckle_module(input_imgs)
+                flow_inputs = speckle_module(input_imgs, outputs='flow_component')
                 flow_inputs = flow_inputs['flow_component'].detach()
                 flow_inputs = normalize_image_torch(flow_inputs)
                 
-                flow_outputs = speckle_module(final_output)
+                flow_outputs = speckle_module(final_output, outputs='flow_component')
                 flow_outputs = flow_outputs['flow_component'].detach()
                 flow_outputs = normalize_image_torch(flow_outputs)
                 
@@ -271,7 +275,7 @@ def normalize_image_torch(t_img: torch.Tensor) -> torch.Tensor:
         # If all values are the same, return zeros
         return torch.zeros_like(t_img)
 
-def process_batch_n2s_with_clean_inference(data_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module=None, alpha=1.0):
+def process_batch_n2s_with_clean_inference(data_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module=None, alpha=1.0, profiler=NULL_PROFILER):
     """
     N2S training with periodic clean inference training
     """
@@ -284,11 +288,13 @@ def process_batch_n2s_with_clean_inference(data_loader, model, criterion, optimi
     
     partition_masks = create_random_partition_masks((256, 256), n_partitions=8, device=device)
     
-    for batch_idx, (input_imgs, _) in tqdm_notebook(enumerate(data_loader)):
-        input_imgs = input_imgs.to(device)
+    for batch_idx, (input_imgs, _) in tqdm_notebook(enumerate(profiler.iterate(data_loader)), total=len(data_loader)):
+        with profiler.stage('data'):
+            input_imgs = input_imgs.to(device)
         
         if mode == 'train' and batch_idx % 10 == 0:
-            with autocast():
+            # forward, backward and step of the clean-inference update
+            with profiler.stage('consistency'), autocast():
                 clean_output = model(input_imgs)
                 
                 final_output = torch.zeros_like(input_imgs)
@@ -315,60 +321,69 @@ def process_batch_n2s_with_clean_inference(data_loader, model, criterion, optimi
             final_output = torch.zeros_like(input_imgs)
             
             for p in range(len(partition_masks)):
-                curr_mask = partition_masks[p].unsqueeze(0).unsqueeze(0).expand_as(input_imgs)
-                comp_mask = 1 - curr_mask
-                masked_input = input_imgs * comp_mask
-                curr_outputs = model(masked_input)
-                final_output += curr_outputs * curr_mask
+                with profiler.stage('masking'):
+                    curr_mask = partition_masks[p].unsqueeze(0).unsqueeze(0).expand_as(input_imgs)
+                    comp_mask = 1 - curr_mask
+                    masked_input = input_imgs * comp_mask
+                with profiler.stage('forward'):
+                    curr_outputs = model(masked_input)
+                    final_output += curr_outputs * curr_mask
                 
-                pred = curr_outputs * curr_mask
-                target = input_imgs * curr_mask
-                loss = criterion(pred, target)
-                total_loss += loss
+                with profiler.stage('loss'):
+                    pred = curr_outputs * curr_mask
+                    target = input_imgs * curr_mask
+                    loss = criterion(pred, target)
+                    total_loss += loss
             
             loss = total_loss / len(partition_masks)
             
             if speckle_module is not None:
-                flow_inputs = speckle_module(input_imgs)['flow_component'].detach()
-                flow_inputs = normalize_image_torch(flow_inputs)
-                flow_outputs = speckle_module(final_output)['flow_component'].detach()
-                flow_outputs = normalize_image_torch(flow_outputs)
-                flow_loss = torch.mean(torch.abs(flow_outputs - flow_inputs))
+                with profiler.stage('speckle_module'):
+                    flow_inputs = speckle_module(input_imgs, outputs='flow_component')['flow_component'].detach()
+                    flow_inputs = normalize_image_torch(flow_inputs)
+                    flow_outputs = speckle_module(final_output, outputs='flow_component')['flow_component'].detach()
+                    flow_outputs = normalize_image_torch(flow_outputs)
+                    flow_loss = torch.mean(torch.abs(flow_outputs - flow_inputs))
                 loss = loss + flow_loss * alpha
         
         if mode == 'train':
             optimizer.zero_grad()
             if scaler is not None:
-                scaler.scale(loss).backward()
-                scaler.step(optimizer)
-                scaler.update()
+                with profiler.stage('backward'):
+                    scaler.scale(loss).backward()
+                with profiler.stage('optimizer'):
+                    scaler.step(optimizer)
+                    scaler.update()
             else:
-                loss.backward()
-                optimizer.step()
+                with profiler.stage('backward'):
+                    loss.backward()
+                with profiler.stage('optimizer'):
+                    optimizer.step()
         
         epoch_loss += loss.item()
         
         # Visualization with clean output comparison
         if visualise and batch_idx == 0:
-            clean_output = model(input_imgs)
-            
-            titles = ['Input', 'N2S Output', 'Clean Output', 'Clean vs N2S']
-            images = [
-                input_imgs[0][0].cpu().numpy(),
-                final_output[0][0].cpu().detach().numpy(),
-                clean_output[0][0].cpu().detach().numpy(),
-                (clean_output[0][0] - final_output[0][0]).abs().cpu().detach().numpy()
-            ]
-            
-            losses = {'Total Loss': loss.item()}
-            plot_images(images, titles, losses)
+            with profiler.stage('plot'):
+                clean_output = model(input_imgs)
+                
+                titles = ['Input', 'N2S Output', 'Clean Output', 'Clean vs N2S']
+                images = [
+                    input_imgs[0][0].cpu().numpy(),
+                    final_output[0][0].cpu().detach().numpy(),
+                    clean_output[0][0].cpu().detach().numpy(),
+                    (clean_output[0][0] - final_output[0][0]).abs().cpu().detach().numpy()
+                ]
+                
+                losses = {'Total Loss': loss.item()}
+                plot_images(images, titles, losses)
     
     return epoch_loss / len(data_loader)
 
 
 def train_n2s(model, train_loader, val_loader, optimizer, criterion, starting_epoch, epochs, batch_size, lr, 
           best_val_loss, checkpoint_path=None, device='cuda', visualise=False, 
-          speckle_module=None, alpha=1, save=False):
+          speckle_module=None, alpha=1, save=False, budget=None, quality_logger=None, profiler=None):
 
     last_checkpoint_path = checkpoint_path + f'_last_checkpoint.pth'
     best_checkpoint_path = checkpoint_path + f'_best_checkpoint.pth'
@@ -376,42 +391,73 @@ def train_n2s(model, train_loader, val_loader, optimizer, criterion, starting_ep
     print(f"Saving checkpoints to {best_checkpoint_path}")
 
     start_time = time.time()
+    checkpoint_writer = CheckpointWriter()
+    try:
+        if budget is None:
+            budget = TrainingBudget()
+        budget.start()
+        if profiler is None:
+            profiler = NULL_PROFILER
+        profiler.start()
+        # fixed validation image the per-epoch metrics are computed on
+        val_sample = next(iter(val_loader))[0][:1].to(device)
 
-    for epoch in tqdm_notebook(range(starting_epoch, starting_epoch+epochs)):
-        model.train()
-        #train_loss = process_batch_n2s(train_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha)
-        train_loss = process_batch_n2s_with_clean_inference(train_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha)
+        for epoch in tqdm_notebook(range(starting_epoch, starting_epoch+epochs)):
+            model.train()
+            #train_loss = process_batch_n2s(train_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha)
+            train_loss = process_batch_n2s_with_clean_inference(train_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha, profiler)
         
-        model.eval()
-        with torch.no_grad():
-            #val_loss = process_batch_n2s(val_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha)
-            val_loss = process_batch_n2s_with_clean_inference(train_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha)
+            model.eval()
+            with torch.no_grad():
+                #val_loss = process_batch_n2s(val_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha)
+                val_loss = process_batch_n2s_with_clean_inference(train_loader, model, criterion, optimizer, epoch, epochs, device, visualise, speckle_module, alpha, profiler)
+                with profiler.stage('metrics'):
+                    val_output = model(val_sample)
+                    val_metrics = evaluate_oct_denoising(val_sample[0][0].cpu().numpy(), val_output[0][0].cpu().numpy())
 
-        print(f"Epoch [{starting_epoch+epoch+1}/{epochs}], Average Loss: {train_loss:.6f}")
-        
-        if val_loss < best_val_loss and save:
-            best_val_loss = val_loss
-            print(f"Saving best model with val loss: {val_loss:.6f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss
-            }, best_checkpoint_path)
+            print(f"Epoch [{starting_epoch+epoch+1}/{epochs}], Average Loss: {train_loss:.6f}")
         
-        if save:
-            print(f"Saving last model with val loss: {val_loss:.6f}")
-            torch.save({
+            if val_loss < best_val_loss and save:
+                best_val_loss = val_loss
+                print(f"Saving best model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
                         'epoch': epoch,
+                        'memory': profiler.memory_summary(),
                         'model_state_dict': model.state_dict(),
                         'optimizer_state_dict': optimizer.state_dict(),
                         'train_loss': train_loss,
                         'val_loss': val_loss,
+                        'metrics': val_metrics,
                         'best_val_loss': best_val_loss
-                }, last_checkpoint_path)
+                    }, best_checkpoint_path)
+        
+            if save:
+                print(f"Saving last model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                                'epoch': epoch,
+                                'memory': profiler.memory_summary(),
+                                'model_state_dict': model.state_dict(),
+                                'optimizer_state_dict': optimizer.state_dict(),
+                                'train_loss': train_loss,
+                                'val_loss': val_loss,
+                                'metrics': val_metrics,
+                                'best_val_loss': best_val_loss
+                        }, last_checkpoint_path)
+
+            memory = profiler.memory_summary()
+            profiler.epoch_end(epoch)
+            stop_reason = budget.step(val_loss, images_per_epoch(train_loader))
+            if quality_logger is not None:
+                quality_logger.log(epoch, budget.elapsed, budget.images_seen, val_loss, train_loss, {**val_metrics, **memory})
+            if stop_reason is not None:
+                print(f"Stopping early after epoch {epoch+1}: {stop_reason}")
+                break
     
+        profiler.stop()
+    finally:
+        checkpoint_writer.close()
     elapsed_time = time.time() - start_time
     print(f"Training completed in {elapsed_time / 60:.2f} minutes")
     
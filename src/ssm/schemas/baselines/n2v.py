@@ -1,6 +1,10 @@
 import torch.optim as optim
 import time
 import torch
+from ssm.utils.checkpoint import CheckpointWriter
+from ssm.utils.budget import TrainingBudget, images_per_epoch
+from ssm.utils.profiling import NULL_PROFILER
+from ssm.utils import evaluate_oct_denoising
 from IPython.display import clear_output
 
 import sys
@@ -974,7 +978,8 @@ def process_batch_n2v(
         device='cuda',
         speckle_module=None,
         visualize=False,
-        alpha = 1.0
+        alpha = 1.0,
+        profiler=NULL_PROFILER
         ):
     
     if optimizer: 
@@ -987,63 +992,75 @@ def process_batch_n2v(
     context_manager = torch.no_grad() if not optimizer else nullcontext()
     
     with context_manager:
-        for batch_idx, batch in enumerate(tqdm(loader)):
+        for batch_idx, batch in enumerate(tqdm(profiler.iterate(loader), total=len(loader))):
             raw1, raw2 = batch
 
-            raw1 = raw1.to(device)
-            raw2 = raw2.to(device)
+            with profiler.stage('data'):
+                raw1 = raw1.to(device)
+                raw2 = raw2.to(device)
 
-            mask = torch.bernoulli(torch.full((raw1.size(0), 1, raw1.size(2), raw1.size(3)), 
-                                            mask_ratio, device=device))
+            with profiler.stage('masking'):
+                mask = torch.bernoulli(torch.full((raw1.size(0), 1, raw1.size(2), raw1.size(3)), 
+                                                mask_ratio, device=device))
 
-            blind1 = create_blind_spot_input_with_realistic_noise(raw1, mask).requires_grad_(True)
-            blind2 = create_blind_spot_input_with_realistic_noise(raw2, mask).requires_grad_(True)
+                blind1 = create_blind_spot_input_with_realistic_noise(raw1, mask).requires_grad_(True)
+                blind2 = create_blind_spot_input_with_realistic_noise(raw2, mask).requires_grad_(True)
             
             if optimizer:
                 optimizer.zero_grad()
 
             if speckle_module is not None:
-                flow_inputs = speckle_module(raw1)
-                flow_inputs = flow_inputs['flow_component'].detach()
-                flow_inputs = normalize_image_torch(flow_inputs)
-                outputs1 = model(blind1)
+                with profiler.stage('speckle_module'):
+                    flow_inputs = speckle_module(raw1, outputs='flow_component')
+                    flow_inputs = flow_inputs['flow_component'].detach()
+                    flow_inputs = normalize_image_torch(flow_inputs)
+                with profiler.stage('forward'):
+                    outputs1 = model(blind1)
                 
                 #outputs1 = model(blind1)
                 #outputs2 = model(blind2)
-                flow_outputs = speckle_module(outputs1)
-                flow_outputs = flow_outputs['flow_component'].detach()
-                flow_outputs = normalize_image_torch(flow_outputs)
-                flow_loss1 = torch.mean(torch.abs(flow_outputs - flow_inputs))
-
-                flow_inputs = speckle_module(raw2)
-                flow_inputs = flow_inputs['flow_component'].detach()
-                flow_inputs = normalize_image_torch(flow_inputs)
-                outputs2 = model(blind2)
-                flow_outputs = speckle_module(outputs2)
-                flow_outputs = flow_outputs['flow_component'].detach()
-                flow_outputs = normalize_image_torch(flow_outputs)
-                flow_loss2 = torch.mean(torch.abs(flow_outputs - flow_inputs))
+                with profiler.stage('speckle_module'):
+                    flow_outputs = speckle_module(outputs1, outputs='flow_component')
+                    flow_outputs = flow_outputs['flow_component'].detach()
+                    flow_outputs = normalize_image_torch(flow_outputs)
+                    flow_loss1 = torch.mean(torch.abs(flow_outputs - flow_inputs))
+
+                    flow_inputs = speckle_module(raw2, outputs='flow_component')
+                    flow_inputs = flow_inputs['flow_component'].detach()
+                    flow_inputs = normalize_image_torch(flow_inputs)
+                with profiler.stage('forward'):
+                    outputs2 = model(blind2)
+                with profiler.stage('speckle_module'):
+                    flow_outputs = speckle_module(outputs2, outputs='flow_component')
+                    flow_outputs = flow_outputs['flow_component'].detach()
+                    flow_outputs = normalize_image_torch(flow_outputs)
+                    flow_loss2 = torch.mean(torch.abs(flow_outputs - flow_inputs))
                 
-                n2v_loss1 = criterion(outputs1[mask > 0], raw1[mask > 0])
-                n2v_loss2 = criterion(outputs2[mask > 0], raw2[mask > 0])
+                with profiler.stage('loss'):
+                    n2v_loss1 = criterion(outputs1[mask > 0], raw1[mask > 0])
+                    n2v_loss2 = criterion(outputs2[mask > 0], raw2[mask > 0])
 
-                loss = n2v_loss1 + n2v_loss2 + flow_loss1 * alpha + flow_loss2 * alpha
+                    loss = n2v_loss1 + n2v_loss2 + flow_loss1 * alpha + flow_loss2 * alpha
 
             else:
                 #outputs = model(input_imgs)
                 #loss = criterion(outputs, target_imgs)
 
-                outputs1 = model(blind1)
-                outputs2 = model(blind2)
+                with profiler.stage('forward'):
+                    outputs1 = model(blind1)
+                    outputs2 = model(blind2)
             
-                n2v_loss1 = criterion(outputs1[mask > 0], raw1[mask > 0])
-                n2v_loss2 = criterion(outputs2[mask > 0], raw2[mask > 0])
+                with profiler.stage('loss'):
+                    n2v_loss1 = criterion(outputs1[mask > 0], raw1[mask > 0])
+                    n2v_loss2 = criterion(outputs2[mask > 0], raw2[mask > 0])
 
-                loss = n2v_loss1 + n2v_loss2
+                    loss = n2v_loss1 + n2v_loss2
             
             if optimizer:
-                loss.backward()
-                optimizer.step()
+                with profiler.stage('backward'):
+                    loss.backward()
+                with profiler.stage('optimizer'):
+                    optimizer.step()
             
             total_loss += loss.item()
 
@@ -1076,7 +1093,8 @@ def process_batch_n2v(
                         'Total Loss': loss.item()
                     }
                     
-                plot_images(images, titles, losses)
+                with profiler.stage('plot'):
+                    plot_images(images, titles, losses)
     
     return total_loss / len(loader)
 
@@ -1164,64 +1182,129 @@ def visualise_n2v(raw1, blind1, blind2, output1, output2):
 
 def train_n2v(model, train_loader, val_loader, optimizer, criterion, starting_epoch, epochs, batch_size, lr, 
           best_val_loss, checkpoint_path=None, device='cuda', visualise=False, 
-          speckle_module=None, alpha=1, save=False, method='n2v', octa_criterion=None, threshold=0.0, mask_ratio=0.1):
+          speckle_module=None, alpha=1, save=False, method='n2v', octa_criterion=None, threshold=0.0, mask_ratio=0.1,
+          best_metrics_score=None, scheduler=None, budget=None, quality_logger=None, profiler=None):
     """
     Train function that handles both Noise2Void and Noise2Self approaches.
     
     Args:
         method (str): 'n2v' for Noise2Void or 'n2s' for Noise2Self
+        best_metrics_score (float): Score to beat for the best-metrics checkpoint.
+        scheduler: Stepped with the validation loss after every epoch.
     """
 
     last_checkpoint_path = checkpoint_path + f'_last_checkpoint.pth'
     best_checkpoint_path = checkpoint_path + f'_best_checkpoint.pth'
+    best_metrics_checkpoint_path = checkpoint_path + '_best_metrics_checkpoint.pth'
+    if best_metrics_score is None:
+        best_metrics_score = float('-inf')
 
     print(f"Saving checkpoints to {best_checkpoint_path}")
 
     start_time = time.time()
-    for epoch in range(starting_epoch, starting_epoch+epochs):
-        model.train()
-
-        #print(model)
-
-        train_loss = process_batch_n2v(model, train_loader, criterion, mask_ratio,
-            optimizer=optimizer, 
-            device='cuda',
-            speckle_module=speckle_module,
-            visualize=False)
-        
-        model.eval()
-        with torch.no_grad():
-            val_loss = process_batch_n2v(model, val_loader, criterion, mask_ratio,
-                optimizer=None, 
-                device='cuda',
+    checkpoint_writer = CheckpointWriter()
+    try:
+        if budget is None:
+            budget = TrainingBudget()
+        budget.start()
+        if profiler is None:
+            profiler = NULL_PROFILER
+        profiler.start()
+        # fixed validation image the per-epoch metrics are computed on
+        val_sample = next(iter(val_loader))[0][:1].to(device)
+        for epoch in range(starting_epoch, starting_epoch+epochs):
+            model.train()
+
+            #print(model)
+
+            train_loss = process_batch_n2v(model, train_loader, criterion, mask_ratio,
+                optimizer=optimizer, 
+                device=device,
                 speckle_module=speckle_module,
-                visualize=True)
-
-        print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
+                visualize=False,
+                profiler=profiler)
         
-        if val_loss < best_val_loss and save:
-            best_val_loss = val_loss
-            print(f"Saving best model with val loss: {val_loss:.6f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss
-            }, best_checkpoint_path)
-    
-    if save:
-        print(f"Saving last model with val loss: {val_loss:.6f}")
-        torch.save({
-                    'epoch': epoch,
-                    'model_state_dict': model.state_dict(),
-                    'optimizer_state_dict': optimizer.state_dict(),
-                    'train_loss': train_loss,
-                    'val_loss': val_loss,
-                    'best_val_loss': best_val_loss
-            }, last_checkpoint_path)
-    
+            model.eval()
+            with torch.no_grad():
+                val_loss = process_batch_n2v(model, val_loader, criterion, mask_ratio,
+                    optimizer=None, 
+                    device=device,
+                    speckle_module=speckle_module,
+                    visualize=True,
+                    profiler=profiler)
+                with profiler.stage('metrics'):
+                    val_output = model(val_sample)
+                    val_metrics = evaluate_oct_denoising(val_sample[0][0].cpu().numpy(), val_output[0][0].cpu().numpy())
+                    val_metrics_score = (
+                        val_metrics.get('snr', 0) * 0.3 + 
+                        val_metrics.get('cnr', 0) * 0.3 + 
+                        val_metrics.get('enl', 0) * 0.2 + 
+                        val_metrics.get('epi', 0) * 0.2
+                    )
+
+            if scheduler is not None:
+                scheduler.step(val_loss)
+
+            print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
+        
+            if val_loss < best_val_loss and save:
+                best_val_loss = val_loss
+                print(f"Saving best model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                        'epoch': epoch,
+                        'memory': profiler.memory_summary(),
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'metrics': val_metrics,
+                        'metrics_score': val_metrics_score,
+                        'best_val_loss': best_val_loss
+                    }, best_checkpoint_path)
+
+            if val_metrics_score > best_metrics_score and save:
+                best_metrics_score = val_metrics_score
+                print(f"Saving best metrics model with score: {val_metrics_score:.4f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                        'epoch': epoch,
+                        'memory': profiler.memory_summary(),
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'metrics': val_metrics,
+                        'metrics_score': val_metrics_score,
+                        'best_val_loss': best_val_loss
+                    }, best_metrics_checkpoint_path)
+
+            memory = profiler.memory_summary()
+            profiler.epoch_end(epoch)
+            stop_reason = budget.step(val_loss, images_per_epoch(train_loader))
+            if quality_logger is not None:
+                quality_logger.log(epoch, budget.elapsed, budget.images_seen, val_loss, train_loss, {**val_metrics, **memory})
+            if stop_reason is not None:
+                print(f"Stopping early after epoch {epoch+1}: {stop_reason}")
+                break
+    
+        if save:
+            print(f"Saving last model with val loss: {val_loss:.6f}")
+            checkpoint_writer.save({
+                        'epoch': epoch,
+                        'memory': profiler.memory_summary(),
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'metrics': val_metrics,
+                        'metrics_score': val_metrics_score,
+                        'best_val_loss': best_val_loss
+                }, last_checkpoint_path)
+    
+        profiler.stop()
+    finally:
+        checkpoint_writer.close()
     elapsed_time = time.time() - start_time
     print(f"Training completed in {elapsed_time / 60:.2f} minutes")
     
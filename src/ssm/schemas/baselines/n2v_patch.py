@@ -1,6 +1,9 @@
 import torch.optim as optim
 import time
 import torch
+from ssm.utils.checkpoint import CheckpointWriter
+from ssm.utils.budget import TrainingBudget, images_per_epoch
+from ssm.utils.profiling import NULL_PROFILER
 from IPython.display import clear_output
 
 import sys
@@ -1004,23 +1007,23 @@ def process_batch_n2v(
                 optimizer.zero_grad()
 
             if speckle_module is not None:
-                flow_inputs = speckle_module(raw1)
+                flow_inputs = speckle_module(raw1, outputs='flow_component')
                 flow_inputs = flow_inputs['flow_component'].detach()
                 flow_inputs = normalize_image_torch(flow_inputs)
                 outputs1 = model(blind1)
                 
                 #outputs1 = model(blind1)
                 #outputs2 = model(blind2)
-                flow_outputs = speckle_module(outputs1)
+                flow_outputs = speckle_module(outputs1, outputs='flow_component')
                 flow_outputs = flow_outputs['flow_component'].detach()
                 flow_outputs = normalize_image_torch(flow_outputs)
                 flow_loss1 = torch.mean(torch.abs(flow_outputs - flow_inputs))
 
-                flow_inputs = speckle_module(raw2)
+                flow_inputs = speckle_module(raw2, outputs='flow_component')
                 flow_inputs = flow_inputs['flow_component'].detach()
                 flow_inputs = normalize_image_torch(flow_inputs)
                 outputs2 = model(blind2)
-                flow_outputs = speckle_module(outputs2)
+                flow_outputs = speckle_module(outputs2, outputs='flow_component')
                 flow_outputs = flow_outputs['flow_component'].detach()
                 flow_outputs = normalize_image_torch(flow_outputs)
                 flow_loss2 = torch.mean(torch.abs(flow_outputs - flow_inputs))
@@ -1195,7 +1198,8 @@ def process_batch_n2v_patch(
         speckle_module=None,
         visualize=False,
         alpha=1.0,
-        scheduler=None
+        scheduler=None,
+        profiler=NULL_PROFILER
         ):
     
     if optimizer: 
@@ -1212,15 +1216,17 @@ def process_batch_n2v_patch(
     context_manager = torch.no_grad() if not optimizer else nullcontext()
     
     with context_manager:
-        for batch_idx, batch in enumerate(tqdm(loader)):
+        for batch_idx, batch in enumerate(tqdm(profiler.iterate(loader), total=len(loader))):
             raw1, raw2 = batch
 
-            raw1 = raw1.to(device)
-            raw2 = raw2.to(device)
+            with profiler.stage('data'):
+                raw1 = raw1.to(device)
+                raw2 = raw2.to(device)
 
             # Extract patches
-            raw1_patches, patch_locations1 = extract_patches(raw1, patch_size, stride)
-            raw2_patches, patch_locations2 = extract_patches(raw2, patch_size, stride)
+            with profiler.stage('patches'):
+                raw1_patches, patch_locations1 = extract_patches(raw1, patch_size, stride)
+                raw2_patches, patch_locations2 = extract_patches(raw2, patch_size, stride)
 
             print(f"Raw1 patches shape: {raw1_patches.shape}")
             print(f"Raw2 patches shape: {raw2_patches.shape}")
@@ -1235,104 +1241,117 @@ def process_batch_n2v_patch(
                 raw1_sub_batch = raw1_patches[i:i+sub_batch_size]
                 raw2_sub_batch = raw2_patches[i:i+sub_batch_size]
 
-                mask = torch.bernoulli(torch.full((raw1_sub_batch.size(0), 1, raw1_sub_batch.size(2), raw1_sub_batch.size(3)), 
-                                            mask_ratio, device=device))
-                
-                blind1 = create_blind_spot_input_with_realistic_noise(raw1_sub_batch, mask).requires_grad_(True)
-                blind2 = create_blind_spot_input_with_realistic_noise(raw2_sub_batch, mask).requires_grad_(True)
+                with profiler.stage('masking'):
+                    mask = torch.bernoulli(torch.full((raw1_sub_batch.size(0), 1, raw1_sub_batch.size(2), raw1_sub_batch.size(3)), 
+                                                mask_ratio, device=device))
+                    
+                    blind1 = create_blind_spot_input_with_realistic_noise(raw1_sub_batch, mask).requires_grad_(True)
+                    blind2 = create_blind_spot_input_with_realistic_noise(raw2_sub_batch, mask).requires_grad_(True)
                 
                 if speckle_module is not None:
-                    flow_inputs = speckle_module(raw1_sub_batch)
-                    flow_inputs = flow_inputs['flow_component'].detach()
-                    flow_inputs = normalize_image_torch(flow_inputs)
-                    outputs1 = model(blind1)
-                    all_output1_patches.append(outputs1.detach())
+                    with profiler.stage('speckle_module'):
+                        flow_inputs = speckle_module(raw1_sub_batch, outputs='flow_component')
+                        flow_inputs = flow_inputs['flow_component'].detach()
+                        flow_inputs = normalize_image_torch(flow_inputs)
+                    with profiler.stage('forward'):
+                        outputs1 = model(blind1)
+                        all_output1_patches.append(outputs1.detach())
                     
-                    flow_outputs = speckle_module(outputs1)
-                    flow_outputs = flow_outputs['flow_component'].detach()
-                    flow_outputs = normalize_image_torch(flow_outputs)
-                    flow_loss1 = torch.mean(torch.abs(flow_outputs - flow_inputs))
-
-                    flow_inputs = speckle_module(raw2_sub_batch)
-                    flow_inputs = flow_inputs['flow_component'].detach()
-                    flow_inputs = normalize_image_torch(flow_inputs)
-                    outputs2 = model(blind2)
-                    all_output2_patches.append(outputs2.detach())
+                    with profiler.stage('speckle_module'):
+                        flow_outputs = speckle_module(outputs1, outputs='flow_component')
+                        flow_outputs = flow_outputs['flow_component'].detach()
+                        flow_outputs = normalize_image_torch(flow_outputs)
+                        flow_loss1 = torch.mean(torch.abs(flow_outputs - flow_inputs))
+
+                        flow_inputs = speckle_module(raw2_sub_batch, outputs='flow_component')
+                        flow_inputs = flow_inputs['flow_component'].detach()
+                        flow_inputs = normalize_image_torch(flow_inputs)
+                    with profiler.stage('forward'):
+                        outputs2 = model(blind2)
+                        all_output2_patches.append(outputs2.detach())
                     
-                    flow_outputs = speckle_module(outputs2)
-                    flow_outputs = flow_outputs['flow_component'].detach()
-                    flow_outputs = normalize_image_torch(flow_outputs)
-                    flow_loss2 = torch.mean(torch.abs(flow_outputs - flow_inputs))
+                    with profiler.stage('speckle_module'):
+                        flow_outputs = speckle_module(outputs2, outputs='flow_component')
+                        flow_outputs = flow_outputs['flow_component'].detach()
+                        flow_outputs = normalize_image_torch(flow_outputs)
+                        flow_loss2 = torch.mean(torch.abs(flow_outputs - flow_inputs))
                     
-                    n2v_loss1 = criterion(outputs1[mask > 0], raw1_sub_batch[mask > 0])
-                    n2v_loss2 = criterion(outputs2[mask > 0], raw2_sub_batch[mask > 0])
+                    with profiler.stage('loss'):
+                        n2v_loss1 = criterion(outputs1[mask > 0], raw1_sub_batch[mask > 0])
+                        n2v_loss2 = criterion(outputs2[mask > 0], raw2_sub_batch[mask > 0])
 
-                    sub_loss = n2v_loss1 + n2v_loss2 + flow_loss1 * alpha + flow_loss2 * alpha
+                        sub_loss = n2v_loss1 + n2v_loss2 + flow_loss1 * alpha + flow_loss2 * alpha
                     #sub_loss = (n2v_loss1 + n2v_loss2 + flow_loss1 * alpha + flow_loss2 * alpha) / ((len(raw1_patches) + sub_batch_size - 1) // sub_batch_size)
 
                 else:
-                    outputs1 = model(blind1)
-                    outputs2 = model(blind2)
-                    all_output1_patches.append(outputs1.detach())
-                    all_output2_patches.append(outputs2.detach())
+                    with profiler.stage('forward'):
+                        outputs1 = model(blind1)
+                        outputs2 = model(blind2)
+                        all_output1_patches.append(outputs1.detach())
+                        all_output2_patches.append(outputs2.detach())
                 
-                    n2v_loss1 = criterion(outputs1[mask > 0], raw1_sub_batch[mask > 0])
-                    n2v_loss2 = criterion(outputs2[mask > 0], raw2_sub_batch[mask > 0])
+                    with profiler.stage('loss'):
+                        n2v_loss1 = criterion(outputs1[mask > 0], raw1_sub_batch[mask > 0])
+                        n2v_loss2 = criterion(outputs2[mask > 0], raw2_sub_batch[mask > 0])
 
-                    sub_loss = n2v_loss1 + n2v_loss2
+                        sub_loss = n2v_loss1 + n2v_loss2
                 
                 batch_loss += sub_loss.item() * len(raw1_sub_batch)
             
             if optimizer:
-                optimizer.zero_grad()
-                sub_loss.backward()
-                torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-                optimizer.step()
+                with profiler.stage('backward'):
+                    optimizer.zero_grad()
+                    sub_loss.backward()
+                with profiler.stage('optimizer'):
+                    torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+                    optimizer.step()
             
             total_loss += batch_loss / len(raw1_patches)
             
             if visualize and batch_idx == 0:
-                # Flatten all output patches
-                output1_patches = torch.cat(all_output1_patches, dim=0)
-                output2_patches = torch.cat(all_output2_patches, dim=0)
+                with profiler.stage('plot'):
+                    # Flatten all output patches
+                    output1_patches = torch.cat(all_output1_patches, dim=0)
+                    output2_patches = torch.cat(all_output2_patches, dim=0)
                 
-                reconstructed_outputs1 = reconstruct_from_patches(
-                    output1_patches, patch_locations1, raw1.shape, patch_size
-                )
+                    reconstructed_outputs1 = reconstruct_from_patches(
+                        output1_patches, patch_locations1, raw1.shape, patch_size
+                    )
                 
-                if speckle_module is not None:
-                    # Create flow components for visualization
-                    flow_inputs_full = speckle_module(raw1)['flow_component'].detach()
-                    flow_outputs_full = speckle_module(reconstructed_outputs1)['flow_component'].detach()
+                    if speckle_module is not None:
+                        # Create flow components for visualization
+                        flow_inputs_full = speckle_module(raw1, outputs='flow_component')['flow_component'].detach()
+                        flow_outputs_full = speckle_module(reconstructed_outputs1, outputs='flow_component')['flow_component'].detach()
                     
-                    titles = ['Input Image', 'Flow Input', 'Flow Output', 'Blind Spot Input', 'Output Image']
-                    images = [
-                        raw1[0][0].cpu().numpy(), 
-                        flow_inputs_full[0][0].cpu().numpy(),
-                        flow_outputs_full[0][0].cpu().numpy(),
-                        blind1[0][0].cpu().numpy(), 
-                        reconstructed_outputs1[0][0].cpu().numpy()
-                    ]
-                    losses = {
-                        'Flow Loss': (flow_loss1.item() + flow_loss2.item()),
-                        'Total Loss': batch_loss / len(raw1_patches)
-                    }
-                else:
-                    titles = ['Input Image', 'Blind Spot Input', 'Output Image']
-                    images = [
-                        raw1[0][0].cpu().numpy(), 
-                        blind1[0][0].cpu().numpy(), 
-                        reconstructed_outputs1[0][0].cpu().numpy()
-                    ]
-                    losses = {
-                        'Total Loss': batch_loss / len(raw1_patches)
-                    }
+                        titles = ['Input Image', 'Flow Input', 'Flow Output', 'Blind Spot Input', 'Output Image']
+                        images = [
+                            raw1[0][0].cpu().numpy(), 
+                            flow_inputs_full[0][0].cpu().numpy(),
+                            flow_outputs_full[0][0].cpu().numpy(),
+                            blind1[0][0].cpu().numpy(), 
+                            reconstructed_outputs1[0][0].cpu().numpy()
+                        ]
+                        losses = {
+                            'Flow Loss': (flow_loss1.item() + flow_loss2.item()),
+                            'Total Loss': batch_loss / len(raw1_patches)
+                        }
+                    else:
+                        titles = ['Input Image', 'Blind Spot Input', 'Output Image']
+                        images = [
+                            raw1[0][0].cpu().numpy(), 
+                            blind1[0][0].cpu().numpy(), 
+                            reconstructed_outputs1[0][0].cpu().numpy()
+                        ]
+                        losses = {
+                            'Total Loss': batch_loss / len(raw1_patches)
+                        }
                     
-                plot_images(images, titles, losses)
+                    plot_images(images, titles, losses)
 
                 from ssm.utils import evaluate_oct_denoising
 
-                metrics = evaluate_oct_denoising(raw1[0][0].cpu().numpy(), reconstructed_outputs1[0][0].cpu().numpy())
+                with profiler.stage('metrics'):
+                    metrics = evaluate_oct_denoising(raw1[0][0].cpu().numpy(), reconstructed_outputs1[0][0].cpu().numpy())
 
     if metrics is not None:
         return total_loss / len(loader), metrics
@@ -1439,50 +1458,54 @@ def train_n2v(model, train_loader, val_loader, optimizer, criterion, starting_ep
     print(f"Saving checkpoints to {best_checkpoint_path}")
 
     start_time = time.time()
-    for epoch in range(starting_epoch, starting_epoch+epochs):
-        model.train()
+    checkpoint_writer = CheckpointWriter()
+    try:
+        for epoch in range(starting_epoch, starting_epoch+epochs):
+            model.train()
 
-        #print(model)
+            #print(model)
 
-        train_loss = process_batch_n2v(model, train_loader, criterion, mask_ratio,
-            optimizer=optimizer, 
-            device='cuda',
-            speckle_module=speckle_module,
-            visualize=False)
-        
-        model.eval()
-        with torch.no_grad():
-            val_loss = process_batch_n2v(model, val_loader, criterion, mask_ratio,
-                optimizer=None, 
+            train_loss = process_batch_n2v(model, train_loader, criterion, mask_ratio,
+                optimizer=optimizer, 
                 device='cuda',
                 speckle_module=speckle_module,
-                visualize=True)
-
-        print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
+                visualize=False)
         
-        if val_loss < best_val_loss and save:
-            best_val_loss = val_loss
-            print(f"Saving best model with val loss: {val_loss:.6f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss
-            }, best_checkpoint_path)
-    
-    if save:
-        print(f"Saving last model with val loss: {val_loss:.6f}")
-        torch.save({
+            model.eval()
+            with torch.no_grad():
+                val_loss = process_batch_n2v(model, val_loader, criterion, mask_ratio,
+                    optimizer=None, 
+                    device='cuda',
+                    speckle_module=speckle_module,
+                    visualize=True)
+
+            print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
+        
+            if val_loss < best_val_loss and save:
+                best_val_loss = val_loss
+                print(f"Saving best model with val loss: {val_loss:.6f}")
+                checkpoint_writer.save({
                     'epoch': epoch,
                     'model_state_dict': model.state_dict(),
                     'optimizer_state_dict': optimizer.state_dict(),
                     'train_loss': train_loss,
                     'val_loss': val_loss,
                     'best_val_loss': best_val_loss
-            }, last_checkpoint_path)
+                }, best_checkpoint_path)
+    
+        if save:
+            print(f"Saving last model with val loss: {val_loss:.6f}")
+            checkpoint_writer.save({
+                        'epoch': epoch,
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'best_val_loss': best_val_loss
+                }, last_checkpoint_path)
     
+    finally:
+        checkpoint_writer.close()
     elapsed_time = time.time() - start_time
     print(f"Training completed in {elapsed_time / 60:.2f} minutes")
     
@@ -1492,7 +1515,7 @@ def train_n2v(model, train_loader, val_loader, optimizer, criterion, starting_ep
 def train_n2v_patch(model, train_loader, val_loader, optimizer, criterion, starting_epoch, epochs, batch_size, lr, 
           best_val_loss, checkpoint_path=None, device='cuda', visualise=False, 
           speckle_module=None, alpha=1, save=False, method='n2v', octa_criterion=None, threshold=0.0, mask_ratio=0.1, best_metrics_score=float('-inf'),
-          scheduler=None, train_config=None):
+          scheduler=None, train_config=None, budget=None, quality_logger=None, profiler=None):
     """
     Train function that handles both Noise2Void and Noise2Self approaches.
     
@@ -1507,71 +1530,54 @@ def train_n2v_patch(model, train_loader, val_loader, optimizer, criterion, start
     print(f"Saving checkpoints to {best_checkpoint_path}")
 
     start_time = time.time()
-    for epoch in range(starting_epoch, starting_epoch+epochs):
-        model.train()
-
-        #print(model)
-
-        train_loss = process_batch_n2v_patch(model, train_loader, criterion, mask_ratio,
-            optimizer=optimizer, 
-            device='cuda',
-            speckle_module=speckle_module,
-            visualize=False)
-        
-        model.eval()
-        with torch.no_grad():
-            val_loss, val_metrics = process_batch_n2v_patch(model, val_loader, criterion, mask_ratio,
-                optimizer=None, 
+    checkpoint_writer = CheckpointWriter()
+    try:
+        if budget is None:
+            budget = TrainingBudget()
+        budget.start()
+        if profiler is None:
+            profiler = NULL_PROFILER
+        profiler.start()
+        for epoch in range(starting_epoch, starting_epoch+epochs):
+            model.train()
+
+            #print(model)
+
+            train_loss = process_batch_n2v_patch(model, train_loader, criterion, mask_ratio,
+                optimizer=optimizer, 
                 device='cuda',
                 speckle_module=speckle_module,
-                visualize=True)
+                visualize=False,
+                profiler=profiler)
+        
+            model.eval()
+            with torch.no_grad():
+                val_loss, val_metrics = process_batch_n2v_patch(model, val_loader, criterion, mask_ratio,
+                    optimizer=None, 
+                    device='cuda',
+                    speckle_module=speckle_module,
+                    visualize=True,
+                    profiler=profiler)
             
-            val_metrics_score = (
-                val_metrics.get('snr', 0) * 0.3 + 
-                val_metrics.get('cnr', 0) * 0.3 + 
-                val_metrics.get('enl', 0) * 0.2 + 
-                val_metrics.get('epi', 0) * 0.2
-            )
+                val_metrics_score = (
+                    val_metrics.get('snr', 0) * 0.3 + 
+                    val_metrics.get('cnr', 0) * 0.3 + 
+                    val_metrics.get('enl', 0) * 0.2 + 
+                    val_metrics.get('epi', 0) * 0.2
+                )
         
-        if scheduler is not None:
-            scheduler.step(val_loss)
+            if scheduler is not None:
+                scheduler.step(val_loss)
 
-        print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
+            print(f"Epoch [{epoch+1}/{starting_epoch+epochs}], Average Loss: {train_loss:.6f}")
         
-        if val_loss < best_val_loss and save:
-            best_val_loss = val_loss
-            print(f"Saving best model with val loss: {val_loss:.6f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss,
-                'metrics': val_metrics,
-                'metrics_score': val_metrics_score,
-                'train_config': train_config
-            }, best_checkpoint_path)
-
-        if val_metrics_score > best_metrics_score  and save:
-            best_metrics_score = val_metrics_score
-            print(f"Saving best metrics model with score: {val_metrics_score:.4f}")
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'train_loss': train_loss,
-                'val_loss': val_loss,
-                'best_val_loss': best_val_loss,
-                'metrics': val_metrics,
-                'metrics_score': val_metrics_score,
-                'train_config': train_config
-            }, best_metrics_checkpoint_path)
-    
-        if save:
-            print(f"Saving last model with val loss: {val_loss:.6f}")
-            torch.save({
+            if val_loss < best_val_loss and save:
+                best_val_loss = val_loss
+                print(f"Saving best model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
                         'epoch': epoch,
+                        'memory': profiler.memory_summary(),
                         'model_state_dict': model.state_dict(),
                         'optimizer_state_dict': optimizer.state_dict(),
                         'train_loss': train_loss,
@@ -1580,8 +1586,53 @@ def train_n2v_patch(model, train_loader, val_loader, optimizer, criterion, start
                         'metrics': val_metrics,
                         'metrics_score': val_metrics_score,
                         'train_config': train_config
-                }, last_checkpoint_path)
-    
+                    }, best_checkpoint_path)
+
+            if val_metrics_score > best_metrics_score  and save:
+                best_metrics_score = val_metrics_score
+                print(f"Saving best metrics model with score: {val_metrics_score:.4f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                        'epoch': epoch,
+                        'memory': profiler.memory_summary(),
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'best_val_loss': best_val_loss,
+                        'metrics': val_metrics,
+                        'metrics_score': val_metrics_score,
+                        'train_config': train_config
+                    }, best_metrics_checkpoint_path)
+    
+            if save:
+                print(f"Saving last model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save({
+                                'epoch': epoch,
+                                'memory': profiler.memory_summary(),
+                                'model_state_dict': model.state_dict(),
+                                'optimizer_state_dict': optimizer.state_dict(),
+                                'train_loss': train_loss,
+                                'val_loss': val_loss,
+                                'best_val_loss': best_val_loss,
+                                'metrics': val_metrics,
+                                'metrics_score': val_metrics_score,
+                                'train_config': train_config
+                        }, last_checkpoint_path)
+
+            memory = profiler.memory_summary()
+            profiler.epoch_end(epoch)
+            stop_reason = budget.step(val_loss, images_per_epoch(train_loader))
+            if quality_logger is not None:
+                quality_logger.log(epoch, budget.elapsed, budget.images_seen, val_loss, train_loss, {**val_metrics, **memory})
+            if stop_reason is not None:
+                print(f"Stopping early after epoch {epoch+1}: {stop_reason}")
+                break
+    
+        profiler.stop()
+    finally:
+        checkpoint_writer.close()
     elapsed_time = time.time() - start_time
     print(f"Training completed in {elapsed_time / 60:.2f} minutes")
     
@@ -1,59 +1,22 @@
 from ssm.utils.config import get_config
 from ssm.utils.eval_utils.evaluate import evaluate
 import torch
-from ssm.models import UNet, UNet2, LargeUNetAttention, LargeUNet2, LargeUNet3
-from ssm.models.unet.large_unet_attention import LargeUNetAtt
-from ssm.models.unet.large_unet_good import LargeUNet
-from ssm.models.unet.small_unet import SmallUNet
-from ssm.models.unet.small_unet_att import SmallUNetAtt
+from ssm.models.registry import build_model, get_checkpoint_prefix, get_checkpoint_file
 
 def load_model(config, verbose=False, last=False, best=False):
-    use_speckle = config['speckle_module']['use']
     eval_config = config['training']
-    base_checkpoint_path = eval_config['baselines_checkpoint_path']
-    method = eval_config['method']
     model = eval_config['model']
-    if use_speckle:
-        best_loss = config['speckle_module']['best']
-        if best_loss:
-            checkpoint_path = base_checkpoint_path + rf"{method}_{model}_ssm_patched_best_checkpoint.pth"
-        else:
-            checkpoint_path = base_checkpoint_path + rf"{method}_{model}_ssm_patched_last_checkpoint.pth"
-    else:
-        checkpoint_path = base_checkpoint_path + rf"{method}_{model}_patched_best_checkpoint.pth"
-
-    if best:
-        checkpoint_path = base_checkpoint_path + rf"{method}_{model}_patched_best_metrics_checkpoint.pth"
     
     device = eval_config['device']
     
-    if model == "UNet":
-        model = UNet(in_channels=1, out_channels=1).to(device)
-    elif model == "UNet2":
-        model = UNet2(in_channels=1, out_channels=1).to(device)
-    elif model == "LargeUNet":
-        model = LargeUNet(in_channels=1, out_channels=1).to(device)
-    elif model == "LargeUNetAttention":
-        model = LargeUNetAttention(in_channels=1, out_channels=1).to(device)
-    elif model == "LargeUNetNoAttention" or model == "LargeUNet2":
-        model = LargeUNet2(in_channels=1, out_channels=1).to(device)
-    elif model == "LargeUNet3":
-        model = LargeUNet3(in_channels=1, out_channels=1).to(device)
-    elif model == "SmallUNet":
-        model = SmallUNet(in_channels=1, out_channels=1).to(device)
-    elif model == "SmallUNetAtt":
-        model = SmallUNetAtt().to(device)
-    elif model == "LargeUNetAtt":
-        model = LargeUNetAtt(in_channels=1, out_channels=1).to(device)
-    else:
-        raise ValueError(f"Model {model} not supported")
+    model = build_model(model).to(device)
 
     checkpoint = load_checkpoint(config, last)
     model.load_state_dict(checkpoint['model_state_dict'])
 
     if verbose:
         print(f"Loading {model} model...")
-        print(f"Checkpoint path: {checkpoint_path}")
+        print(f"Checkpoint path: {get_checkpoint_path(config, last)}")
         for key, value in checkpoint.items():
             #if key != 'model_state_dict' or key != 'optimizer_state_dict':
                 #print(f"{key}: {value}")
@@ -64,62 +27,27 @@ def load_model(config, verbose=False, last=False, best=False):
         print(f"Model loaded successfully")
     return model, checkpoint
 
-def load_checkpoint(config, last=False):
+def get_checkpoint_path(config, last=False, best=False):
     eval_config = config['training']
-    base_checkpoint_path = eval_config['baselines_checkpoint_path']
     ablation = eval_config['ablation'].format(n=config['training']['n_patients'], n_images=config['training']['n_images_per_patient'])
-    method = eval_config['method']
-    model = eval_config['model']
-    if config['speckle_module']['use']:
-        best = config['speckle_module']['best']
-        if best:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_ssm_patched_best_checkpoint.pth"
-        else:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_ssm_patched_last_checkpoint.pth"
-        if last:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_ssm_patched_last_checkpoint.pth"
-    else:
-        if last:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_patched_last_checkpoint.pth"
-        else:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_patched_best_checkpoint.pth"
-    print(f"Checkpoint path: {checkpoint_path}")
-    
-    #print(f"Checkpoint path: {checkpoint_path}")
-    
-    device = eval_config['device']
-    
-    checkpoint = torch.load(checkpoint_path, map_location=device)
-    
-    return checkpoint
+    use_ssm = config['speckle_module']['use']
 
-def load_checkpoint(config, last=False, best=False):
-    eval_config = config['training']
-    base_checkpoint_path = eval_config['baselines_checkpoint_path']
-    ablation = eval_config['ablation'].format(n=config['training']['n_patients'], n_images=config['training']['n_images_per_patient'])
-    method = eval_config['method']
-    model = eval_config['model']
-    
     if best:
-        if config['speckle_module']['use']:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_ssm_patched_best_metrics_checkpoint.pth"
-        else:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_patched_best_metrics_checkpoint.pth"
-    elif config['speckle_module']['use']:
-        best_loss = config['speckle_module']['best']
-        if best_loss and not last:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_ssm_patched_best_checkpoint.pth"
-        else:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_ssm_patched_last_checkpoint.pth"
+        variant = 'best_metrics'
+    elif use_ssm:
+        variant = 'best' if config['speckle_module']['best'] and not last else 'last'
     else:
-        if last:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_patched_last_checkpoint.pth"
-        else:
-            checkpoint_path = base_checkpoint_path + ablation + rf"/{method}_{model}_patched_best_checkpoint.pth"
+        variant = 'last' if last else 'best'
+
+    prefix = get_checkpoint_prefix(eval_config['baselines_checkpoint_path'], ablation, eval_config['method'], eval_config['model'], use_ssm)
+    return get_checkpoint_file(prefix, variant, patched=True)
+
+def load_checkpoint(config, last=False, best=False):
+    checkpoint_path = get_checkpoint_path(config, last, best)
     
     print(f"Checkpoint path: {checkpoint_path}")
     
-    device = eval_config['device']
+    device = config['training']['device']
     
     checkpoint = torch.load(checkpoint_path, map_location=device)
     
@@ -1,3 +1,6 @@
 from .n2_trainer import *
 from .pfn_trainer import *
-from .ssm_trainer import *
\ No newline at end of file
+from .ssm_trainer import *
+from .distributed_trainer import *
+from .distillation_trainer import *
+from .pruning_trainer import *
\ No newline at end of file
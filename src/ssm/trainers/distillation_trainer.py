@@ -0,0 +1,375 @@
+import os
+import json
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import Dataset
+
+from ssm.data import get_shared_paired_dataset, get_loaders_from_dataset
+from ssm.utils.config import get_config
+from ssm.utils.checkpoint import CheckpointWriter
+from ssm.utils.budget import TrainingBudget, TimeToQualityLogger, images_per_epoch
+from ssm.utils.profiling import StageProfiler, NULL_PROFILER
+from ssm.utils.memory import check_cohort_memory
+from ssm.models.registry import build_model, get_model_spec, get_checkpoint_prefix, get_checkpoint_file
+
+def denoise(model, x, output_kind):
+    """Denoised image of a model: the flow component for the speckle separation
+    models (only the flow head is evaluated) and the first target for the
+    progressive fusion models."""
+    if output_kind == 'dict':
+        return model(x, outputs='flow_component')['flow_component']
+    elif output_kind == 'list':
+        return model(x)[0]
+    return model(x)
+
+def get_teacher_checkpoint(config, teacher_method, teacher_model, ssm=False, variant='best', patched=False):
+    """
+    Checkpoint of a trained N2 model under the usual naming scheme, e.g.
+    ``<baselines><ablation>/n2v_LargeUNetAttention_ssm_best_checkpoint.pth``.
+    """
+    train_config = config['training']
+    ablation = train_config['ablation'].format(n=train_config['n_patients'], n_images=train_config['n_images_per_patient'])
+    prefix = get_checkpoint_prefix(train_config['baselines_checkpoint_path'], ablation, teacher_method, teacher_model, ssm)
+    return get_checkpoint_file(prefix, variant, patched)
+
+def load_teacher(model_name, checkpoint_path, device):
+    """Loads a teacher from a training checkpoint and freezes it."""
+
+    teacher = build_model(model_name)
+    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    teacher.load_state_dict(checkpoint['model_state_dict'])
+    teacher.to(device).eval()
+    for p in teacher.parameters():
+        p.requires_grad_(False)
+    return teacher
+
+def build_teacher_cache(teacher, output_kind, dataset, cache_path, teacher_checkpoint, batch_size=8, device='cpu'):
+    """
+    Runs the frozen teacher once over ``dataset`` and stores its outputs in a
+    float32 .npy memmap of shape (N, 1, H, W), indexed like the dataset.
+
+    The cache is reused if ``<cache_path>.json`` describes the same teacher
+    checkpoint (path and modification time) and dataset size.
+
+    Returns:
+        np.memmap: Read-only view of the cached outputs.
+    """
+    metadata_path = cache_path + '.json'
+    metadata = {
+        'teacher_checkpoint': os.path.abspath(teacher_checkpoint),
+        'teacher_mtime': os.path.getmtime(teacher_checkpoint),
+        'n_images': len(dataset),
+    }
+
+    if os.path.exists(cache_path) and os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            if json.load(f) == metadata:
+                print(f"Using cached teacher outputs from {cache_path}")
+                return np.load(cache_path, mmap_mode='r')
+
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False)
+
+    start_time = time.time()
+    cache = None
+    offset = 0
+    with torch.inference_mode():
+        for input_imgs, _ in loader:
+            outputs = denoise(teacher, input_imgs.to(device), output_kind).float().cpu().numpy()
+            if cache is None:
+                cache = np.lib.format.open_memmap(cache_path, mode='w+', dtype=np.float32,
+                                                  shape=(len(dataset),) + outputs.shape[1:])
+            cache[offset:offset + outputs.shape[0]] = outputs
+            offset += outputs.shape[0]
+    cache.flush()
+    del cache
+
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=4)
+    print(f"Cached {offset} teacher outputs to {cache_path} in {time.time() - start_time:.1f}s")
+
+    return np.load(cache_path, mmap_mode='r')
+
+class DistillationDataset(Dataset):
+    """Adds the cached teacher output to every (input, target) pair."""
+    def __init__(self, dataset, teacher_outputs):
+        if len(dataset) != len(teacher_outputs):
+            raise ValueError(f"Dataset has {len(dataset)} images but the teacher cache has {len(teacher_outputs)}")
+        self.dataset = dataset
+        self.teacher_outputs = teacher_outputs
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        input_img, target_img = self.dataset[idx]
+        return input_img, target_img, torch.from_numpy(np.array(self.teacher_outputs[idx]))
+
+def distillation_loss(student_outputs, teacher_outputs, target_imgs, criterion, alpha=0.9):
+    """
+    ``alpha`` weights the soft (teacher) target against the original N2
+    target: alpha * criterion(student, teacher) + (1 - alpha) * criterion(student, target).
+    """
+    loss = alpha * criterion(student_outputs, teacher_outputs)
+    if alpha < 1:
+        loss = loss + (1 - alpha) * criterion(student_outputs, target_imgs)
+    return loss
+
+def _process_batch(data_loader, student, criterion, optimizer, alpha, device, profiler=NULL_PROFILER):
+    training = student.training
+
+    epoch_loss = 0
+    for input_imgs, target_imgs, teacher_imgs in profiler.iterate(data_loader):
+        with profiler.stage('data'):
+            input_imgs = input_imgs.to(device)
+            target_imgs = target_imgs.to(device)
+            teacher_imgs = teacher_imgs.to(device)
+
+        with profiler.stage('forward'):
+            outputs = student(input_imgs)
+        with profiler.stage('loss'):
+            loss = distillation_loss(outputs, teacher_imgs, target_imgs, criterion, alpha)
+
+        if training:
+            with profiler.stage('backward'):
+                optimizer.zero_grad()
+                loss.backward()
+            with profiler.stage('optimizer'):
+                torch.nn.utils.clip_grad_norm_(student.parameters(), max_norm=1.0)
+                optimizer.step()
+
+        epoch_loss += loss.item()
+
+    return epoch_loss / len(data_loader)
+
+def train_distillation(student, train_loader, val_loader, optimizer, criterion, epochs, checkpoint_path,
+                       device='cuda', alpha=0.9, save=False, scheduler=None, budget=None, quality_logger=None, profiler=None):
+    """
+    Trains ``student`` on loaders yielding (input, target, teacher output).
+    Checkpoints use the same keys and suffixes as the N2 trainers.
+    """
+    last_checkpoint_path = get_checkpoint_file(checkpoint_path, 'last')
+    best_checkpoint_path = get_checkpoint_file(checkpoint_path, 'best')
+    best_val_loss = float('inf')
+
+    print(f"Saving checkpoints to {best_checkpoint_path}")
+
+    start_time = time.time()
+    checkpoint_writer = CheckpointWriter()
+    try:
+        if budget is None:
+            budget = TrainingBudget()
+        budget.start()
+        if profiler is None:
+            profiler = NULL_PROFILER
+        profiler.start()
+        for epoch in range(epochs):
+            student.train()
+            train_loss = _process_batch(train_loader, student, criterion, optimizer, alpha, device, profiler)
+
+            student.eval()
+            with torch.no_grad():
+                val_loss = _process_batch(val_loader, student, criterion, optimizer, alpha, device, profiler)
+            if scheduler is not None:
+                scheduler.step(val_loss)
+
+            print(f"Epoch [{epoch+1}/{epochs}], Train Loss: {train_loss:.6f}, Val Loss: {val_loss:.6f}")
+
+            checkpoint = {
+                'epoch': epoch,
+                'model_state_dict': student.state_dict(),
+                'optimizer_state_dict': optimizer.state_dict(),
+                'train_loss': train_loss,
+                'val_loss': val_loss,
+                'best_val_loss': min(best_val_loss, val_loss),
+                'alpha': alpha,
+                'memory': profiler.memory_summary(),
+            }
+            if val_loss < best_val_loss and save:
+                print(f"Saving best model with val loss: {val_loss:.6f}")
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save(checkpoint, best_checkpoint_path)
+            best_val_loss = min(best_val_loss, val_loss)
+            if save:
+                with profiler.stage('checkpoint'):
+                    checkpoint_writer.save(checkpoint, last_checkpoint_path)
+
+            memory = profiler.memory_summary()
+            profiler.epoch_end(epoch)
+            stop_reason = budget.step(val_loss, images_per_epoch(train_loader))
+            if quality_logger is not None:
+                quality_logger.log(epoch, budget.elapsed, budget.images_seen, val_loss, train_loss, memory)
+            if stop_reason is not None:
+                print(f"Stopping early after epoch {epoch+1}: {stop_reason}")
+                break
+
+        profiler.stop()
+    finally:
+        checkpoint_writer.close()
+    print(f"Distillation completed in {(time.time() - start_time) / 60:.2f} minutes")
+
+    return student
+
+def compare_student_teacher(teacher, teacher_kind, student, images, references=None, latency_batch=None):
+    """
+    Evaluates teacher and student with ``evaluate_oct_denoising`` and reports
+    how much quality the student keeps per unit of speedup.
+
+    Args:
+        teacher (nn.Module): Frozen teacher.
+        teacher_kind (str): Output kind of the teacher in the model registry.
+        student (nn.Module): Trained student returning a tensor.
+        images (torch.Tensor): (N, 1, H, W) noisy evaluation images.
+        references (torch.Tensor): Optional (N, 1, H, W) references for PSNR/SSIM.
+        latency_batch (torch.Tensor): Batch to time, defaults to ``images[:8]``.
+
+    Returns:
+        dict: Teacher and student metric means, ``retained`` (student / teacher
+        per metric), latencies, ``speedup``, parameter counts and
+        ``retained_per_speedup`` (retained PSNR, or SSIM without references,
+        divided by the speedup).
+    """
+    from ssm.utils.eval_utils.metrics import evaluate_oct_denoising
+    from ssm.inference.quantise import measure_latency
+
+    teacher = teacher.cpu().eval()
+    student = student.cpu().eval()
+
+    teacher_metrics, student_metrics = [], []
+    with torch.inference_mode():
+        for i in range(images.shape[0]):
+            image = images[i:i + 1]
+            original = image[0, 0].numpy()
+            reference = references[i, 0].numpy() if references is not None else None
+
+            teacher_out = denoise(teacher, image, teacher_kind)[0, 0].numpy()
+            student_out = student(image)[0, 0].numpy()
+
+            teacher_metrics.append(evaluate_oct_denoising(original, teacher_out, reference))
+            student_metrics.append(evaluate_oct_denoising(original, student_out, reference))
+
+    def mean_metrics(metrics):
+        keys = metrics[0].keys()
+        return {k: float(np.nanmean([m.get(k, np.nan) for m in metrics])) for k in keys}
+
+    teacher_mean = mean_metrics(teacher_metrics)
+    student_mean = mean_metrics(student_metrics)
+    retained = {k: student_mean[k] / teacher_mean[k] if teacher_mean[k] else float('nan') for k in teacher_mean}
+
+    if latency_batch is None:
+        latency_batch = images[:8]
+    teacher_latency = measure_latency(lambda x: denoise(teacher, x, teacher_kind), latency_batch)
+    student_latency = measure_latency(student, latency_batch)
+    speedup = teacher_latency / student_latency
+
+    headline = 'psnr' if references is not None else 'epi'
+
+    return {
+        'teacher': teacher_mean,
+        'student': student_mean,
+        'retained': retained,
+        'teacher_latency_ms': teacher_latency,
+        'student_latency_ms': student_latency,
+        'speedup': speedup,
+        'teacher_params': sum(p.numel() for p in teacher.parameters()),
+        'student_params': sum(p.numel() for p in student.parameters()),
+        'retained_metric': headline,
+        'retained_per_speedup': retained[headline] / speedup,
+    }
+
+def distill(config_path=None, override_config=None):
+    """
+    Distils a trained N2 model into a small student.
+
+    Reads the optional ``distillation`` config section:
+
+    - ``teacher_model`` / ``teacher_method`` / ``teacher_ssm``: teacher
+      checkpoint, defaults to the ``training`` model trained with n2v + ssm.
+    - ``teacher_variant``: "best", "last" or "best_metrics" (default "best").
+    - ``teacher_patched``: teacher trained with the patch trainers.
+    - ``student_model``: registry name, default "SmallUNet".
+    - ``alpha``: weight of the teacher target (default 0.9).
+    - ``epochs``, ``learning_rate``: default to the ``training`` values.
+    - ``cache_dir``: where the teacher outputs are cached.
+
+    The student is saved next to the teacher as
+    ``distil_<teacher_method>_<student_model>[_ssm]_{best,last}_checkpoint.pth``.
+    """
+    if config_path is None:
+        raise ValueError("Config path must be specified.")
+
+    config = get_config(config_path, override_config)
+    train_config = config['training']
+    distil_config = config.get('distillation', {})
+
+    teacher_model = distil_config.get('teacher_model', train_config['model'])
+    teacher_method = distil_config.get('teacher_method', 'n2v')
+    teacher_ssm = distil_config.get('teacher_ssm', True)
+    student_model = distil_config.get('student_model', 'SmallUNet')
+    alpha = distil_config.get('alpha', 0.9)
+    epochs = distil_config.get('epochs', train_config['epochs'])
+    learning_rate = distil_config.get('learning_rate', train_config['learning_rate'])
+
+    if get_model_spec(student_model)['output'] != 'tensor':
+        raise ValueError(f"Student {student_model} must return a single tensor")
+
+    n_patients = train_config['n_patients']
+    n_images_per_patient = train_config['n_images_per_patient']
+    start = train_config['start_patient'] if train_config['start_patient'] else 1
+    ablation = train_config['ablation'].format(n=n_patients, n_images=n_images_per_patient)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    teacher_checkpoint = get_teacher_checkpoint(config, teacher_method, teacher_model, teacher_ssm,
+                                                distil_config.get('teacher_variant', 'best'),
+                                                distil_config.get('teacher_patched', False))
+    print(f"Teacher: {teacher_model} from {teacher_checkpoint}")
+    teacher = load_teacher(teacher_model, teacher_checkpoint, device)
+
+    check_cohort_memory(train_config, shared=True)
+    dataset = get_shared_paired_dataset(start, n_patients, n_images_per_patient)
+
+    teacher_name = os.path.splitext(os.path.basename(teacher_checkpoint))[0]
+    cache_dir = distil_config.get('cache_dir', train_config['baselines_checkpoint_path'] + ablation + '/teacher_cache')
+    cache_path = os.path.join(cache_dir, f"{teacher_name}_start{start}.npy")
+    teacher_outputs = build_teacher_cache(teacher, get_model_spec(teacher_model)['output'], dataset, cache_path,
+                                          teacher_checkpoint, train_config['batch_size'], device)
+
+    train_loader, val_loader = get_loaders_from_dataset(DistillationDataset(dataset, teacher_outputs), train_config['batch_size'])
+
+    student = build_model(student_model).to(device)
+    optimizer = optim.Adam(student.parameters(), lr=learning_rate, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, 'min', patience=5, factor=0.5)
+    criterion = train_config.get('criterion', nn.MSELoss())
+    if not isinstance(criterion, nn.Module):
+        criterion = nn.MSELoss()
+
+    save = train_config['save']
+    checkpoint_path = get_checkpoint_prefix(train_config['baselines_checkpoint_path'], ablation,
+                                            f"distil_{teacher_method}", student_model, teacher_ssm)
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+
+    profiler = StageProfiler.from_config(train_config, checkpoint_path if save else None)
+    profiler.record_dataset(train_loader.dataset, val_loader.dataset)
+
+    student = train_distillation(
+        student,
+        train_loader,
+        val_loader,
+        optimizer=optimizer,
+        criterion=criterion,
+        epochs=epochs,
+        checkpoint_path=checkpoint_path,
+        device=device,
+        alpha=alpha,
+        save=save,
+        scheduler=scheduler,
+        budget=TrainingBudget.from_config(train_config),
+        quality_logger=TimeToQualityLogger(checkpoint_path + '_time_to_quality.csv' if save else None),
+        profiler=profiler)
+
+    return teacher, student
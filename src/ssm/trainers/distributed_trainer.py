@@ -0,0 +1,252 @@
+import os
+import time
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import DataLoader, Subset
+from torch.utils.data.distributed import DistributedSampler
+
+import numpy as np
+
+from ssm.data.paired_dataset import PairedOCTDataset
+from ssm.utils.config import get_config
+from ssm.utils.seed import set_seed
+from ssm.utils.checkpoint import CheckpointWriter
+from ssm.trainers.n2_trainer import get_n2_model, get_checkpoint_path, load_speckle_module
+
+from ssm.schemas.baselines.n2n import process_batch
+from ssm.schemas.baselines.n2v import process_batch_n2v
+from ssm.schemas.baselines.n2s import process_batch_n2s_with_clean_inference
+
+def train_n2_distributed(config_path=None, schema=None, ssm=False, override_config=None, world_size=None):
+    """
+    Data-parallel N2 training on CPU hosts with DistributedDataParallel (gloo).
+
+    When launched through ``torchrun`` the process group is taken from the
+    environment (RANK, WORLD_SIZE, LOCAL_RANK, MASTER_ADDR, MASTER_PORT), which
+    is how several hosts are joined. Otherwise ``world_size`` worker processes
+    are spawned on this machine.
+
+    Args:
+        config_path (str): Path to the N2 yaml config.
+        schema (str): One of "n2n", "n2v", "n2s".
+        ssm (bool): Add the speckle separation flow loss.
+        override_config (dict): Config overrides, as for ``train_n2``.
+        world_size (int): Number of local worker processes when not launched
+            through torchrun. Defaults to ``training.world_size`` or 2.
+    """
+
+    if config_path is None:
+        raise ValueError("Config path must be specified.")
+
+    if schema is None:
+        raise ValueError("Model must be specified.")
+
+    if "RANK" in os.environ and "WORLD_SIZE" in os.environ:
+        _worker(int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"]), config_path, schema, ssm, override_config)
+        return
+
+    if world_size is None:
+        config = get_config(config_path, override_config)
+        world_size = config['training'].get('world_size', 2)
+
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", "29500")
+
+    mp.spawn(_worker, args=(world_size, config_path, schema, ssm, override_config), nprocs=world_size, join=True)
+
+def get_distributed_paired_loaders(dataset, rank, world_size, batch_size, val_split=0.2, seed=42):
+    """
+    Splits ``dataset`` exactly like ``get_paired_loaders`` and shards the
+    training subset across ranks. The global batch is divided between the
+    ranks so an epoch takes the same number of optimiser steps as a single
+    process run. The validation loader is only meant to be used on rank 0.
+    """
+
+    dataset_size = len(dataset)
+    val_size = int(val_split * dataset_size)
+    train_size = dataset_size - val_size
+
+    train_dataset = Subset(dataset, np.arange(train_size))
+    val_dataset = Subset(dataset, np.arange(train_size, dataset_size))
+
+    train_sampler = DistributedSampler(train_dataset, num_replicas=world_size, rank=rank,
+                                       shuffle=True, seed=seed, drop_last=True)
+
+    per_rank_batch_size = max(1, batch_size // world_size)
+
+    train_loader = DataLoader(
+        train_dataset,
+        batch_size=per_rank_batch_size,
+        sampler=train_sampler,
+        num_workers=0,
+        drop_last=True
+    )
+
+    val_loader = DataLoader(
+        val_dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=0,
+        drop_last=True
+    )
+
+    return train_loader, val_loader, train_sampler
+
+class _RecordingScheduler:
+    """Stands in for the scheduler during rank 0 validation so that every
+    rank can replay the same ``step`` calls afterwards."""
+
+    def __init__(self):
+        self.losses = []
+
+    def step(self, metrics):
+        self.losses.append(float(metrics))
+
+def _run_epoch(method, model, loader, criterion, optimizer, epoch, epochs, device, speckle_module, alpha, scheduler, mask_ratio):
+
+    if method == "n2n":
+        return process_batch(loader, model, criterion, optimizer, epoch, epochs, device, False, speckle_module, alpha, scheduler)
+    elif method == "n2v":
+        return process_batch_n2v(model, loader, criterion, mask_ratio,
+            optimizer=optimizer if model.training else None,
+            device=device,
+            speckle_module=speckle_module,
+            visualize=False,
+            alpha=alpha)
+    elif method == "n2s":
+        return process_batch_n2s_with_clean_inference(loader, model, criterion, optimizer, epoch, epochs, device, False, speckle_module, alpha)
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+def _worker(rank, world_size, config_path, schema, ssm, override_config):
+
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+    try:
+        _train_distributed(rank, world_size, config_path, schema, ssm, override_config)
+    finally:
+        dist.destroy_process_group()
+
+def _train_distributed(rank, world_size, config_path, schema, ssm, override_config):
+
+    config = get_config(config_path, override_config)
+    train_config = config['training']
+
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+
+    device = torch.device('cpu')
+    seed = train_config.get('seed', 42)
+
+    n_patients = train_config['n_patients']
+    n_images_per_patient = train_config['n_images_per_patient']
+    batch_size = train_config['batch_size']
+    start = train_config['start_patient'] if train_config['start_patient'] else 1
+
+    # every rank shuffles patients identically so the datasets line up
+    set_seed(seed)
+    dataset = PairedOCTDataset(start, n_patients=n_patients, n_images_per_patient=n_images_per_patient)
+    train_loader, val_loader, train_sampler = get_distributed_paired_loaders(dataset, rank, world_size, batch_size, seed=seed)
+
+    baselines_checkpoint_path, checkpoint_path = get_checkpoint_path(config, schema, ssm)
+    last_checkpoint_path = checkpoint_path + '_last_checkpoint.pth'
+    best_checkpoint_path = checkpoint_path + '_best_checkpoint.pth'
+
+    if rank == 0:
+        if not os.path.exists(baselines_checkpoint_path):
+            os.makedirs(baselines_checkpoint_path)
+        print(f"Training method: {schema} on {world_size} processes")
+        print(f"Train set size: {len(train_loader.dataset)}, per rank batch size: {train_loader.batch_size}")
+        print(f"Saving checkpoints to {best_checkpoint_path}")
+
+    set_seed(seed)
+    model = get_n2_model(train_config['model'], device)
+    ddp_model = DDP(model)
+
+    speckle_module, alpha = load_speckle_module(config, ssm, device)
+    if speckle_module is not None:
+        speckle_module.eval()
+
+    optimizer = optim.Adam(ddp_model.parameters(), lr=train_config['learning_rate'], weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, 'min', patience=5, factor=0.5)
+
+    criterion = train_config['criterion']
+    mask_ratio = train_config.get('mask_ratio', 0.1)
+    epochs = train_config['epochs']
+    save = train_config['save']
+    best_val_loss = float('inf')
+
+    # different masks per rank, the model weights stay in sync through DDP
+    set_seed(seed + rank)
+
+    start_time = time.time()
+    checkpoint_writer = CheckpointWriter()
+    try:
+        for epoch in range(epochs):
+            train_sampler.set_epoch(epoch)
+
+            ddp_model.train()
+            train_loss = _run_epoch(schema, ddp_model, train_loader, criterion, optimizer, epoch, epochs,
+                                    device, speckle_module, alpha, scheduler, mask_ratio)
+
+            train_loss = torch.tensor(train_loss, dtype=torch.float64)
+            dist.all_reduce(train_loss, op=dist.ReduceOp.SUM)
+            train_loss = train_loss.item() / world_size
+
+            # rank 0 validates on the unwrapped module so no collectives are issued
+            val_losses = torch.zeros(len(val_loader) + 1, dtype=torch.float64)
+            if rank == 0:
+                recorder = _RecordingScheduler()
+                model.eval()
+                with torch.no_grad():
+                    val_loss = _run_epoch(schema, model, val_loader, criterion, optimizer, epoch, epochs,
+                                          device, speckle_module, alpha, recorder, mask_ratio)
+                val_losses[0] = val_loss
+                val_losses[1:1 + len(recorder.losses)] = torch.tensor(recorder.losses, dtype=torch.float64)
+            dist.broadcast(val_losses, src=0)
+            val_loss = val_losses[0].item()
+
+            # n2n steps the plateau scheduler per validation batch, replay it on every rank
+            if schema == "n2n":
+                for loss in val_losses[1:].tolist():
+                    scheduler.step(loss)
+
+            if rank == 0:
+                print(f"Epoch [{epoch+1}/{epochs}], Average Loss: {train_loss:.6f}, Val Loss: {val_loss:.6f}")
+
+                if val_loss < best_val_loss and save:
+                    best_val_loss = val_loss
+                    print(f"Saving best model with val loss: {val_loss:.6f}")
+                    checkpoint_writer.save({
+                        'epoch': epoch,
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'best_val_loss': best_val_loss,
+                        'world_size': world_size
+                    }, best_checkpoint_path)
+
+                if save:
+                    checkpoint_writer.save({
+                        'epoch': epoch,
+                        'model_state_dict': model.state_dict(),
+                        'optimizer_state_dict': optimizer.state_dict(),
+                        'train_loss': train_loss,
+                        'val_loss': val_loss,
+                        'best_val_loss': best_val_loss,
+                        'world_size': world_size
+                    }, last_checkpoint_path)
+
+            dist.barrier()
+
+    finally:
+        checkpoint_writer.close()
+
+    if rank == 0:
+        elapsed_time = time.time() - start_time
+        print(f"Training completed in {elapsed_time / 60:.2f} minutes")
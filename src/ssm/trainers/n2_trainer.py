@@ -1,13 +1,6 @@
-from ssm.data import get_paired_loaders
+from ssm.data import get_paired_loaders, get_shared_paired_dataset, get_loaders_from_dataset
 from ssm.utils.config import get_config
-from ssm.models.unet.unet import UNet
-from ssm.models.unet.unet_2 import UNet2
-from ssm.models.unet.large_unet import LargeUNetAttention, LargeUNet2, LargeUNet3
-from ssm.models.unet.large_unet_good import LargeUNet
-from ssm.models.unet.large_unet_attention import LargeUNetAtt
-from ssm.models.ssm.ssm_attention import SpeckleSeparationUNetAttention
-from ssm.models.unet.small_unet import SmallUNet
-from ssm.models.unet.small_unet_att import SmallUNetAtt
+from ssm.models.registry import build_model, get_checkpoint_prefix, get_checkpoint_file
 
 from ssm.schemas.baselines.n2n import train_n2n
 from ssm.schemas.baselines.n2v import train_n2v
@@ -19,9 +12,13 @@ from ssm.schemas.baselines.n2v_patch import train_n2v_patch
 import os
 import torch.optim as optim
 import torch
+import torch.multiprocessing as mp
 
 import random
 from ssm.utils import load_sdoct_dataset, normalize_image_np
+from ssm.utils.budget import TrainingBudget, TimeToQualityLogger
+from ssm.utils.profiling import StageProfiler
+from ssm.utils.memory import check_cohort_memory
 
 def train_n2(config_path=None, schema=None, ssm=False, override_config=None):
     
@@ -35,7 +32,69 @@ def train_n2(config_path=None, schema=None, ssm=False, override_config=None):
 
     train(config, schema, ssm)
 
-def train(config, method, ssm):
+def get_n2_model(model_name, device):
+
+    try:
+        model = build_model(model_name)
+    except ValueError:
+        raise ValueError("Model not found")
+
+    return model.to(device)
+
+def get_checkpoint_path(config, method, ssm):
+    """
+    Returns the ablation directory and the checkpoint prefix for a schema,
+    e.g. ``<baselines>/<ablation>/n2n_LargeUNet_ssm``. The trainers append
+    ``_best_checkpoint.pth`` / ``_last_checkpoint.pth`` to the prefix.
+    """
+    train_config = config['training']
+
+    n_patients = train_config['n_patients']
+    n_images_per_patient = train_config['n_images_per_patient']
+    ablation = train_config['ablation'].format(n=n_patients, n_images=n_images_per_patient)
+
+    baselines_checkpoint_path = train_config['baselines_checkpoint_path'] + ablation
+
+    use_ssm = config['speckle_module']['use'] is True or ssm
+    checkpoint_path = get_checkpoint_prefix(train_config['baselines_checkpoint_path'], ablation, method, train_config['model'], use_ssm)
+    if use_ssm:
+        print("Checkpoint path: ", checkpoint_path)
+
+    return baselines_checkpoint_path, checkpoint_path
+
+def get_best_checkpoint_file(config, method, ssm):
+    """
+    Returns the best checkpoint ``train`` writes for a schema, the
+    ``_patched`` one when ``training.patch`` selects the n2n/n2v patch
+    trainers.
+    """
+    _, checkpoint_path = get_checkpoint_path(config, method, ssm)
+    patched = config['training'].get('patch', False) and method in ("n2n", "n2v")
+    return get_checkpoint_file(checkpoint_path, 'best', patched=patched)
+
+def load_speckle_module(config, ssm, device):
+
+    alpha = 1
+
+    if config['speckle_module']['use'] is True or ssm:
+        speckle_module = build_model('SpeckleSeparationUNetAttention').to(device)
+        try:
+            print("Loading ssm model from checkpoint...")
+            ssm_checkpoint_path = config['training']['ssm_checkpoint_path']
+            ssm_checkpoint = torch.load(ssm_checkpoint_path, map_location=device)
+            speckle_module.load_state_dict(ssm_checkpoint['model_state_dict'])
+            speckle_module.to(device)
+            alpha = config['speckle_module']['alpha']
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            print("Starting training from scratch.")
+            raise e 
+    else:
+        speckle_module = None
+
+    return speckle_module, alpha
+
+def train(config, method, ssm, loaders=None, model=None):
 
     train_config = config['training']
     if method is None:
@@ -49,50 +108,28 @@ def train(config, method, ssm):
     start = train_config['start_patient'] if train_config['start_patient'] else 1
     ablation = train_config['ablation'].format(n=n_patients, n_images=n_images_per_patient)
 
-    train_loader, val_loader = get_paired_loaders(start, n_patients, n_images_per_patient, batch_size)
+    if loaders is None:
+        check_cohort_memory(train_config)
+        train_loader, val_loader = get_paired_loaders(start, n_patients, n_images_per_patient, batch_size)
+    else:
+        train_loader, val_loader = loaders
     print(f"Train loader size: {len(train_loader.dataset)}")
     sample = next(iter(train_loader))[0].shape
     print(f"Sample shape: {sample}")
     print(f"Validation loader size: {len(val_loader.dataset)}")
     #train_loader2, val_loader2 = get_loaders(37, 3, n_images_per_patient, batch_size)
 
-    baselines_checkpoint_path = train_config['baselines_checkpoint_path'] + ablation
-
-    model = train_config['model']
-
-    checkpoint_path = baselines_checkpoint_path + rf"/{method}_"
+    baselines_checkpoint_path, checkpoint_path = get_checkpoint_path(config, method, ssm)
 
     if not os.path.exists(baselines_checkpoint_path):
         os.makedirs(baselines_checkpoint_path)
 
-    if config['speckle_module']['use'] is True or ssm:
-        checkpoint_path = checkpoint_path + rf"{model}_ssm"
-        print("Checkpoint path: ", checkpoint_path)
-    else:
-        checkpoint_path = checkpoint_path + rf"{model}"
-
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-    if train_config['model'] == 'UNet':
-        model = UNet(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'UNet2':
-        model = UNet2(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'LargeUNet':
-        model = LargeUNet(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'LargeUNetAttention':
-        model = LargeUNetAttention(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'LargeUNetNoAttention' or train_config['model'] == 'LargeUNet2':
-        model = LargeUNet2(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'LargeUNet3':
-        model = LargeUNet3(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'SmallUNet':
-        model = SmallUNet(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'SmallUNetAtt':
-        model = SmallUNetAtt(in_channels=1, out_channels=1).to(device)
-    elif train_config['model'] == 'LargeUNetAtt':
-        model = LargeUNetAtt(in_channels=1, out_channels=1).to(device)
+    if model is None:
+        model = get_n2_model(train_config['model'], device)
     else:
-        raise ValueError("Model not found")
+        model = model.to(device)
 
     sdoct_path = r"C:\Datasets\OCTData\boe-13-12-6357-d001\Sparsity_SDOCT_DATASET_2012"
     dataset = load_sdoct_dataset(sdoct_path)
@@ -140,21 +177,7 @@ def train(config, method, ssm):
         f.write(f"Number of patients: {n_patients}\n")
         f.write(f"Number of images per patient: {n_images_per_patient}\n")
 
-    if config['speckle_module']['use'] is True or ssm:
-        speckle_module = SpeckleSeparationUNetAttention(input_channels=1, feature_dim=32).to(device)
-        try:
-            print("Loading ssm model from checkpoint...")
-            ssm_checkpoint_path = train_config['ssm_checkpoint_path']
-            ssm_checkpoint = torch.load(ssm_checkpoint_path, map_location=device)
-            speckle_module.load_state_dict(ssm_checkpoint['model_state_dict'])
-            speckle_module.to(device)
-            alpha = config['speckle_module']['alpha']
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            print("Starting training from scratch.")
-            raise e 
-    else:
-        speckle_module = None
+    speckle_module, alpha = load_speckle_module(config, ssm, device)
 
     if train_config['load']:
         try:
@@ -173,6 +196,11 @@ def train(config, method, ssm):
             print(f"Error loading model: {e}")
             print("Starting training from scratch.")
     
+    budget = TrainingBudget.from_config(train_config)
+    quality_logger = TimeToQualityLogger(checkpoint_path + '_time_to_quality.csv' if save else None)
+    profiler = StageProfiler.from_config(train_config, checkpoint_path if save else None)
+    profiler.record_dataset(train_loader.dataset, val_loader.dataset)
+
     if train_config['train']:
         patch = train_config['patch']
         if method == "n2n":
@@ -198,7 +226,10 @@ def train(config, method, ssm):
                     scheduler=scheduler,
                     best_metrics_score=best_metrics_score,
                     train_config=train_config,
-                    sample=raw_image)
+                    sample=raw_image,
+                    budget=budget,
+                    quality_logger=quality_logger,
+                    profiler=profiler)
             else:
                 model = train_n2n(
                     model,
@@ -219,7 +250,10 @@ def train(config, method, ssm):
                     save=save,
                     scheduler=scheduler,
                     best_metrics_score=best_metrics_score,
-                    train_config=train_config
+                    train_config=train_config,
+                    budget=budget,
+                    quality_logger=quality_logger,
+                    profiler=profiler
                     )
             
         elif method == "n2v":
@@ -249,7 +283,10 @@ def train(config, method, ssm):
                     mask_ratio=train_config['mask_ratio'],
                     best_metrics_score=best_metrics_score,
                     scheduler=scheduler,
-                    train_config=train_config)
+                    train_config=train_config,
+                    budget=budget,
+                    quality_logger=quality_logger,
+                    profiler=profiler)
             else:
                 model = train_n2v(
                     model,
@@ -273,7 +310,10 @@ def train(config, method, ssm):
                     threshold=train_config['threshold'],
                     mask_ratio=train_config['mask_ratio'],
                     best_metrics_score=best_metrics_score,
-                    scheduler=scheduler)
+                    scheduler=scheduler,
+                    budget=budget,
+                    quality_logger=quality_logger,
+                    profiler=profiler)
         elif method == "n2s":
             model = train_n2s(
                 model,
@@ -291,12 +331,70 @@ def train(config, method, ssm):
                 visualise=visualise,
                 speckle_module=speckle_module,
                 alpha=alpha,
-                save=save)
+                save=save,
+                budget=budget,
+                quality_logger=quality_logger,
+                profiler=profiler)
 
             
     return model
 
 
+def train_all_n2_concurrent(config_path=None, ssm=False, override_config=None, schemas=("n2n", "n2v", "n2s"), dataset=None):
+    """
+    Preprocesses the patients once into shared memory and trains every schema
+    in its own process against that buffer. Checkpoint paths are the same as
+    for ``train_n2``. The returned dataset can be passed back in to reuse it,
+    e.g. for the ssm run of the same ablation.
+
+    Each schema runs through ``train``, not ``train_all_three``: the speckle
+    module comes from the config's ``ssm_checkpoint_path``, Adam uses
+    ``weight_decay=1e-4``, ``patch`` selects the patch trainers, and
+    ``train`` (not ``load``) decides whether training runs. A schema whose
+    process exits non-zero is named in the ``RuntimeError`` raised once every
+    process has finished, so a run that only trained some schemas fails.
+    """
+
+    if config_path is None:
+        raise ValueError("Config path must be specified.")
+
+    config = get_config(config_path, override_config)
+    train_config = config['training']
+
+    n_patients = train_config['n_patients']
+    n_images_per_patient = train_config['n_images_per_patient']
+    start = train_config['start_patient'] if train_config['start_patient'] else 1
+
+    if dataset is None:
+        check_cohort_memory(train_config, shared=True)
+        dataset = get_shared_paired_dataset(start, n_patients, n_images_per_patient)
+
+    ctx = mp.get_context('spawn')
+    n_threads = max(1, (os.cpu_count() or 1) // len(schemas))
+    processes = {}
+    for method in schemas:
+        process = ctx.Process(target=_train_schema_worker, args=(config, method, ssm, dataset, n_threads), name=method)
+        process.start()
+        processes[method] = process
+
+    failed = []
+    for method, process in processes.items():
+        process.join()
+        if process.exitcode != 0:
+            failed.append(method)
+
+    if failed:
+        raise RuntimeError(f"Training failed for: {', '.join(failed)}")
+
+    return dataset
+
+def _train_schema_worker(config, method, ssm, dataset, n_threads):
+
+    torch.set_num_threads(n_threads)
+
+    loaders = get_loaders_from_dataset(dataset, config['training']['batch_size'])
+    train(config, method, ssm, loaders=loaders)
+
 def train_all_n2(config_path=None, ssm=False, override_config=None):
     
     if config_path is None:
@@ -318,6 +416,7 @@ def train_all_three(config, ssm):
     start = train_config['start_patient'] if train_config['start_patient'] else 1
     ablation = train_config['ablation']
 
+    check_cohort_memory(train_config)
     train_loader, val_loader = get_paired_loaders(start, n_patients, n_images_per_patient, batch_size)
     print(f"Train loader size: {len(train_loader.dataset)}")
     sample = next(iter(train_loader))[0].shape
@@ -326,31 +425,19 @@ def train_all_three(config, ssm):
 
     baselines_checkpoint_path = train_config['baselines_checkpoint_path'] + ablation
 
-    model = train_config['model']
-
     for method in schemas:
 
-        checkpoint_path = baselines_checkpoint_path + rf"/{method}_"
-
         if not os.path.exists(baselines_checkpoint_path):
             os.makedirs(baselines_checkpoint_path)
 
-        if config['speckle_module']['use'] is True or ssm:
-            checkpoint_path = checkpoint_path + rf"{model}_ssm"
+        use_ssm = config['speckle_module']['use'] is True or ssm
+        checkpoint_path = get_checkpoint_prefix(train_config['baselines_checkpoint_path'], ablation, method, train_config['model'], use_ssm)
+        if use_ssm:
             print("Checkpoint path: ", checkpoint_path)
-        else:
-            checkpoint_path = checkpoint_path + rf"{model}"
 
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-        if train_config['model'] == 'UNet':
-            model = UNet(in_channels=1, out_channels=1).to(device)
-        elif train_config['model'] == 'UNet2':
-            model = UNet2(in_channels=1, out_channels=1).to(device)
-        elif train_config['model'] == 'LargeUNet':
-            model = LargeUNet(in_channels=1, out_channels=1).to(device)
-        elif train_config['model'] == 'LargeUNetAttention':
-            model = LargeUNetAttention(in_channels=1, out_channels=1).to(device)
+        model = get_n2_model(train_config['model'], device)
 
         optimizer = optim.Adam(model.parameters(), lr=train_config['learning_rate'])
         scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, 'min', patience=5, factor=0.5)
@@ -380,7 +467,7 @@ def train_all_three(config, ssm):
             f.write(f"Number of images per patient: {n_images_per_patient}\n")
 
         if config['speckle_module']['use'] is True or ssm:
-            speckle_module = SpeckleSeparationUNetAttention(input_channels=1, feature_dim=32).to(device)
+            speckle_module = build_model('SpeckleSeparationUNetAttention').to(device)
             try:
                 print("Loading ssm model from checkpoint...")
                 ssm_checkpoint_path = rf"C:\Users\CL-11\OneDrive\Repos\OCTDenoisingFinal\checkpoints\SpeckleSeparationUNetAttention_custom_loss_best.pth"
@@ -14,16 +14,20 @@ from ssm.models import load_prog_unet, ProgUNet, ProgLargeUNet
 from ssm.utils import get_dataset, get_config
 
 from ssm.utils.eval_utils.visualise import plot_images
+from ssm.utils.checkpoint import CheckpointWriter, save_checkpoint_atomic
 
-def save_checkpoint(epoch, val_loss, model, optimizer, checkpoint_path, img_size):
-        """Save model checkpoint"""
+def save_checkpoint(epoch, val_loss, model, optimizer, checkpoint_path, img_size, writer=None):
+        """Save model checkpoint, in the background if a CheckpointWriter is given"""
         checkpoint = {
             'epoch': epoch,
             'model_state_dict': model.state_dict(),
             'optimizer_state_dict': optimizer.state_dict(),
             'val_loss': val_loss,
         }
-        torch.save(checkpoint, checkpoint_path)
+        if writer is not None:
+            writer.save(checkpoint, checkpoint_path)
+        else:
+            save_checkpoint_atomic(checkpoint, checkpoint_path)
 
 def normalize_to_target(input_img, target_img):
     target_mean = target_img.mean()
@@ -41,6 +45,32 @@ def normalize_to_target(input_img, target_img):
     
     return normalized
 
+def normalize_to_target_levels(output, targets):
+    """
+    ``normalize_to_target`` for all fusion levels at once.
+
+    Args:
+        output (torch.Tensor): Shared prediction (B, C, H, W).
+        targets (torch.Tensor): Targets of every level (B, L, C, H, W).
+
+    Returns:
+        torch.Tensor: (B, L, C, H, W), level ``i`` matched to the mean and
+        std of ``targets[:, i]``.
+    """
+    dims = (0, 2, 3, 4)
+    target_mean = targets.mean(dim=dims, keepdim=True)
+    target_std = targets.std(dim=dims, keepdim=True)
+    input_mean = output.mean()
+    input_std = output.std()
+
+    eps = 1e-8
+    input_std = torch.clamp(input_std, min=eps)
+    target_std = torch.clamp(target_std, min=eps)
+
+    scale = torch.abs(target_std / input_std)
+
+    return ((output - input_mean).unsqueeze(1) * scale) + target_mean
+
 def compute_low_signal_mask(output, threshold_factor=0.5):
         """Compute mask for low-signal areas based on intensity."""
         mean_intensity = output.mean()
@@ -106,6 +136,7 @@ class Trainer:
         
         self.l1_loss = L1Loss()
         self.history = {'train_loss': [], 'val_loss': []}
+        self.checkpoint_writer = None
 
     def train(self, num_epochs):
         if self.checkpoint_path is None:
@@ -114,27 +145,39 @@ class Trainer:
         best_checkpoint_path = self.checkpoint_path + f'_best_checkpoint.pth'
         last_checkpoint_path = self.checkpoint_path + f'_last_checkpoint.pth'
         
-        for epoch in range(num_epochs):
-            train_loss = self.train_epoch(epoch)
-            self.history['train_loss'].append(train_loss)
+        self.checkpoint_writer = CheckpointWriter()
+        try:
+            for epoch in range(num_epochs):
+                train_loss = self.train_epoch(epoch)
+                self.history['train_loss'].append(train_loss)
             
-            val_loss = self.validate()
-            self.history['val_loss'].append(val_loss)
+                val_loss = self.validate()
+                self.history['val_loss'].append(val_loss)
             
-            self.scheduler.step(val_loss)
+                self.scheduler.step(val_loss)
             
-            if val_loss < best_val_loss:
-                best_val_loss = val_loss
-                save_checkpoint(epoch, val_loss, self.model, self.optimizer, best_checkpoint_path, self.img_size)
-                print(f"Best model saved at epoch {epoch} with val loss {val_loss:.4f}")
-            save_checkpoint(epoch, val_loss, self.model, self.optimizer, last_checkpoint_path, self.img_size)
+                if val_loss < best_val_loss:
+                    best_val_loss = val_loss
+                    save_checkpoint(epoch, val_loss, self.model, self.optimizer, best_checkpoint_path, self.img_size, self.checkpoint_writer)
+                    print(f"Best model saved at epoch {epoch} with val loss {val_loss:.4f}")
+                save_checkpoint(epoch, val_loss, self.model, self.optimizer, last_checkpoint_path, self.img_size, self.checkpoint_writer)
             
-            print(f'Epoch {epoch}: Train Loss = {train_loss:.4f}, Val Loss = {val_loss:.4f}')
+                print(f'Epoch {epoch}: Train Loss = {train_loss:.4f}, Val Loss = {val_loss:.4f}')
             
-            #plot_losses(self.history, self.vis_dir)
+                #plot_losses(self.history, self.vis_dir)
+        finally:
+            self.checkpoint_writer.close()
 
         return self.history
 
+    def _forward(self, input_img, target_images):
+        """One forward pass for all fusion levels, the models predict the same image for every level."""
+        return self.model(input_img, 1, target_images.shape[-2:])[0]
+
+    def _level_loss(self, output, target_images):
+        """Mean over levels of the L1 loss after matching the output to each level, in one batched op."""
+        return self.l1_loss(normalize_to_target_levels(output, target_images), target_images)
+
     def train_epoch(self, epoch):
         self.model.train()
         epoch_losses = []
@@ -143,20 +186,14 @@ class Trainer:
         
         for batch_idx, (data, _) in pbar:
             data = data.to(self.device)
-            num_levels = data.shape[1] - 1
-            batch_loss = 0
             
             self.optimizer.zero_grad() 
             
             input_img = data[:, 0, :, :, :]  # Input image
-            target_images = [data[:, i, :, :, :] for i in range(1, num_levels + 1)]  # Targets
-            
-            outputs = self.model(input_img, num_levels, target_images[0].shape)
+            target_images = data[:, 1:, :, :, :]  # Targets (B, L, C, H, W)
             
-            for output, target in zip(outputs, target_images):
-                output = normalize_to_target(output, target)
-                batch_loss += self.l1_loss(output, target)
-            batch_loss /= num_levels
+            output = self._forward(input_img, target_images)
+            batch_loss = self._level_loss(output, target_images)
             
             # Backward pass
             batch_loss.backward()
@@ -177,18 +214,13 @@ class Trainer:
                 data = data.to(self.device)
                 
                 input_img = data[:, 0, :, :, :]  # Input image
-                num_levels = data.shape[1] - 1
-                target_images = [data[:, i, :, :, :] for i in range(1, num_levels + 1)]  # Targets
+                target_images = data[:, 1:, :, :, :]  # Targets (B, L, C, H, W)
                 
                 # Forward pass
-                outputs = self.model(input_img, num_levels, target_images[0].shape)
+                output = self._forward(input_img, target_images)
                 
                 # Compute loss
-                batch_loss = 0
-                for output, target in zip(outputs, target_images):
-                    output = normalize_to_target(output, target)
-                    batch_loss += self.l1_loss(output, target)
-                batch_loss /= num_levels
+                batch_loss = self._level_loss(output, target_images)
                 
                 val_losses.append(batch_loss.item())
 
@@ -197,7 +229,7 @@ class Trainer:
                 images = [ 
                     input_img[0][0].cpu().numpy(), 
                     target_images[0][0][0].cpu().numpy(), 
-                    outputs[0][0][0].cpu().detach().numpy()
+                    output[0][0].cpu().detach().numpy()
                 ]
                 losses = {
                     'Total Loss': batch_loss.item()
@@ -0,0 +1,116 @@
+import numpy as np
+import torch
+
+from ssm.utils.config import get_config
+from ssm.models.pruning import bn_scores, activation_scores, search_pruning_ratio, save_channel_spec
+from ssm.trainers.n2_trainer import train, get_checkpoint_path, get_best_checkpoint_file, get_n2_model
+
+def evaluate_psnr_ssim(model, images, references):
+    """Mean PSNR/SSIM of ``model`` on (N, 1, H, W) images against their references."""
+    from ssm.utils.eval_utils.metrics import calculate_psnr, calculate_ssim
+
+    model = model.cpu().eval()
+    psnr, ssim = [], []
+    with torch.inference_mode():
+        for i in range(images.shape[0]):
+            output = model(images[i:i + 1])[0, 0].numpy()
+            reference = references[i, 0].numpy()
+            psnr.append(calculate_psnr(output, reference))
+            ssim.append(calculate_ssim(output, reference))
+    return {'psnr': float(np.mean(psnr)), 'ssim': float(np.mean(ssim))}
+
+def prune_and_finetune(config_path=None, method='n2v', ssm=False, target_ms=None, score='bn',
+                       fine_tune_epochs=3, eval_images=None, eval_references=None, override_config=None):
+    """
+    Prunes a trained N2 model to a CPU latency target and fine-tunes it with
+    the regular N2 trainer.
+
+    The unpruned model is loaded from the best checkpoint ``train`` wrote
+    for ``training.model`` and ``method`` (the patched one when
+    ``training.patch`` is set). The pruned model is trained under the
+    model name ``<model>_pruned<percent>`` next to it, and its channel spec is
+    saved as ``<prefix>_channels.json`` for ``load_pruned_model``.
+
+    Args:
+        target_ms (float): CPU latency target per 256x256 B-scan.
+        score (str): "bn" (BatchNorm scale) or "activation" (mean activation
+            on the training patients) channel ranking.
+        fine_tune_epochs (int): Epochs of fine-tuning after pruning.
+        eval_images, eval_references (torch.Tensor): Optional held out
+            (N, 1, H, W) pairs to track PSNR/SSIM before and after pruning.
+
+    Returns:
+        tuple: (pruned model, report dict)
+    """
+    if config_path is None:
+        raise ValueError("Config path must be specified.")
+    if target_ms is None:
+        raise ValueError("Latency target must be specified.")
+
+    config = get_config(config_path, override_config)
+    train_config = config['training']
+    model_name = train_config['model']
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    checkpoint_file = get_best_checkpoint_file(config, method, ssm)
+    print(f"Pruning {model_name} from {checkpoint_file}")
+
+    model = get_n2_model(model_name, device)
+    checkpoint = torch.load(checkpoint_file, map_location=device, weights_only=False)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model = model.cpu().eval()
+
+    if score == 'bn':
+        scores = bn_scores(model)
+    elif score == 'activation':
+        from ssm.inference.quantise import get_calibration_batches
+        start = train_config['start_patient'] if train_config['start_patient'] else 1
+        scores = activation_scores(model, get_calibration_batches(start, n_patients=2, n_images_per_patient=10))
+    else:
+        raise ValueError(f"Unknown channel score: {score}")
+
+    pruned, spec, ratio, latency, tried = search_pruning_ratio(model, target_ms, scores)
+
+    report = {
+        'model': model_name,
+        'score': score,
+        'target_ms': target_ms,
+        'ratio': ratio,
+        'latency_ms': latency,
+        'baseline_latency_ms': tried[0][1],
+        'search': tried,
+        'params': sum(p.numel() for p in model.parameters()),
+        'pruned_params': sum(p.numel() for p in pruned.parameters()),
+    }
+
+    if eval_images is not None:
+        report['baseline'] = evaluate_psnr_ssim(model, eval_images, eval_references)
+        report['pruned'] = evaluate_psnr_ssim(pruned, eval_images, eval_references)
+
+    pruned_name = f"{model_name}_pruned{int(round(ratio * 100))}"
+    finetune_override = {
+        'training': {
+            **(override_config or {}).get('training', {}),
+            'model': pruned_name,
+            'epochs': fine_tune_epochs,
+            'load': False,
+            'train': True,
+        }
+    }
+    finetune_config = get_config(config_path, {**(override_config or {}), **finetune_override})
+    pruned = train(finetune_config, method, ssm, model=pruned)
+
+    _, pruned_prefix = get_checkpoint_path(finetune_config, method, ssm)
+    spec_path = pruned_prefix + '_channels.json'
+    save_channel_spec(spec, spec_path)
+    report['channel_spec'] = spec_path
+
+    if eval_images is not None:
+        report['fine_tuned'] = evaluate_psnr_ssim(pruned, eval_images, eval_references)
+        report['delta'] = {k: report['fine_tuned'][k] - report['baseline'][k] for k in report['baseline']}
+        print(f"PSNR {report['baseline']['psnr']:.2f} -> {report['fine_tuned']['psnr']:.2f} dB, "
+              f"SSIM {report['baseline']['ssim']:.4f} -> {report['fine_tuned']['ssim']:.4f}")
+
+    print(f"Latency {report['baseline_latency_ms']:.1f} -> {report['latency_ms']:.1f} ms at ratio {ratio:.3f}")
+
+    return pruned, report
@@ -18,6 +18,7 @@ from torch.utils.data import random_split
 
 from ssm.utils import paired_preprocessing, visualize_progress, visualize_attention_maps, subset_blind_spot_masking
 from ssm.utils.config import get_config
+from ssm.utils.checkpoint import CheckpointWriter
 
 from ssm.utils import paired_octa_preprocessing, paired_octa_preprocessing_binary
 
@@ -215,61 +216,67 @@ def train(train_dataloader, val_dataloader, checkpoint, checkpoint_path, model,
     if 'val_loss' not in history:
         history['val_loss'] = []
     
-    for epoch in range(set_epoch, num_epochs):
-        print(f"Epoch {epoch+1}/{num_epochs}")
+    # history and optimizer state are snapshotted on this thread, written on the writer thread
+    checkpoint_writer = CheckpointWriter()
+    try:
+        for epoch in range(set_epoch, num_epochs):
+            print(f"Epoch {epoch+1}/{num_epochs}")
         
         
-        train_loss = process_batch(
-            train_dataloader, model, history, 
-            epoch, num_epochs, optimizer, 
-            loss_fn, loss_parameters, debug, 
-            n2v_weight, fast, visualise,
-            mode='train'
-        )
+            train_loss = process_batch(
+                train_dataloader, model, history, 
+                epoch, num_epochs, optimizer, 
+                loss_fn, loss_parameters, debug, 
+                n2v_weight, fast, visualise,
+                mode='train'
+            )
         
-        # Validation phase
-        val_loss = process_batch(
-            val_dataloader, model, history, 
-            epoch, num_epochs, None,  # No optimizer for validation 
-            loss_fn, loss_parameters, False,  # No debug during validation
-            n2v_weight, fast, visualise,
-            mode='val'
-        )
+            # Validation phase
+            val_loss = process_batch(
+                val_dataloader, model, history, 
+                epoch, num_epochs, None,  # No optimizer for validation 
+                loss_fn, loss_parameters, False,  # No debug during validation
+                n2v_weight, fast, visualise,
+                mode='val'
+            )
         
-        history['val_loss'].append(val_loss)
+            history['val_loss'].append(val_loss)
         
-        if val_loss < best_loss:
-            best_loss = val_loss
-            best_epoch = epoch + 1
-            print(f"New best model found at epoch {best_epoch} with validation loss {best_loss:.6f}")
+            if val_loss < best_loss:
+                best_loss = val_loss
+                best_epoch = epoch + 1
+                print(f"New best model found at epoch {best_epoch} with validation loss {best_loss:.6f}")
             
+                checkpoint = {
+                    'epoch': best_epoch,
+                    'model_state_dict': model.state_dict(),
+                    'best_loss': best_loss,
+                    'train_loss': train_loss,
+                    'val_loss': val_loss,
+                    'optimizer_state_dict': optimizer.state_dict(),
+                    'history': history,
+                }
+                checkpoint_writer.save(checkpoint, best_checkpoint)
+                print(f"Best model checkpoint queued for {best_checkpoint}")
+
+            # Save last checkpoint
             checkpoint = {
-                'epoch': best_epoch,
+                'epoch': epoch + 1,  # Save epoch + 1 so we can resume from next epoch
                 'model_state_dict': model.state_dict(),
                 'best_loss': best_loss,
+                'best_epoch': best_epoch,
                 'train_loss': train_loss,
                 'val_loss': val_loss,
                 'optimizer_state_dict': optimizer.state_dict(),
-                'history': history,
+                'history': history
             }
-            torch.save(checkpoint, best_checkpoint)
-            print(f"Best model checkpoint saved at {best_checkpoint}")
-
-        # Save last checkpoint
-        checkpoint = {
-            'epoch': epoch + 1,  # Save epoch + 1 so we can resume from next epoch
-            'model_state_dict': model.state_dict(),
-            'best_loss': best_loss,
-            'best_epoch': best_epoch,
-            'train_loss': train_loss,
-            'val_loss': val_loss,
-            'optimizer_state_dict': optimizer.state_dict(),
-            'history': history
-        }
         
-        torch.save(checkpoint, last_checkpoint)
-        print(f"Latest model checkpoint saved at {last_checkpoint}")
+            checkpoint_writer.save(checkpoint, last_checkpoint)
+            print(f"Latest model checkpoint queued for {last_checkpoint}")
     
+    finally:
+        checkpoint_writer.close()
+
     return model, history
 
 def get_loaders(dataset, batch_size, val_split=0.2, device='cuda', seed=42):
@@ -0,0 +1,167 @@
+import os
+import copy
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import torch
+
+from ssm.utils.config import get_config
+from ssm.utils.memory import system_memory_mb
+from ssm.trainers.n2_trainer import train, get_best_checkpoint_file
+
+# keys that always end up in the checkpoint name (method and ssm are popped
+# from the params), anything else swept gets appended to the ablation
+# directory so runs don't overwrite each other
+_NAME_KEYS = {'training.model'}
+
+# keys that only reach the path through their field in the ablation template
+_ABLATION_FIELDS = {'training.n_patients': 'n', 'training.n_images_per_patient': 'n_images'}
+
+def _in_ablation(ablation, key):
+    """Whether the formatted ``ablation`` changes with ``key``."""
+    field = _ABLATION_FIELDS.get(key)
+    if field is None:
+        return False
+    values = {'n': 0, 'n_images': 0}
+    return ablation.format(**values) != ablation.format(**{**values, field: 1})
+
+def expand_grid(grid):
+    """
+    Expands a grid of dotted keys into a list of runs.
+
+    Args:
+        grid (dict): e.g. ``{"method": ["n2n", "n2v"], "ssm": [False, True],
+            "training.n_patients": [2, 10, 40], "speckle_module.alpha": [0.5, 1]}``.
+            ``method`` and ``ssm`` select the schema, every other key is
+            ``<section>.<key>`` of the yaml config.
+
+    Returns:
+        list: One dict per run with ``method``, ``ssm`` and ``params`` (the
+        dotted key/value pairs of that run).
+    """
+    keys = list(grid.keys())
+    runs = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        runs.append({
+            'method': params.pop('method', 'n2n'),
+            'ssm': params.pop('ssm', False),
+            'params': params,
+        })
+    return runs
+
+def _build_override(base_override, params, base_ablation):
+
+    override = copy.deepcopy(base_override) if base_override else {}
+
+    for dotted_key, value in params.items():
+        section, key = dotted_key.split('.', 1)
+        override.setdefault(section, {})[key] = value
+
+    ablation = override.get('training', {}).get('ablation', base_ablation)
+    suffix = "".join(f"_{k.split('.', 1)[1]}{v}" for k, v in params.items()
+                     if k not in _NAME_KEYS and not _in_ablation(ablation, k))
+    if suffix:
+        override.setdefault('training', {})['ablation'] = ablation + suffix
+
+    return override
+
+def _summarise_checkpoint(checkpoint_file):
+
+    checkpoint = torch.load(checkpoint_file, map_location='cpu', weights_only=False)
+    summary = {
+        'epoch': checkpoint.get('epoch'),
+        'best_val_loss': checkpoint.get('best_val_loss'),
+        'val_loss': checkpoint.get('val_loss'),
+        'train_loss': checkpoint.get('train_loss'),
+    }
+    for name, value in (checkpoint.get('metrics') or {}).items():
+        if isinstance(value, (int, float)):
+            summary[name] = value
+    return summary
+
+def _run_one(config_path, run, n_threads):
+
+    torch.set_num_threads(n_threads)
+
+    config = get_config(config_path, run['override_config'])
+    train(config, run['method'], run['ssm'])
+
+    return run['checkpoint_file']
+
+def run_sweep(config_path, grid, base_override=None, max_workers=None, threads_per_run=2,
+              memory_per_run_gb=4, skip_completed=True, results_path=None):
+    """
+    Runs every configuration of ``grid`` through ``n2_trainer.train`` on a
+    local process pool and collects the best checkpoint of each run into one
+    table.
+
+    The pool size is bounded by the cpu count (``threads_per_run`` torch
+    threads per run) and by the physical memory (``memory_per_run_gb`` per
+    run), or by the cpu count alone where the memory can't be read. Runs whose best checkpoint already exists are not retrained.
+
+    Returns:
+        pd.DataFrame: One row per run with the swept parameters and the
+        epoch / loss / metrics stored in its best checkpoint.
+    """
+    base_config = get_config(config_path, base_override)
+    base_ablation = base_config['training']['ablation']
+
+    runs = expand_grid(grid)
+    pending = []
+    for run in runs:
+        run['override_config'] = _build_override(base_override, run['params'], base_ablation)
+        config = get_config(config_path, run['override_config'])
+        run['checkpoint_file'] = get_best_checkpoint_file(config, run['method'], run['ssm'])
+
+        if skip_completed and os.path.exists(run['checkpoint_file']):
+            print(f"Skipping completed run: {run['checkpoint_file']}")
+        else:
+            pending.append(run)
+
+    if max_workers is None:
+        cpu_workers = max(1, (os.cpu_count() or 1) // threads_per_run)
+        total_memory_mb, _ = system_memory_mb()
+        if total_memory_mb is None:
+            print("Warning: total memory unknown, sizing the pool by cpu count only")
+            max_workers = cpu_workers
+        else:
+            memory_workers = max(1, int(total_memory_mb / 1024 // memory_per_run_gb))
+            max_workers = min(cpu_workers, memory_workers)
+    max_workers = max(1, min(max_workers, len(pending) or 1))
+
+    print(f"{len(runs)} runs, {len(pending)} to train on {max_workers} workers")
+
+    failed = {}
+    if pending:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as executor:
+            futures = {executor.submit(_run_one, config_path, run, threads_per_run): run for run in pending}
+            for future in as_completed(futures):
+                run = futures[future]
+                try:
+                    future.result()
+                    print(f"Finished: {run['checkpoint_file']}")
+                except Exception as e:
+                    print(f"Run failed ({run['method']}, ssm={run['ssm']}, {run['params']}): {e}")
+                    failed[run['checkpoint_file']] = str(e)
+
+    rows = []
+    for run in runs:
+        row = {'method': run['method'], 'ssm': run['ssm'], **run['params'], 'checkpoint': run['checkpoint_file']}
+        if run['checkpoint_file'] in failed:
+            row['error'] = failed[run['checkpoint_file']]
+        elif os.path.exists(run['checkpoint_file']):
+            row.update(_summarise_checkpoint(run['checkpoint_file']))
+        rows.append(row)
+
+    results = pd.DataFrame(rows)
+
+    if results_path is not None:
+        os.makedirs(os.path.dirname(results_path) or '.', exist_ok=True)
+        results.to_csv(results_path, index=False)
+        print(f"Results saved to {results_path}")
+
+    return results
@@ -1,11 +1,89 @@
-from .model_utils import load_ssm_model
-from .config import get_config
-from .data_utils.masking import *
-from .data_utils.oct_preprocessing import *
-from .data_utils.paired_preprocessing import *
-from .data_utils.standard_preprocessing import *
-from .data_utils.helper import *
-from .data_utils.pfn import *
-from .eval_utils.evaluate import *
-from .eval_utils.visualise import *
-from .eval_utils.metrics import *
\ No newline at end of file
+import importlib
+
+# Attributes are imported on first access (PEP 562) so that importing one
+# model or helper does not pull in every module of the package. The map
+# mirrors what the former star imports exported.
+_LAZY_ATTRIBUTES = {
+    'get_ssm_model': '.model_utils',
+    'load_ssm_model': '.model_utils',
+    'parse_config': '.config',
+    'get_config': '.config',
+    'blind_spot_masking': '.data_utils.masking',
+    'fast_blind_spot': '.data_utils.masking',
+    'blind_spot_masking_fast': '.data_utils.masking',
+    'subset_blind_spot_masking': '.data_utils.masking',
+    'compute_decorrelation': '.data_utils.oct_preprocessing',
+    'remove_speckle_noise': '.data_utils.oct_preprocessing',
+    'octa_preprocessing': '.data_utils.oct_preprocessing',
+    'threshold_octa': '.data_utils.oct_preprocessing',
+    'standard_preprocessing': '.data_utils.standard_preprocessing',
+    'load_patient_data': '.data_utils.paired_preprocessing',
+    'extract_number': '.data_utils.helper',
+    'pair_data': '.data_utils.paired_preprocessing',
+    'paired_octa_preprocessing': '.data_utils.paired_preprocessing',
+    'paired_preprocessing': '.data_utils.paired_preprocessing',
+    'paired_octa_preprocessing_binary': '.data_utils.paired_preprocessing',
+    'normalize_image': '.data_utils.standard_preprocessing',
+    'normalize_image_np': '.data_utils.standard_preprocessing',
+    'normalize_image_torch': '.data_utils.standard_preprocessing',
+    'save_checkpoint': '.data_utils.pfn',
+    'normalize_to_target': '.data_utils.pfn',
+    'compute_low_signal_mask': '.data_utils.pfn',
+    'visualize_batch': '.data_utils.pfn',
+    'FusionDataset': '.data_utils.pfn',
+    'get_dataset': '.data_utils.pfn',
+    'evaluate_oct_denoising': '.eval_utils.metrics',
+    'get_sample_image': '.eval_utils.evaluate',
+    'plot_sample': '.eval_utils.evaluate',
+    'denoise_image': '.eval_utils.metrics',
+    'device': '.eval_utils.evaluate',
+    'evaluate': '.eval_utils.evaluate',
+    'load_sdoct_dataset': '.eval_utils.evaluate',
+    'SpatialAttention': '.eval_utils.visualise',
+    'visualize_progress': '.eval_utils.visualise',
+    'visualize_attention_maps': '.eval_utils.visualise',
+    'plot_images': '.eval_utils.visualise',
+    'plot_computation_graph': '.eval_utils.visualise',
+    'calculate_psnr': '.eval_utils.metrics',
+    'calculate_ssim': '.eval_utils.metrics',
+    'calculate_snr': '.eval_utils.metrics',
+    'calculate_cnr': '.eval_utils.metrics',
+    'calculate_enl': '.eval_utils.metrics',
+    'calculate_epi': '.eval_utils.metrics',
+    'auto_select_roi': '.eval_utils.metrics',
+    'select_roi_labels': '.eval_utils.metrics',
+    'roi_statistics': '.eval_utils.metrics',
+    'compute_original_stats': '.eval_utils.metrics',
+    'get_original_stats': '.eval_utils.metrics',
+    'calculate_cnr_whole': '.eval_utils.metrics',
+    'validate_model': '.eval_utils.metrics',
+    'display_metrics': '.eval_utils.metrics',
+    'display_grouped_metrics': '.eval_utils.metrics',
+    'evaluate_oct_denoising_batch': '.eval_utils.metrics_torch',
+    'mean_batch_metrics': '.eval_utils.metrics_torch',
+    'batch_psnr': '.eval_utils.metrics_torch',
+    'batch_ssim': '.eval_utils.metrics_torch',
+    'batch_snr': '.eval_utils.metrics_torch',
+    'batch_cnr': '.eval_utils.metrics_torch',
+    'batch_cnr_whole': '.eval_utils.metrics_torch',
+    'batch_enl': '.eval_utils.metrics_torch',
+    'batch_epi': '.eval_utils.metrics_torch',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    try:
+        return importlib.import_module(f".{name}", __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f"{__name__}.{name}":
+            raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -0,0 +1,108 @@
+import os
+import csv
+import time
+
+class TrainingBudget:
+    """
+    Early stopping on the validation loss plus wall-clock and images-processed
+    budgets. All limits are optional; with none set ``step`` never stops.
+
+    Args:
+        patience (int): Epochs without an improvement of at least
+            ``min_delta`` before stopping.
+        min_delta (float): Minimum decrease of the validation loss that counts
+            as an improvement.
+        max_seconds (float): Wall-clock budget, measured from construction
+            (or ``start``).
+        max_images (int): Budget of training images processed. Checked at
+            epoch boundaries, so a run may overshoot by up to one epoch.
+    """
+    def __init__(self, patience=None, min_delta=0.0, max_seconds=None, max_images=None):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.max_seconds = max_seconds
+        self.max_images = max_images
+        self.start()
+
+    @classmethod
+    def from_config(cls, train_config):
+        return cls(
+            patience=train_config.get('early_stopping_patience'),
+            min_delta=train_config.get('early_stopping_min_delta', 0.0),
+            max_seconds=train_config.get('max_train_seconds'),
+            max_images=train_config.get('max_train_images'),
+        )
+
+    def start(self):
+        self.start_time = time.time()
+        self.images_seen = 0
+        self.best_loss = float('inf')
+        self.bad_epochs = 0
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def step(self, val_loss, n_images):
+        """
+        Records one epoch and returns the reason to stop, or None to continue.
+        """
+        self.images_seen += n_images
+
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.bad_epochs = 0
+        else:
+            self.bad_epochs += 1
+
+        if self.patience is not None and self.bad_epochs >= self.patience:
+            return f"no improvement for {self.bad_epochs} epochs"
+        if self.max_seconds is not None and self.elapsed >= self.max_seconds:
+            return f"time budget of {self.max_seconds}s reached"
+        if self.max_images is not None and self.images_seen >= self.max_images:
+            return f"image budget of {self.max_images} reached"
+        return None
+
+class TimeToQualityLogger:
+    """
+    Logs validation loss and metrics against wall-clock seconds and training
+    images seen, one row per epoch. The csv is rewritten after every epoch so
+    interrupted runs keep their curve.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.rows = []
+
+    def log(self, epoch, seconds, images_seen, val_loss, train_loss=None, metrics=None):
+        row = {
+            'epoch': epoch,
+            'seconds': round(seconds, 3),
+            'images_seen': images_seen,
+            'train_loss': train_loss,
+            'val_loss': val_loss,
+        }
+        for name, value in (metrics or {}).items():
+            if isinstance(value, (int, float)):
+                row[name] = value
+        self.rows.append(row)
+
+        if self.path is not None:
+            self.save(self.path)
+
+    def save(self, path):
+        fieldnames = []
+        for row in self.rows:
+            fieldnames.extend(k for k in row if k not in fieldnames)
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+def images_per_epoch(loader):
+    """Training images seen per epoch, assuming drop_last batching."""
+    return len(loader) * loader.batch_size
@@ -0,0 +1,97 @@
+import os
+import copy
+import queue
+import threading
+
+import torch
+
+def _snapshot(obj):
+    """Copies tensors to cpu and everything else by value, so the training
+    loop can keep mutating the model, optimiser and history afterwards."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    elif isinstance(obj, dict):
+        return {k: _snapshot(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_snapshot(v) for v in obj]
+    elif isinstance(obj, tuple):
+        return tuple(_snapshot(v) for v in obj)
+    else:
+        return copy.deepcopy(obj)
+
+def save_checkpoint_atomic(checkpoint, path):
+    """
+    Saves through a temporary file in the same directory and renames it over
+    ``path``, so an interrupted write never leaves a truncated checkpoint.
+    """
+    path = str(path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        torch.save(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class CheckpointWriter:
+    """
+    Writes checkpoints on a background thread.
+
+    ``save`` snapshots the checkpoint to cpu on the calling thread and returns;
+    serialisation and the atomic rename happen on the writer thread. Writes are
+    done in submission order. Errors raised by the writer are re-raised on the
+    next ``save``/``flush``/``close``.
+
+    Args:
+        max_pending (int): Number of snapshots allowed to queue before ``save``
+            blocks, which bounds the extra host memory.
+    """
+    def __init__(self, max_pending=2):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                checkpoint, path = item
+                save_checkpoint_atomic(checkpoint, path)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"Checkpoint write failed: {error}") from error
+
+    def save(self, checkpoint, path):
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise RuntimeError("CheckpointWriter is closed")
+        self._queue.put((_snapshot(checkpoint), str(path)))
+
+    def flush(self):
+        """Blocks until every queued checkpoint is on disk."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
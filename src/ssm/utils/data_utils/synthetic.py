@@ -0,0 +1,199 @@
+"""
+Synthetic OCT volumes for running the pipeline without patient data.
+
+Volumes are written in the layout the loaders expect:
+
+    <root>/0/RawDataQA (i)/Image (j).tiff          (``DATASET_DIR_PATH``)
+    <root>/1/RawDataQA-1 (i)/Image (j).tiff
+    <root>/<patient>/<patient>_Raw Image.tif        (SDOCT layout)
+    <root>/<patient>/<patient>_Averaged Image.tif
+
+Each B-scan is a layered, retina-like reflectivity profile with vessels,
+multiplied by fully developed speckle. Speckle in static tissue stays
+correlated between neighbouring B-scans while it is redrawn inside vessels,
+so OCTA decorrelation picks out the simulated flow.
+"""
+import os
+
+import cv2
+import numpy as np
+
+# relative reflectivity of the layers from the vitreous down to the choroid
+LAYER_REFLECTIVITY = (0.02, 0.75, 0.35, 0.5, 0.25, 0.45, 0.15, 0.9, 0.6)
+
+def _smooth_curve(width, rng, amplitude, n_knots=6):
+    knots = rng.normal(0, amplitude, n_knots)
+    return np.interp(np.linspace(0, n_knots - 1, width), np.arange(n_knots), knots)
+
+def make_retina(height, width, rng, n_vessels=12):
+    """
+    One eye's layered reflectivity and vessel cross-sections.
+
+    Returns:
+        tuple: (layer boundaries (n_layers + 2, width) in rows from 0 to height, vessel
+        (row, col, radius) array, per-layer reflectivity)
+    """
+    n_layers = len(LAYER_REFLECTIVITY)
+    top = height * rng.uniform(0.15, 0.3)
+    thickness = rng.uniform(0.04, 0.09, n_layers - 1) * height
+    thickness = np.concatenate([[top], thickness])
+
+    # foveal dip plus slow undulation shared by all layers
+    columns = np.arange(width)
+    centre = width * rng.uniform(0.35, 0.65)
+    dip = height * 0.06 * np.exp(-((columns - centre) / (width * 0.08)) ** 2)
+    shape = _smooth_curve(width, rng, height * 0.02) + dip
+
+    boundaries = np.cumsum(thickness)[:, None] + shape[None, :]
+    boundaries = np.concatenate([np.zeros((1, width)), boundaries, np.full((1, width), height)])
+    boundaries = np.clip(boundaries, 0, height)
+
+    # vessels sit in the inner retina and the choroid
+    vessel_layers = rng.choice([2, 3, n_layers - 1], n_vessels)
+    vessel_cols = rng.uniform(0, width, n_vessels)
+    vessels = []
+    for layer, col in zip(vessel_layers, vessel_cols):
+        c = int(col)
+        row = rng.uniform(boundaries[layer, c], boundaries[layer + 1, c])
+        vessels.append((row, col, rng.uniform(2, 6) * height / 256))
+    reflectivity = np.asarray(LAYER_REFLECTIVITY) * rng.uniform(0.85, 1.15, n_layers)
+    return boundaries, np.array(vessels), reflectivity
+
+def render_bscan(boundaries, vessels, reflectivity, height, width, shift=0.0):
+    """
+    Noise-free reflectivity and flow mask of one B-scan, with the layers
+    and vessels moved ``shift`` rows to mimic the next slow-scan position.
+    """
+    rows = np.arange(height, dtype=np.float32)[:, None]
+    layer = (rows >= boundaries[1:-1, None, :] + shift).sum(axis=0)
+    image = reflectivity[np.clip(layer, 0, len(reflectivity) - 1)].astype(np.float32)
+
+    # attenuation with depth
+    image *= np.exp(-rows / (2.5 * height)).astype(np.float32)
+
+    flow = np.zeros((height, width), dtype=bool)
+    cols = np.arange(width, dtype=np.float32)[None, :]
+    for row, col, radius in vessels:
+        vessel = (rows - row - shift) ** 2 + (cols - col) ** 2 <= radius ** 2
+        flow |= vessel
+        # shadow under the vessel, as in real OCT
+        below = (rows > row + shift + radius) & (np.abs(cols - col) <= radius)
+        image[below] *= 0.6
+    image[flow] = 0.55
+    return image, flow
+
+def _complex_field(rng, shape, looks):
+    return (rng.standard_normal((looks,) + shape) + 1j * rng.standard_normal((looks,) + shape)).astype(np.complex64) / np.sqrt(2)
+
+def make_volume(n_bscans=16, height=496, width=512, looks=1, correlation=0.9, drift=0.15, n_vessels=12, seed=0):
+    """
+    Speckled B-scans of one synthetic eye.
+
+    Args:
+        looks (int): Speckle looks, 1 gives Rayleigh amplitude speckle, more
+            looks gamma distributed intensity with lower contrast.
+        correlation (float): Speckle correlation of static tissue between
+            neighbouring B-scans, flow regions are fully decorrelated.
+        drift (float): Rows the anatomy moves per B-scan.
+
+    Returns:
+        tuple: (uint8 B-scans (n_bscans, height, width), bool flow masks,
+        float32 noise-free reflectivity)
+    """
+    rng = np.random.default_rng(seed)
+    boundaries, vessels, reflectivity = make_retina(height, width, rng, n_vessels)
+
+    shape = (height, width)
+    field = _complex_field(rng, shape, looks)
+    bscans, flows, cleans = [], [], []
+    for i in range(n_bscans):
+        clean, flow = render_bscan(boundaries, vessels, reflectivity, height, width, shift=i * drift)
+
+        if i > 0:
+            fresh = _complex_field(rng, shape, looks)
+            field = np.sqrt(correlation) * field + np.sqrt(1 - correlation) * fresh
+            field[:, flow] = fresh[:, flow]
+
+        speckle = (np.abs(field) ** 2).mean(axis=0)
+        intensity = clean * speckle
+
+        # log compression and 8 bit quantisation as in exported scans
+        image = np.log1p(200 * intensity) / np.log1p(200 * 4 * reflectivity.max())
+        bscans.append(np.clip(image * 255, 0, 255).astype(np.uint8))
+        flows.append(flow)
+        cleans.append(clean)
+
+    return np.stack(bscans), np.stack(flows), np.stack(cleans)
+
+def write_tiff(path, image):
+    """
+    Writes an uncompressed TIFF. cv2 defaults to LZW, which skimage (through
+    tifffile) cannot decode without the optional imagecodecs package.
+    """
+    if not cv2.imwrite(path, image, [cv2.IMWRITE_TIFF_COMPRESSION, 1]):
+        raise IOError(f"Could not write {path}")
+
+def check_round_trip(patient_dir, n_bscans, shape):
+    """Reads a written patient back through ``load_patient_data`` and checks every B-scan loads with its shape."""
+    from ssm.utils.data_utils.data_loading import load_patient_data
+
+    scans = load_patient_data(patient_dir)
+    shapes = {scan.shape[:2] for scan in scans}
+    if len(scans) != n_bscans or shapes != {tuple(shape)}:
+        raise RuntimeError(f"Round trip of {patient_dir} failed: wrote {n_bscans} B-scans of {tuple(shape)}, "
+                           f"loaded {len(scans)} of {sorted(shapes)}")
+
+def get_patient_dir_name(diabetes, patient):
+    if diabetes != 0:
+        return f"RawDataQA-{diabetes} ({patient})"
+    return f"RawDataQA ({patient})"
+
+def write_synthetic_dataset(root, n_patients=3, n_bscans=16, height=496, width=512, diabetes_list=(0, 1, 2),
+                            looks=1, correlation=0.9, seed=0):
+    """
+    Writes synthetic patients in the ``DATASET_DIR_PATH`` layout as
+    uncompressed TIFFs. The first patient is read back through
+    ``load_patient_data`` to check that the loaders can decode it.
+
+    Args:
+        root (str): Output directory.
+        n_patients (int): Patients per diabetes category.
+        n_bscans (int): B-scans per patient.
+        diabetes_list (tuple): Categories (sub-directories) to create.
+
+    Returns:
+        str: ``root`` with a trailing separator, ready for ``DATASET_DIR_PATH``.
+    """
+    for d, diabetes in enumerate(diabetes_list):
+        for patient in range(1, n_patients + 1):
+            patient_dir = os.path.join(root, str(diabetes), get_patient_dir_name(diabetes, patient))
+            os.makedirs(patient_dir, exist_ok=True)
+
+            volume, _, _ = make_volume(n_bscans, height, width, looks, correlation, seed=seed + 1000 * d + patient)
+            for j, bscan in enumerate(volume, 1):
+                write_tiff(os.path.join(patient_dir, f"Image ({j}).tiff"), bscan)
+            if d == 0 and patient == 1:
+                check_round_trip(patient_dir, n_bscans, (height, width))
+        print(f"Wrote {n_patients} patients to {os.path.join(root, str(diabetes))}")
+
+    return os.path.join(os.path.abspath(root), '')
+
+def write_synthetic_sdoct(root, n_patients=5, height=450, width=900, looks=1, n_averaged=40, seed=0):
+    """
+    Writes raw / averaged image pairs in the SDOCT dataset layout read by
+    ``load_sdoct_dataset``. The averaged image is the mean of ``n_averaged``
+    independent speckle realisations of the same anatomy.
+    """
+    for patient in range(1, n_patients + 1):
+        name = f"Subject_{patient}"
+        patient_dir = os.path.join(root, name)
+        os.makedirs(patient_dir, exist_ok=True)
+
+        # fully decorrelated repeats of a static scan
+        volume, _, _ = make_volume(n_averaged, height, width, looks, correlation=0.0, drift=0.0, seed=seed + patient)
+        write_tiff(os.path.join(patient_dir, f"{name}_Raw Image.tif"), volume[0])
+        averaged = volume.astype(np.float32).mean(axis=0)
+        write_tiff(os.path.join(patient_dir, f"{name}_Averaged Image.tif"), np.clip(averaged, 0, 255).astype(np.uint8))
+
+    print(f"Wrote {n_patients} SDOCT pairs to {root}")
+    return root
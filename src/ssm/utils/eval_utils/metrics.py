@@ -5,6 +5,8 @@ import cv2
 import torch
 import os
 import time
+import hashlib
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 from ssm.utils.data_utils.paired_preprocessing import paired_preprocessing
 
@@ -196,17 +198,14 @@ def calculate_epi(img1, img2):
     
     return numerator / denominator
 
-def auto_select_roi(img, n_regions=3, min_size=100):
+def select_roi_labels(img, n_regions=3, min_size=100):
     """
-    Automatically select regions of interest for CNR calculation
-    
-    Args:
-        img: Input image
-        n_regions: Number of regions to select
-        min_size: Minimum region size
-    
+    Same region selection as ``auto_select_roi`` but returned as one label
+    map instead of a list of masks.
+
     Returns:
-        List of masks for ROIs
+        tuple: (int32 map with 0 outside the ROIs and k for the k-th largest
+        region, number of regions)
     """
     if img.max() <= 1.0:
         img_8bit = (img * 255).astype(np.uint8)
@@ -220,20 +219,65 @@ def auto_select_roi(img, n_regions=3, min_size=100):
     # Find connected components
     num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
     
-    # Select regions based on size
-    region_sizes = stats[1:, cv2.CC_STAT_AREA]  # Skip background (label 0)
-    valid_regions = [i+1 for i, size in enumerate(region_sizes) if size >= min_size]
-    
-    # Sort regions by size and select the n_regions largest (excluding background)
-    valid_regions = sorted(valid_regions, key=lambda i: stats[i, cv2.CC_STAT_AREA], reverse=True)[:n_regions]
+    # Largest regions of at least min_size (excluding background label 0), ties keep label order
+    region_sizes = stats[1:, cv2.CC_STAT_AREA]
+    valid_regions = np.flatnonzero(region_sizes >= min_size)
+    order = np.argsort(-region_sizes[valid_regions], kind='stable')[:n_regions]
+    selected = valid_regions[order] + 1
+
+    # Lookup table from component label to ROI rank, applied to the label image in one pass
+    lut = np.zeros(num_labels, dtype=np.int32)
+    lut[selected] = np.arange(1, len(selected) + 1, dtype=np.int32)
+    return lut[labels], len(selected)
+
+def auto_select_roi(img, n_regions=3, min_size=100):
+    """
+    Automatically select regions of interest for CNR calculation
     
-    # Create masks for selected regions
-    masks = []
-    for region_idx in valid_regions:
-        mask = (labels == region_idx)
-        masks.append(mask)
+    Args:
+        img: Input image
+        n_regions: Number of regions to select
+        min_size: Minimum region size
     
-    return masks
+    Returns:
+        List of masks for ROIs
+    """
+    roi_labels, n_found = select_roi_labels(img, n_regions, min_size)
+    return [roi_labels == k for k in range(1, n_found + 1)]
+
+def roi_statistics(img, roi_labels, n_regions):
+    """
+    Pixel count, mean and population variance of every ROI of a label map
+    in a single pass over the image.
+
+    Returns:
+        tuple: Arrays of length ``n_regions + 1``, index k is ROI k (0 is
+        everything outside the ROIs).
+    """
+    img = np.asarray(img, dtype=np.float32).ravel()
+    roi_labels = roi_labels.ravel()
+    counts = np.bincount(roi_labels, minlength=n_regions + 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.bincount(roi_labels, weights=img, minlength=n_regions + 1) / counts
+        variances = np.bincount(roi_labels, weights=(img - means[roi_labels]) ** 2, minlength=n_regions + 1) / counts
+    return counts, means, variances
+
+def _roi_cnr(counts, means, variances):
+    # calculate_cnr with ROI 1 as foreground and ROI 2 as background
+    if counts[1] == 0 or counts[2] == 0:
+        return 0.0
+    denominator = np.sqrt(variances[1] + variances[2])
+    if denominator == 0:
+        return float('inf')
+    return 10 * np.log10(np.abs(means[1] - means[2]) / denominator)
+
+def _roi_enl(counts, means, variances):
+    # calculate_enl over ROI 1
+    if counts[1] == 0:
+        return 0.0
+    if variances[1] == 0:
+        return float('inf')
+    return (means[1] ** 2) / variances[1]
 
 def calculate_cnr_whole(image):
     """
@@ -282,7 +326,53 @@ def calculate_cnr_whole(image):
     
     return cnr_db
 
-def evaluate_oct_denoising(original, denoised, reference=None):
+_ORIGINAL_STATS_CACHE = OrderedDict()
+_ORIGINAL_STATS_CACHE_SIZE = 64
+
+def compute_original_stats(original):
+    """
+    Metrics of the noisy input that do not depend on the denoised image
+    (SNR and whole-image CNR).
+    """
+    return {
+        'snr': calculate_snr(original),
+        'cnr_whole': calculate_cnr_whole(original),
+    }
+
+def get_original_stats(original):
+    """
+    ``compute_original_stats`` with a small LRU cache keyed by the image
+    content, so comparing several methods on one input computes them once.
+    """
+    pixels = np.ascontiguousarray(original)
+    key = (pixels.shape, pixels.dtype.str, hashlib.blake2b(pixels.tobytes(), digest_size=16).digest())
+    if key in _ORIGINAL_STATS_CACHE:
+        _ORIGINAL_STATS_CACHE.move_to_end(key)
+        return _ORIGINAL_STATS_CACHE[key]
+
+    stats = compute_original_stats(original)
+    _ORIGINAL_STATS_CACHE[key] = stats
+    if len(_ORIGINAL_STATS_CACHE) > _ORIGINAL_STATS_CACHE_SIZE:
+        _ORIGINAL_STATS_CACHE.popitem(last=False)
+    return stats
+
+def evaluate_oct_denoising(original, denoised, reference=None, original_stats=None):
+    """
+    Quality metrics of a denoised OCT image.
+
+    Args:
+        original: Noisy input image.
+        denoised: Denoised image.
+        reference: Optional clean reference for PSNR and SSIM.
+        original_stats: Optional ``compute_original_stats(original)``, looked
+            up in a per-input cache when omitted.
+
+    Returns:
+        dict: psnr, ssim, snr, cnr, enl (only if an ROI was found) and epi,
+        with SNR/CNR/ENL as improvements over the input.
+    """
+    if original_stats is None:
+        original_stats = get_original_stats(original)
 
     metrics = {}
 
@@ -293,16 +383,21 @@ def evaluate_oct_denoising(original, denoised, reference=None):
         metrics['psnr'] = calculate_psnr(denoised, reference)
         metrics['ssim'] = calculate_ssim(denoised, reference)
     
-    metrics['snr'] = calculate_snr(denoised) - calculate_snr(original)
+    metrics['snr'] = calculate_snr(denoised) - original_stats['snr']
     
-    roi_masks = auto_select_roi(denoised)
-    if len(roi_masks) >= 2:
-        metrics['cnr'] = calculate_cnr(denoised, roi_masks[0], roi_masks[1]) - calculate_cnr(original, roi_masks[0], roi_masks[1])
+    # ROIs come from the denoised image, so the input's ROI statistics are per method
+    roi_labels, n_regions = select_roi_labels(denoised)
+    if n_regions > 0:
+        denoised_roi = roi_statistics(denoised, roi_labels, n_regions)
+        original_roi = roi_statistics(original, roi_labels, n_regions)
+
+    if n_regions >= 2:
+        metrics['cnr'] = _roi_cnr(*denoised_roi) - _roi_cnr(*original_roi)
     else:
-        metrics['cnr'] = calculate_cnr_whole(denoised) - calculate_cnr_whole(original)
+        metrics['cnr'] = calculate_cnr_whole(denoised) - original_stats['cnr_whole']
     
-    if len(roi_masks) > 0:
-        metrics['enl'] = calculate_enl(denoised, roi_masks[0]) - calculate_enl(original, roi_masks[0])
+    if n_regions > 0:
+        metrics['enl'] = _roi_enl(*denoised_roi) - _roi_enl(*original_roi)
     
     metrics['epi'] = calculate_epi(original, denoised)
     
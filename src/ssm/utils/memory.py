@@ -0,0 +1,206 @@
+"""
+Memory instrumentation for training runs.
+
+Process RSS and machine memory come from psutil when it is installed and
+from /proc (Linux) or ``resource`` otherwise; functions return None where
+neither is available. Torch allocator statistics are only reported on CUDA.
+``check_cohort_memory`` projects the host memory of the configured cohort
+from one patient directory and warns before preprocessing starts.
+"""
+import os
+import sys
+import glob
+
+import numpy as np
+import torch
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 ** 2
+
+IMAGE_EXTENSIONS = ("*.tiff", "*.tif", "*.png", "*.jpg")
+
+def rss_mb():
+    """Current resident set size of this process in MB."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / MB
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    """High-water mark of the resident set size of this process in MB."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == 'darwin' else peak / 1024
+
+def _meminfo():
+    info = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            name, value = line.split(':', 1)
+            info[name] = int(value.split()[0]) * 1024
+    return info
+
+def system_memory_mb():
+    """
+    Total and available memory of the machine in MB.
+
+    Returns:
+        tuple: (total, available), either may be None if unknown.
+    """
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        return memory.total / MB, memory.available / MB
+    try:
+        info = _meminfo()
+        return info['MemTotal'] / MB, info.get('MemAvailable', info['MemFree']) / MB
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / MB, None
+    except (ValueError, AttributeError, OSError):
+        return None, None
+
+def torch_memory_mb(device=None):
+    """
+    CUDA allocator statistics in MB: allocated, reserved and peak allocated
+    since the last ``torch.cuda.reset_peak_memory_stats``. Empty on CPU.
+    """
+    if not torch.cuda.is_available():
+        return {}
+    return {
+        'allocated_mb': torch.cuda.memory_allocated(device) / MB,
+        'reserved_mb': torch.cuda.memory_reserved(device) / MB,
+        'max_allocated_mb': torch.cuda.max_memory_allocated(device) / MB,
+    }
+
+def resident_nbytes(obj, _seen=None):
+    """
+    Bytes held by the numpy arrays and tensors reachable from ``obj``
+    through lists, tuples, dicts, ``Subset``/``.dataset`` wrappers and
+    object attributes. Views are counted once, by their base buffer.
+    """
+    seen = set() if _seen is None else _seen
+
+    if isinstance(obj, np.ndarray):
+        while isinstance(obj.base, np.ndarray):
+            obj = obj.base
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return obj.nbytes
+    if isinstance(obj, torch.Tensor):
+        storage = obj.untyped_storage()
+        if storage.data_ptr() in seen:
+            return 0
+        seen.add(storage.data_ptr())
+        return storage.nbytes()
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (list, tuple)):
+        return sum(resident_nbytes(item, seen) for item in obj)
+    if isinstance(obj, dict):
+        return sum(resident_nbytes(item, seen) for item in obj.values())
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        return sum(resident_nbytes(item, seen) for item in vars(obj).values()
+                   if isinstance(item, (np.ndarray, torch.Tensor, list, tuple, dict, torch.utils.data.Dataset)))
+    return 0
+
+def dataset_mb(*datasets):
+    """Resident size of one or more datasets in MB, shared buffers (e.g. train/val subsets) counted once."""
+    seen = set()
+    return sum(resident_nbytes(dataset, seen) for dataset in datasets) / MB
+
+def probe_patient_dir(base_path=None, diabetes_list=(0, 1, 2)):
+    """
+    B-scan count and image shape of the first patient in the
+    ``DATASET_DIR_PATH`` layout, without loading the volume.
+
+    Returns:
+        tuple: (n_bscans, (height, width)), or None if no patient is found.
+    """
+    base_path = base_path or os.environ.get("DATASET_DIR_PATH")
+    if not base_path:
+        return None
+
+    for diabetes in diabetes_list:
+        for patient_path in sorted(glob.glob(os.path.join(base_path, str(diabetes), '*'))):
+            files = []
+            for ext in IMAGE_EXTENSIONS:
+                files.extend(glob.glob(os.path.join(patient_path, ext)))
+            if files:
+                from skimage import io
+                image = io.imread(files[0])
+                return len(files), image.shape[:2]
+    return None
+
+def estimate_cohort_memory(n_patients, n_images_per_patient, n_bscans=None, raw_shape=None, image_size=256, shared=False):
+    """
+    Projected host memory of preprocessing and holding a paired cohort.
+
+    The preprocessed float32 images of every patient stay resident; on top
+    of that one patient's raw volume (all of its B-scans, as float32) is
+    held while it is preprocessed. ``shared`` adds the stacked input/target
+    copies of ``get_shared_paired_dataset``.
+
+    Returns:
+        dict: ``dataset_mb``, ``shared_mb``, ``raw_patient_mb`` and
+        ``projected_mb`` (their sum, on top of the current RSS).
+    """
+    image_bytes = image_size * image_size * 4
+    dataset = n_patients * n_images_per_patient * image_bytes
+    stacked = 2 * n_patients * max(n_images_per_patient - 1, 0) * image_bytes if shared else 0
+    raw = (n_bscans or n_images_per_patient) * int(np.prod(raw_shape or (image_size, image_size))) * 4
+    return {
+        'dataset_mb': dataset / MB,
+        'shared_mb': stacked / MB,
+        'raw_patient_mb': raw / MB,
+        'projected_mb': (dataset + stacked + raw) / MB,
+    }
+
+def check_cohort_memory(train_config, shared=False, margin=0.9, diabetes_list=(0, 1, 2)):
+    """
+    Prints the projected memory of the configured cohort and warns when it
+    would not fit in ``margin`` of the memory currently available. Call it
+    before preprocessing.
+
+    Returns:
+        dict: The estimate plus ``rss_mb``, ``available_mb`` and ``exceeds``.
+    """
+    n_patients = train_config['n_patients']
+    n_images_per_patient = train_config['n_images_per_patient']
+
+    probe = probe_patient_dir(diabetes_list=diabetes_list)
+    n_bscans, raw_shape = probe if probe is not None else (None, None)
+    estimate = estimate_cohort_memory(n_patients, n_images_per_patient, n_bscans, raw_shape, shared=shared)
+
+    _, available = system_memory_mb()
+    estimate['rss_mb'] = rss_mb()
+    estimate['available_mb'] = available
+    estimate['exceeds'] = available is not None and estimate['projected_mb'] > margin * available
+
+    print(f"Projected memory for {n_patients} patients x {n_images_per_patient} images: "
+          f"{estimate['projected_mb']:.0f} MB (dataset {estimate['dataset_mb']:.0f} MB, "
+          f"raw patient {estimate['raw_patient_mb']:.0f} MB"
+          + (f", shared copy {estimate['shared_mb']:.0f} MB" if shared else "") + ")"
+          + (f", {available:.0f} MB available" if available is not None else ""))
+    if estimate['exceeds']:
+        print(f"Warning: the cohort is projected to need {estimate['projected_mb']:.0f} MB but only "
+              f"{available:.0f} MB are available. Expect swapping or an out-of-memory error; "
+              f"reduce n_patients or n_images_per_patient.")
+    return estimate
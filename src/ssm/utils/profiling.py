@@ -0,0 +1,336 @@
+"""
+Stage-level profiling of the training and evaluation loops.
+
+Trainers wrap every stage of a step (data loading, masking, speckle module,
+forward, loss, backward, optimiser, plotting, checkpointing) in
+``profiler.stage(name)`` and fetch batches through ``profiler.iterate``.
+``StageProfiler`` sums the wall-clock time of each stage, prints a
+breakdown table at the end of every epoch and can run a ``torch.profiler``
+session over a window of steps, written as Chrome traces that TensorBoard
+also reads. Profiling is off unless ``profile: true`` is set in the training
+config; the trainers then get ``NULL_PROFILER``, whose ``stage`` returns one
+shared null context and whose ``iterate`` hands the loader back unchanged.
+
+With ``track_memory: true`` every stage also samples the process RSS and,
+on CUDA, the allocator peak, and each batch records its activation peak
+(allocator peak above what was allocated when the batch started). The
+memory columns go into the breakdown, the checkpoints and the
+time-to-quality log.
+"""
+import os
+import csv
+import time
+from contextlib import nullcontext
+
+import torch
+
+from ssm.utils.memory import rss_mb, peak_rss_mb, dataset_mb, MB
+
+_NULL_CONTEXT = nullcontext()
+
+class _NullProfiler:
+    """Stand-in used when profiling is disabled, every hook is a no-op."""
+    enabled = False
+    track_memory = False
+
+    def start(self):
+        pass
+
+    def stage(self, name):
+        return _NULL_CONTEXT
+
+    def iterate(self, loader):
+        return loader
+
+    def step(self):
+        pass
+
+    def epoch_end(self, epoch):
+        pass
+
+    def stop(self):
+        pass
+
+    def record_dataset(self, *datasets):
+        pass
+
+    def memory_summary(self):
+        return {}
+
+NULL_PROFILER = _NullProfiler()
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'record', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.record = None
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.sync_cuda:
+            torch.cuda.synchronize()
+        if profiler._torch_profiler is not None:
+            # named region in the exported trace
+            self.record = torch.profiler.record_function(self.name)
+            self.record.__enter__()
+        if profiler._cuda_memory:
+            torch.cuda.reset_peak_memory_stats()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        profiler = self.profiler
+        if profiler.sync_cuda:
+            torch.cuda.synchronize()
+        profiler._add(self.name, time.perf_counter() - self.start)
+        if profiler.track_memory:
+            profiler._sample_memory(self.name)
+        if self.record is not None:
+            self.record.__exit__(*exc)
+        return False
+
+class StageProfiler:
+    """
+    Per-stage wall-clock totals for each epoch, plus an optional
+    ``torch.profiler`` trace.
+
+    Stages should not nest, otherwise the nested time is counted twice.
+    Time spent outside any stage is reported as ``other``.
+
+    Args:
+        trace_dir (str): Directory for the ``torch.profiler`` traces
+            (``*.pt.trace.json``, open in chrome://tracing or Perfetto, or
+            point TensorBoard at the directory). No trace if None.
+        wait (int): Steps skipped before the trace window.
+        warmup (int): Steps profiled but discarded before recording.
+        active (int): Steps recorded per window.
+        repeat (int): Number of windows (0 repeats until training ends).
+        record_shapes (bool): Record input shapes of the traced operators.
+        profile_memory (bool): Record tensor allocations in the trace.
+        sync_cuda (bool): Synchronise CUDA around every stage so GPU time is
+            attributed to the stage that queued it. Slows training down.
+        path (str): CSV the per-epoch breakdown is rewritten to, if given.
+        track_memory (bool): Sample RSS and the CUDA allocator after every
+            stage and record per-batch activation peaks.
+    """
+    enabled = True
+
+    def __init__(self, trace_dir=None, wait=1, warmup=1, active=3, repeat=1, record_shapes=False,
+                 profile_memory=False, sync_cuda=False, path=None, track_memory=False):
+        self.trace_dir = trace_dir
+        self.wait = wait
+        self.warmup = warmup
+        self.active = active
+        self.repeat = repeat
+        self.record_shapes = record_shapes
+        self.profile_memory = profile_memory
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.path = path
+        self.track_memory = track_memory
+        self._cuda_memory = track_memory and torch.cuda.is_available()
+        self.dataset_mb = None
+        self.rows = []
+        self.steps = 0
+        self._torch_profiler = None
+        self._reset()
+
+    @classmethod
+    def from_config(cls, train_config, checkpoint_path=None):
+        """
+        ``StageProfiler`` for the ``profile*`` and ``track_memory`` keys of the
+        training config, or ``NULL_PROFILER`` when neither ``profile`` nor
+        ``track_memory`` is set. The breakdown is saved next to the
+        checkpoints when ``checkpoint_path`` is given.
+        """
+        if not (train_config.get('profile', False) or train_config.get('track_memory', False)):
+            return NULL_PROFILER
+        return cls(
+            trace_dir=train_config.get('profile_trace_dir'),
+            wait=train_config.get('profile_wait', 1),
+            warmup=train_config.get('profile_warmup', 1),
+            active=train_config.get('profile_active', 3),
+            repeat=train_config.get('profile_repeat', 1),
+            record_shapes=train_config.get('profile_record_shapes', False),
+            profile_memory=train_config.get('profile_memory', False),
+            sync_cuda=train_config.get('profile_sync_cuda', False),
+            path=checkpoint_path + '_stage_breakdown.csv' if checkpoint_path else None,
+            track_memory=train_config.get('track_memory', False),
+        )
+
+    def _reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.stage_rss_mb = {}
+        self.stage_allocated_mb = {}
+        self.peak_reserved_mb = None
+        self.activation_peaks_mb = []
+        self._batch_start_mb = torch.cuda.memory_allocated() / MB if self._cuda_memory else 0.0
+        self._batch_peak_mb = self._batch_start_mb
+        self.epoch_start = time.perf_counter()
+
+    def _add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _sample_memory(self, name):
+        rss = rss_mb()
+        if rss is not None:
+            self.stage_rss_mb[name] = max(self.stage_rss_mb.get(name, 0.0), rss)
+        if self._cuda_memory:
+            peak = torch.cuda.max_memory_allocated() / MB
+            self.stage_allocated_mb[name] = max(self.stage_allocated_mb.get(name, 0.0), peak)
+            self.peak_reserved_mb = max(self.peak_reserved_mb or 0.0, torch.cuda.memory_reserved() / MB)
+            self._batch_peak_mb = max(self._batch_peak_mb, peak)
+
+    def record_dataset(self, *datasets):
+        """Records and prints the resident size of the training data (``memory.dataset_mb``)."""
+        if self.track_memory:
+            self.dataset_mb = dataset_mb(*datasets)
+            print(f"Dataset resident size: {self.dataset_mb:.1f} MB")
+
+    def memory_summary(self):
+        """
+        Memory of the current epoch so far: current and peak RSS, CUDA peak
+        allocated/reserved, largest per-batch activation peak and the
+        dataset size. Empty unless ``track_memory`` is set.
+        """
+        if not self.track_memory:
+            return {}
+        summary = {
+            'rss_mb': rss_mb(),
+            'peak_rss_mb': max(self.stage_rss_mb.values(), default=None),
+            'process_peak_rss_mb': peak_rss_mb(),
+            'dataset_mb': self.dataset_mb,
+        }
+        if self._cuda_memory:
+            summary['peak_allocated_mb'] = max(self.stage_allocated_mb.values(), default=None)
+            summary['peak_reserved_mb'] = self.peak_reserved_mb
+            summary['activation_peak_mb'] = max(self.activation_peaks_mb, default=None)
+        return {k: round(v, 1) for k, v in summary.items() if v is not None}
+
+    def start(self):
+        """Starts timing the first epoch and, with a ``trace_dir``, the torch profiler."""
+        self._reset()
+        if self.trace_dir is not None and self._torch_profiler is None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_profiler = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=self.wait, warmup=self.warmup, active=self.active, repeat=self.repeat),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.trace_dir),
+                record_shapes=self.record_shapes,
+                profile_memory=self.profile_memory,
+            )
+            self._torch_profiler.start()
+            print(f"Profiling steps {self.wait + self.warmup} to {self.wait + self.warmup + self.active - 1} into {self.trace_dir}")
+
+    def stage(self, name):
+        """Context manager timing one stage."""
+        return _Stage(self, name)
+
+    def iterate(self, loader):
+        """
+        Yields the batches of ``loader``, timing each fetch as the ``data``
+        stage and advancing the profiler step after each batch.
+        """
+        iterator = iter(loader)
+        while True:
+            with self.stage('data'):
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return
+            yield batch
+            self.step()
+
+    def step(self):
+        """Marks the end of one step (batch), training and validation alike."""
+        self.steps += 1
+        if self._torch_profiler is not None:
+            self._torch_profiler.step()
+        if self._cuda_memory:
+            self.activation_peaks_mb.append(self._batch_peak_mb - self._batch_start_mb)
+            self._batch_start_mb = torch.cuda.memory_allocated() / MB
+            self._batch_peak_mb = self._batch_start_mb
+
+    def epoch_end(self, epoch):
+        """
+        Prints and records the stage breakdown of the epoch, then starts the
+        next one. ``epoch`` may also be a label such as ``'cohort'``.
+
+        Returns:
+            dict: The epoch's row of the breakdown csv.
+        """
+        wall = time.perf_counter() - self.epoch_start
+        staged = sum(self.seconds.values())
+
+        row = {'epoch': epoch, 'wall_s': round(wall, 4)}
+        for name, seconds in self.seconds.items():
+            row[f'{name}_s'] = round(seconds, 4)
+            row[f'{name}_calls'] = self.calls[name]
+            if name in self.stage_rss_mb:
+                row[f'{name}_rss_mb'] = round(self.stage_rss_mb[name], 1)
+            if name in self.stage_allocated_mb:
+                row[f'{name}_allocated_mb'] = round(self.stage_allocated_mb[name], 1)
+        row['other_s'] = round(max(wall - staged, 0.0), 4)
+        row.update(self.memory_summary())
+        self.rows.append(row)
+
+        label = f"epoch {epoch}" if isinstance(epoch, int) else epoch
+        print(format_breakdown(self.seconds, self.calls, wall, title=f"Stage breakdown, {label} ({wall:.1f}s)",
+                               rss_mb=self.stage_rss_mb if self.track_memory else None,
+                               allocated_mb=self.stage_allocated_mb if self._cuda_memory else None))
+        if self.track_memory:
+            print("Memory: " + ", ".join(f"{k} {v}" for k, v in self.memory_summary().items()))
+        if self.path is not None:
+            self.save(self.path)
+        self._reset()
+        return row
+
+    def stop(self):
+        """Stops the torch profiler, flushing an unfinished trace window."""
+        if self._torch_profiler is not None:
+            self._torch_profiler.stop()
+            self._torch_profiler = None
+            print(f"Profiler traces written to {self.trace_dir}")
+
+    def save(self, path):
+        fieldnames = []
+        for row in self.rows:
+            fieldnames.extend(k for k in row if k not in fieldnames)
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+def format_breakdown(seconds, calls, wall, title="Stage breakdown", rss_mb=None, allocated_mb=None):
+    """
+    Table of seconds, share of ``wall`` and time per call for each stage,
+    slowest first, with the peak RSS / CUDA allocation per stage if given.
+    """
+    header = f"  {'stage':<16}{'seconds':>10}{'share':>8}{'calls':>8}{'ms/call':>10}"
+    if rss_mb is not None:
+        header += f"{'rss MB':>10}"
+    if allocated_mb is not None:
+        header += f"{'cuda MB':>10}"
+    lines = [title, header]
+    other = wall - sum(seconds.values())
+    for name, total in sorted(seconds.items(), key=lambda item: -item[1]):
+        share = total / wall if wall > 0 else 0.0
+        line = f"  {name:<16}{total:>10.3f}{share:>8.1%}{calls[name]:>8}{1000 * total / calls[name]:>10.2f}"
+        if rss_mb is not None:
+            line += f"{rss_mb.get(name, float('nan')):>10.0f}"
+        if allocated_mb is not None:
+            line += f"{allocated_mb.get(name, float('nan')):>10.0f}"
+        lines.append(line)
+    if wall > 0:
+        lines.append(f"  {'other':<16}{max(other, 0.0):>10.3f}{max(other, 0.0) / wall:>8.1%}")
+    return "\n".join(lines)